@@ -3,12 +3,13 @@ import random
 import sys
 from typing import Sequence, Mapping, Any, Union
 import torch
-import runpod
 import base64
 from typing import Sequence, Mapping, Any, Union
 from io import BytesIO
 import glob
-from runpod.serverless.utils.rp_cleanup import clean
+import threading
+import time
+import asyncio
 
 #로컬 전용
 import tempfile
@@ -129,6 +130,92 @@ def setup_environment():
     import_custom_nodes()
 
 
+# Node classes used by process_latentsync; their instances are created once and reused by every request
+WARM_NODES = ["LoadAudio", "VHS_LoadVideo", "D_VideoLengthAdjuster", "D_LatentSyncNode", "VHS_VideoCombine"]
+
+# Jobs one worker processes at the same time; their GPU phases are admitted by free device memory
+MAX_CONCURRENT_JOBS = int(os.environ.get("LATENTSYNC_MAX_JOBS", 2))
+
+_worker_lock = threading.Lock()
+_worker_ready = False
+_scheduler = None
+_node_instances = {}
+_worker_metrics = {
+    "cold_start_seconds": None,
+    "requests": 0,
+    "cold_requests": 0,
+    "last_latency_seconds": None,
+    "warm_latency_seconds_total": 0.0,
+}
+
+
+def bootstrap_worker(warm_models: bool = True) -> bool:
+    """Set up ComfyUI, instantiate the nodes and load the models once per process.
+
+    Returns True if this call did the bootstrap (a cold start), False if the worker was already warm.
+    """
+    global _worker_ready
+    with _worker_lock:
+        if _worker_ready:
+            return False
+        start = time.perf_counter()
+        setup_environment()
+        for name in WARM_NODES:
+            get_node(name)
+        if warm_models:
+            with torch.inference_mode():
+                get_node("D_LatentSyncNode").warmup()
+        _worker_metrics["cold_start_seconds"] = time.perf_counter() - start
+        print(f"Worker bootstrap finished in {_worker_metrics['cold_start_seconds']:.2f}s")
+        _worker_ready = True
+        return True
+
+
+def get_scheduler():
+    """Return the process-wide job scheduler (after `bootstrap_worker`, which makes latentsync importable)."""
+    global _scheduler
+    with _worker_lock:
+        if _scheduler is None:
+            from latentsync.utils.job_scheduler import JobScheduler, get_gpu_admission
+
+            _scheduler = JobScheduler(process_latentsync, MAX_CONCURRENT_JOBS, get_gpu_admission())
+        return _scheduler
+
+
+def get_node(name: str):
+    """Return the process-wide instance of node class `name`."""
+    if name not in _node_instances:
+        from nodes import NODE_CLASS_MAPPINGS
+
+        _node_instances[name] = NODE_CLASS_MAPPINGS[name]()
+    return _node_instances[name]
+
+
+def record_request(latency_seconds: float, cold: bool) -> dict:
+    """Update the worker metrics with one request and return them."""
+    with _worker_lock:
+        _worker_metrics["requests"] += 1
+        _worker_metrics["last_latency_seconds"] = latency_seconds
+        if cold:
+            _worker_metrics["cold_requests"] += 1
+        else:
+            _worker_metrics["warm_latency_seconds_total"] += latency_seconds
+        return get_worker_metrics(cold=cold)
+
+
+def get_worker_metrics(cold: bool = False) -> dict:
+    warm_requests = _worker_metrics["requests"] - _worker_metrics["cold_requests"]
+    return {
+        "cold_start": cold,
+        "cold_start_seconds": _worker_metrics["cold_start_seconds"],
+        "latency_seconds": _worker_metrics["last_latency_seconds"],
+        "requests": _worker_metrics["requests"],
+        "mean_warm_latency_seconds": (
+            _worker_metrics["warm_latency_seconds_total"] / warm_requests if warm_requests else None
+        ),
+    }
+
+
 # def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str):
 #     from nodes import NODE_CLASS_MAPPINGS
 
@@ -273,21 +360,25 @@ def setup_environment():
 #                     os.remove(output_path)
 
 def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, custom_width_: int, custom_height_: int):
-    from nodes import NODE_CLASS_MAPPINGS
     import os
-    import tempfile
+    import shutil
     import logging
+    import folder_paths
+    from latentsync.utils.scratch import JobScratch
 
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
     video_name_without_ext = os.path.splitext(video_name)[0]
     
-    with tempfile.TemporaryDirectory() as temp_dir:
+    # Inputs go to a private scratch directory (tmpfs with LATENTSYNC_SCRATCH_TMPFS=1) and the combined
+    # video to a subfolder of the ComfyUI temp dir named after it, so concurrent jobs never share paths
+    with JobScratch(prefix="latentsync-job-") as scratch:
+        job_output_dir = os.path.join(folder_paths.get_temp_directory(), os.path.basename(scratch.path))
         try:
             # 입력 파일 설정
-            video_path = os.path.join(temp_dir, "input_video.mp4")
-            audio_path = os.path.join(temp_dir, "input_audio.wav")
+            video_path = scratch.file("input_video.mp4")
+            audio_path = scratch.file("input_audio.wav")
             output_filename = f"convert_{video_name_without_ext}"
             
             # 입력 파일 저장
@@ -301,11 +392,11 @@ def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, cu
             try:
                 with torch.inference_mode():
                     # LoadAudio
-                    loadaudio = NODE_CLASS_MAPPINGS["LoadAudio"]()
+                    loadaudio = get_node("LoadAudio")
                     loadaudio_37 = loadaudio.load(audio=audio_path)
 
                     # LoadVideo
-                    vhs_loadvideo = NODE_CLASS_MAPPINGS["VHS_LoadVideo"]()
+                    vhs_loadvideo = get_node("VHS_LoadVideo")
                     vhs_loadvideo_40 = vhs_loadvideo.load_video(
                         video=video_path,
                         force_rate=25,
@@ -315,12 +406,14 @@ def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, cu
                         skip_first_frames=0,
                         select_every_nth=1,
                         format="AnimateDiff",
+                        # uint8 frames all the way to VideoCombine instead of float32
+                        compact_frames=True,
                         unique_id=12015943199208297010,
                     )
 
-                    d_videolengthadjuster = NODE_CLASS_MAPPINGS["D_VideoLengthAdjuster"]()
-                    d_latentsyncnode = NODE_CLASS_MAPPINGS["D_LatentSyncNode"]()
-                    vhs_videocombine = NODE_CLASS_MAPPINGS["VHS_VideoCombine"]()
+                    d_videolengthadjuster = get_node("D_VideoLengthAdjuster")
+                    d_latentsyncnode = get_node("D_LatentSyncNode")
+                    vhs_videocombine = get_node("VHS_VideoCombine")
                     
                     d_videolengthadjuster_53 = d_videolengthadjuster.adjust(
                         mode="pingpong",
@@ -341,7 +434,7 @@ def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, cu
                     result = vhs_videocombine.combine_video(
                         frame_rate=25,
                         loop_count=0,
-                        filename_prefix=output_filename,
+                        filename_prefix=os.path.join(os.path.basename(scratch.path), output_filename),
                         format="video/h264-mp4",
                         pix_fmt="yuv420p",
                         crf=19,
@@ -388,6 +481,8 @@ def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, cu
         except Exception as e:
             logger.error(f"Error in file handling: {str(e)}")
             return {"error": str(e)}
+        finally:
+            shutil.rmtree(job_output_dir, ignore_errors=True)
         
 
         # finally:
@@ -405,10 +500,9 @@ def process_latentsync(video_data: bytes, audio_data: bytes, video_name: str, cu
 
 def handler(event):
     """Runpod serverless handler"""
-    import os
-    import glob
-
     print('handler 시작?')
+    start = time.perf_counter()
+    cold = False
     try:
         # 입력 데이터 검증
         if 'input' not in event or 'video' not in event['input'] or 'audio' not in event['input']:
@@ -420,16 +514,16 @@ def handler(event):
         video_name = event['input']['video_name']
         custom_width_ = event['input']['custom_width_']
         custom_height_ = event['input']['custom_height_']       
-        # 환경 설정
-        setup_environment()
-        
-        # 처리
-        result = process_latentsync(video_data, audio_data, video_name, custom_width_, custom_height_)
-        
+        # 환경 설정 (워커당 한 번만 수행)
+        cold = bootstrap_worker()
 
-        
+        # 처리 (at most MAX_CONCURRENT_JOBS jobs at a time, the others wait in the scheduler queue)
+        scheduler = get_scheduler()
+        result = scheduler.run(video_data, audio_data, video_name, custom_width_, custom_height_)
+        result["metrics"] = record_request(time.perf_counter() - start, cold)
+        result["metrics"]["scheduler"] = scheduler.stats()
+        print(f"Request metrics: {result['metrics']}")
 
-        
         print("Cleanup completed")
         return result
         
@@ -437,32 +531,37 @@ def handler(event):
         print(f"Error in handler: {str(e)}")
         return {"error": str(e)}
     finally:
-        # 추가적인 cleanup이 필요한 경우 여기서 처리
-                # Cleanup 처리
-        print("Cleaning up temporary files...")
-        temp_dir = os.path.join(os.getcwd(), "temp")
-        output_dir = os.path.join(os.getcwd(), "output")
-        
-        # 임시 파일들 정리
-        cleanup_patterns = [
-            os.path.join(temp_dir, "*.mp4"),
-            os.path.join(temp_dir, "*.wav"),
-            os.path.join(output_dir, "*.mp4"),
-            os.path.join(output_dir, "*.wav"),
-            os.path.join(os.getcwd(), "*.wav"),  # 루트 디렉토리의 wav 파일
-        ]
-        for pattern in cleanup_patterns:
-            try:
-                files = glob.glob(pattern)
-                for file in files:
-                    try:
-                        os.remove(file)
-                        print(f"Removed: {file}")
-                    except Exception as e:
-                        print(f"Error removing {file}: {str(e)}")
-            except Exception as e:
-                print(f"Error processing pattern {pattern}: {str(e)}")
+        # Every job cleans up its own scratch and output directories in process_latentsync; shared
+        # temp/output folders are not wiped here because other jobs may be using them
         print("Handler completed")
 
+
+async def async_handler(event):
+    """Runpod serverless handler that lets the worker take several jobs at once.
+
+    The blocking `handler` runs on a thread so the event loop can keep accepting jobs.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, handler, event)
+
+
+def concurrency_modifier(current_concurrency: int) -> int:
+    return MAX_CONCURRENT_JOBS
+
+
+def start_worker(serverless=None) -> None:
+    """Bootstrap the worker and hand the handler to the runpod SDK.
+
+    `serverless` defaults to `runpod.serverless`; anything with the same `start` (e.g. a local stub) can
+    be passed instead, which is why the SDK is only imported here.
+    """
+    if serverless is None:
+        import runpod
+
+        serverless = runpod.serverless
+    # Pay the ComfyUI bootstrap and model loading once at worker start, not in the first request
+    bootstrap_worker()
+    serverless.start({"handler": async_handler, "concurrency_modifier": concurrency_modifier})
+
+
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler})
\ No newline at end of file
+    start_worker()
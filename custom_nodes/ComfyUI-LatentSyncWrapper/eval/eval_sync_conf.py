@@ -22,7 +22,8 @@ from latentsync.utils.util import red_text
 import torch
 
 
-def syncnet_eval(syncnet, syncnet_detector, video_path, temp_dir, detect_results_dir="detect_results"):
+def syncnet_eval(syncnet, syncnet_detector, video_path, temp_dir=None, detect_results_dir=None):
+    detect_results_dir = detect_results_dir or syncnet_detector.detect_results_dir
     syncnet_detector(video_path=video_path, min_track=50)
     crop_videos = os.listdir(os.path.join(detect_results_dir, "crop"))
     if crop_videos == []:
@@ -46,7 +47,7 @@ def main():
     parser.add_argument("--initial_model", type=str, default="checkpoints/auxiliary/syncnet_v2.model", help="")
     parser.add_argument("--video_path", type=str, default=None, help="")
     parser.add_argument("--videos_dir", type=str, default="/root/processed")
-    parser.add_argument("--temp_dir", type=str, default="temp", help="")
+    parser.add_argument("--temp_dir", type=str, default=None, help="defaults to a private scratch directory")
 
     args = parser.parse_args()
 
@@ -55,7 +56,7 @@ def main():
     syncnet = SyncNetEval(device=device)
     syncnet.loadParameters(args.initial_model)
 
-    syncnet_detector = SyncNetDetector(device=device, detect_results_dir="detect_results")
+    syncnet_detector = SyncNetDetector(device=device)
 
     if args.video_path is not None:
         syncnet_eval(syncnet, syncnet_detector, args.video_path, args.temp_dir)
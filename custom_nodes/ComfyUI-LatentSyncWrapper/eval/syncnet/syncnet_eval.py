@@ -11,6 +11,8 @@ from scipy.io import wavfile
 from .syncnet import S
 from shutil import rmtree
 
+from latentsync.utils.scratch import JobScratch
+
 
 # ==================== Get OFFSET ====================
 
@@ -43,7 +45,14 @@ class SyncNetEval(torch.nn.Module):
         self.__S__ = S(num_layers_in_fc_layers=num_layers_in_fc_layers).to(device)
         self.device = device
 
-    def evaluate(self, video_path, temp_dir="temp", batch_size=20, vshift=15):
+    def evaluate(self, video_path, temp_dir=None, batch_size=20, vshift=15):
+        """Without `temp_dir` the frames and audio are extracted into a private scratch directory."""
+        if temp_dir is not None:
+            return self._evaluate(video_path, temp_dir, batch_size, vshift)
+        with JobScratch(prefix="syncnet-eval-") as scratch:
+            return self._evaluate(video_path, scratch.file("frames"), batch_size, vshift)
+
+    def _evaluate(self, video_path, temp_dir, batch_size, vshift):
 
         self.__S__.eval()
 
@@ -15,12 +15,16 @@ from scipy.io import wavfile
 from scipy import signal
 
 from eval.detectors import S3FD
+from latentsync.utils.scratch import JobScratch
 
 
 class SyncNetDetector:
-    def __init__(self, device, detect_results_dir="detect_results"):
+    def __init__(self, device, detect_results_dir=None):
         self.s3f_detector = S3FD(device=device)
-        self.detect_results_dir = detect_results_dir
+        # Without an explicit directory every detector gets a private one, so concurrent jobs never
+        # wipe each other's results; it is removed with the detector
+        self.scratch = JobScratch(prefix="syncnet-detect-") if detect_results_dir is None else None
+        self.detect_results_dir = self.scratch.path if detect_results_dir is None else detect_results_dir
 
     def __call__(self, video_path: str, min_track=50, scale=False):
         crop_dir = os.path.join(self.detect_results_dir, "crop")
@@ -1,11 +1,10 @@
 # Adapted from https://github.com/guoyww/AnimateDiff/blob/main/animatediff/pipelines/pipeline_animation.py
 
+import copy
 import inspect
 import os
-import shutil
-from typing import Callable, List, Optional, Union
+from typing import Callable, List, Optional, Sequence, Union
 from dataclasses import dataclass
-import subprocess
 
 import numpy as np
 import torch
@@ -30,14 +29,27 @@ from diffusers.utils import deprecate, logging
 
 from einops import rearrange
 
+try:
+    from diffusers.models.autoencoders.vae import DiagonalGaussianDistribution
+except ImportError:
+    from diffusers.models.vae import DiagonalGaussianDistribution
+
 from ..models.unet import UNet3DConditionModel
 from ..utils.image_processor import ImageProcessor
-from ..utils.util import read_video, read_audio, write_video
+from ..utils.cache import DiskLRUCache, hash_array, hash_strings
+from ..utils.job_scheduler import GpuAdmission, free_device_memory
+from ..utils.stages import Prefetcher, StageStats, StageWorker, timed_call, timed_iter
+from ..utils.util import read_video, read_audio, write_video, iter_video_frames, StreamingVideoWriter
+import time
 import tqdm
-import soundfile as sf
+from contextlib import ExitStack, nullcontext
+import itertools
 
 logger = logging.get_logger(__name__)  # pylint: disable=invalid-name
 
+# Opt-in artifacts of LipsyncPipeline.__call__ that nothing in the default path consumes
+DEBUG_OUTPUTS = ("masked_video", "affine_faces")
+
 
 class LipsyncPipeline(DiffusionPipeline):
     _optional_components = []
@@ -218,19 +230,32 @@ class LipsyncPipeline(DiffusionPipeline):
         return latents
 
     def prepare_mask_latents(
-        self, mask, masked_image, height, width, dtype, device, generator, do_classifier_free_guidance
+        self,
+        mask,
+        masked_image,
+        height,
+        width,
+        dtype,
+        device,
+        generator,
+        do_classifier_free_guidance,
+        mask_latents=None,
+        masked_image_moments=None,
     ):
         if self.latent_space:
             # resize the mask to latents shape as we concatenate the mask to the latents
             # we do that before converting to dtype to avoid breaking in case we're using cpu_offload
             # and half precision
-            mask = torch.nn.functional.interpolate(
-                mask, size=(height // self.vae_scale_factor, width // self.vae_scale_factor)
-            )
-            masked_image = masked_image.to(device=device, dtype=dtype)
+            if mask_latents is None:
+                mask_latents = torch.nn.functional.interpolate(
+                    mask, size=(height // self.vae_scale_factor, width // self.vae_scale_factor)
+                )
+            mask = mask_latents
 
             # encode the mask image into latents space so we can concatenate it to the latents
-            masked_image_latents = self.vae.encode(masked_image).latent_dist.sample(generator=generator)
+            if masked_image_moments is None:
+                masked_image_moments = self.encode_moments(masked_image, device, dtype)
+            masked_image_latents = DiagonalGaussianDistribution(masked_image_moments).sample(generator=generator)
             masked_image_latents = (
                 masked_image_latents - self.vae.config.shift_factor
             ) * self.vae.config.scaling_factor
@@ -251,10 +276,12 @@ class LipsyncPipeline(DiffusionPipeline):
         )
         return mask, masked_image_latents
 
-    def prepare_image_latents(self, images, device, dtype, generator, do_classifier_free_guidance):
+    def prepare_image_latents(self, images, device, dtype, generator, do_classifier_free_guidance, image_moments=None):
         images = images.to(device=device, dtype=dtype)
         if self.latent_space:
-            image_latents = self.vae.encode(images).latent_dist.sample(generator=generator)
+            if image_moments is None:
+                image_moments = self.encode_moments(images, device, dtype)
+            image_latents = DiagonalGaussianDistribution(image_moments).sample(generator=generator)
             image_latents = (image_latents - self.vae.config.shift_factor) * self.vae.config.scaling_factor
         else:
             image_latents = images
@@ -263,6 +290,263 @@ class LipsyncPipeline(DiffusionPipeline):
 
         return image_latents
 
+    def encode_moments(self, images, device, dtype):
+        """VAE posterior parameters (mean and logvar) of `images`."""
+        images = images.to(device=device, dtype=dtype)
+        return self.vae.encode(images).latent_dist.parameters
+
+    def encode_face_moments(self, faces, device, dtype, batch_size=16):
+        """VAE moments of the (pixel values, masked pixel values) of aligned uint8 faces, on the CPU."""
+        image_moments, masked_image_moments = [], []
+        for start in range(0, faces.shape[0], batch_size):
+            pixel_values, masked_pixel_values, _ = self.image_processor.prepare_masks_and_masked_images(
+                faces[start : start + batch_size], affine_transform=False
+            )
+            image_moments.append(self.encode_moments(pixel_values, device, dtype).cpu())
+            masked_image_moments.append(self.encode_moments(masked_pixel_values, device, dtype).cpu())
+        return torch.cat(image_moments), torch.cat(masked_image_moments)
+
+    def prepare_face_latents(
+        self, faces, device, dtype, latent_cache: Optional[DiskLRUCache] = None, batch_size=16, frame_hashes=None
+    ):
+        """VAE moments of every aligned face of the clip, sliced per window.
+
+        Moments are cached per aligned face, keyed by the hash of the face and of the source frame it was
+        cropped from (`frame_hashes`, one per face), so identical faces are encoded once and a clip whose
+        frames were seen before (e.g. the same source extended to another audio length) reuses them.
+        The VAE posterior moments are cached rather than sampled latents, so every window still
+        draws its own sample with `generator` exactly as when encoding the frames in the loop.
+        """
+        if not self.latent_space:
+            return {}
+
+        if frame_hashes is None:
+            frame_hashes = [""] * len(faces)
+        model_key = [getattr(self.vae.config, "_name_or_path", ""), dtype, self.image_processor.mask]
+        keys = [
+            hash_strings([frame_hash, hash_array(face.numpy()), *model_key])
+            for frame_hash, face in zip(frame_hashes, faces)
+        ]
+        first_index = {}
+        for index, key in enumerate(keys):
+            first_index.setdefault(key, index)
+
+        moments = {}
+        if latent_cache is not None:
+            for key in first_index:
+                cached = latent_cache.get(key)
+                if cached is not None:
+                    moments[key] = cached
+        missing = [key for key in first_index if key not in moments]
+        if missing:
+            image_moments, masked_image_moments = self.encode_face_moments(
+                faces[[first_index[key] for key in missing]], device, dtype, batch_size
+            )
+            encoded = {
+                key: {"image_moments": image_moments[i], "masked_image_moments": masked_image_moments[i]}
+                for i, key in enumerate(missing)
+            }
+            moments.update(encoded)
+            if latent_cache is not None:
+                latent_cache.put_many(encoded.items())
+        print(f"VAE encoding {len(missing)} new faces of {len(faces)} frames")
+        return {
+            name: torch.stack([moments[key][name] for key in keys]).to(device=device, dtype=dtype)
+            for name in ("image_moments", "masked_image_moments")
+        }
+
+    def iter_cached_windows(self, faces, video_frames, boxes, affine_matrices, clip_index, face_latents, num_frames):
+        """Windows of the whole-clip path; clip frame i is `video_frames[clip_index[i]]`."""
+        for start in range(0, len(clip_index) - num_frames + 1, num_frames):
+            end = start + num_frames
+            window = {
+                "faces": faces[start:end],
+                "frames": video_frames[clip_index[start:end].numpy()],
+                "boxes": boxes[start:end],
+                "affine_matrices": affine_matrices[start:end],
+            }
+            if self.latent_space:
+                window["image_moments"] = face_latents["image_moments"][start:end]
+                window["masked_image_moments"] = face_latents["masked_image_moments"][start:end]
+            yield window
+
+    def iter_streamed_windows(self, frame_chunks, num_frames, device, dtype):
+        """Windows decoded, aligned and encoded on the fly from an iterable of uint8 frame chunks [f, h, w, c].
+
+        Like `affine_transform_video`, repeated frames are recognized by content hash and only run
+        through face detection once; their landmarks are kept for every unique frame, while the
+        smoothing and alignment continue from window to window, so the windows match the whole-clip path.
+        """
+        landmarks = {}  # frame hash -> detected landmarks
+
+        pending = np.empty((0,), dtype=np.uint8)
+        frame_chunks = iter(frame_chunks)
+        while True:
+            while len(pending) < num_frames:
+                chunk = next(frame_chunks, None)
+                if chunk is None:
+                    return
+                pending = chunk if len(pending) == 0 else np.concatenate([pending, chunk])
+            window_frames, pending = pending[:num_frames], pending[num_frames:]
+
+            hashes = [hash_array(frame) for frame in window_frames]
+            new_positions = {}
+            for position, frame_hash in enumerate(hashes):
+                if frame_hash not in landmarks:
+                    new_positions.setdefault(frame_hash, position)
+            if new_positions:
+                detected = self.image_processor.detect_landmarks_batch(
+                    rearrange(torch.from_numpy(window_frames[list(new_positions.values())]), "b h w c -> b c h w")
+                )
+                landmarks.update(zip(new_positions, detected))
+
+            faces, boxes, affine_matrices = self.image_processor.align_faces_batch(
+                window_frames, [landmarks[frame_hash] for frame_hash in hashes]
+            )
+            window = {"faces": faces, "frames": window_frames, "boxes": boxes, "affine_matrices": affine_matrices}
+            if self.latent_space:
+                image_moments, masked_image_moments = self.encode_face_moments(faces, device, dtype)
+                window["image_moments"] = image_moments.to(device=device, dtype=dtype)
+                window["masked_image_moments"] = masked_image_moments.to(device=device, dtype=dtype)
+            yield window
+
+    def prepare_window(
+        self,
+        index,
+        window,
+        window_latents,
+        whisper_chunks,
+        num_frames,
+        height,
+        width,
+        dtype,
+        device,
+        generator,
+    ):
+        """Collect the unet inputs of window `index` (without classifier free guidance duplication)."""
+        if whisper_chunks is not None:
+            mel_overlap = whisper_chunks[index * num_frames : (index + 1) * num_frames].to(device, dtype=dtype)
+        else:
+            mel_overlap = None
+        pixel_values, masked_pixel_values, masks = self.image_processor.prepare_masks_and_masked_images(
+            window["faces"], affine_transform=False
+        )
+        if self.latent_space:
+            # The fixed mask is the same for every face
+            mask_latents = torch.nn.functional.interpolate(
+                masks[:1], size=(height // self.vae_scale_factor, width // self.vae_scale_factor)
+            ).expand(masks.shape[0], -1, -1, -1)
+        else:
+            mask_latents = None
+
+        # 7. Prepare mask latent variables
+        mask_latents, masked_image_latents = self.prepare_mask_latents(
+            masks,
+            masked_pixel_values,
+            height,
+            width,
+            dtype,
+            device,
+            generator,
+            False,
+            mask_latents=mask_latents,
+            masked_image_moments=window.get("masked_image_moments"),
+        )
+
+        # 8. Prepare image latents
+        image_latents = self.prepare_image_latents(
+            pixel_values,
+            device,
+            dtype,
+            generator,
+            False,
+            image_moments=window.get("image_moments"),
+        )
+        return {
+            "latents": window_latents,
+            "mel_overlap": mel_overlap,
+            "mask_latents": mask_latents,
+            "masked_image_latents": masked_image_latents,
+            "image_latents": image_latents,
+            "pixel_values": pixel_values,
+            "masked_pixel_values": masked_pixel_values,
+            "masks": masks,
+            "window": window,
+        }
+
+    def denoise_windows(
+        self,
+        windows,
+        timesteps,
+        num_inference_steps,
+        do_classifier_free_guidance,
+        guidance_scale,
+        extra_step_kwargs,
+        callback=None,
+        callback_steps=1,
+    ):
+        """Run the scheduler loop once for all prepared windows, stacked along the batch dimension."""
+        latents = torch.cat([window["latents"] for window in windows])
+        mask_latents = torch.cat([window["mask_latents"] for window in windows])
+        masked_image_latents = torch.cat([window["masked_image_latents"] for window in windows])
+        image_latents = torch.cat([window["image_latents"] for window in windows])
+        if windows[0]["mel_overlap"] is not None:
+            # The unet folds frames into the batch as (b f), so window audio is concatenated frame-major per window
+            mel_overlap = torch.cat([window["mel_overlap"] for window in windows])
+        else:
+            mel_overlap = None
+
+        if do_classifier_free_guidance:
+            mask_latents = torch.cat([mask_latents] * 2)
+            masked_image_latents = torch.cat([masked_image_latents] * 2)
+            image_latents = torch.cat([image_latents] * 2)
+            if mel_overlap is not None:
+                mel_overlap = torch.cat([torch.zeros_like(mel_overlap), mel_overlap])
+
+        num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
+        with self.progress_bar(total=num_inference_steps) as progress_bar:
+            for j, t in enumerate(timesteps):
+                # expand the latents if we are doing classifier free guidance
+                latent_model_input = torch.cat([latents] * 2) if do_classifier_free_guidance else latents
+
+                # concat latents, mask, masked_image_latents in the channel dimension
+                latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
+                latent_model_input = torch.cat(
+                    [latent_model_input, mask_latents, masked_image_latents, image_latents], dim=1
+                )
+
+                # predict the noise residual
+                noise_pred = self.unet(latent_model_input, t, encoder_hidden_states=mel_overlap).sample
+
+                # perform guidance
+                if do_classifier_free_guidance:
+                    noise_pred_uncond, noise_pred_audio = noise_pred.chunk(2)
+                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_audio - noise_pred_uncond)
+
+                # compute the previous noisy sample x_t -> x_t-1
+                latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs).prev_sample
+
+                # call the callback, if provided
+                if j == len(timesteps) - 1 or ((j + 1) > num_warmup_steps and (j + 1) % self.scheduler.order == 0):
+                    progress_bar.update()
+                    if callback is not None and j % callback_steps == 0:
+                        callback(j, t, latents)
+        return latents
+
+    @staticmethod
+    def auto_denoise_batch_size(device, per_window_bytes, max_batch_size=8):
+        """Largest number of windows whose measured activation memory fits in the free device memory."""
+        free_memory = free_device_memory(device)
+        if free_memory is None:
+            return 1
+        return int(max(1, min(max_batch_size, free_memory * 0.9 // per_window_bytes)))
+
+    def fork(self):
+        """Copy for a concurrent call: the models are shared, the scheduler and per-call state are not."""
+        pipeline = copy.copy(self)
+        pipeline.scheduler = copy.deepcopy(self.scheduler)
+        return pipeline
+
     def set_progress_bar_config(self, **kwargs):
         if not hasattr(self, "_progress_bar_config"):
             self._progress_bar_config = {}
@@ -289,43 +573,84 @@ class LipsyncPipeline(DiffusionPipeline):
         end_idx = start_idx + self.mel_window_length
         return original_mel[:, start_idx:end_idx].unsqueeze(0)
 
-    def affine_transform_video(self, video_path):
-        video_frames = read_video(video_path, use_decord=False)
-        faces = []
-        boxes = []
-        affine_matrices = []
-        print(f"Affine transforming {len(video_frames)} faces...")
-        for frame in tqdm.tqdm(video_frames):
-            face, box, affine_matrix = self.image_processor.affine_transform(frame)
-            faces.append(face)
-            boxes.append(box)
-            affine_matrices.append(affine_matrix)
-
-        faces = torch.stack(faces)
-        return faces, video_frames, boxes, affine_matrices
-
-    def restore_video(self, faces, video_frames, boxes, affine_matrices):
-        video_frames = video_frames[: faces.shape[0]]
-        out_frames = []
-        for index, face in enumerate(faces):
-            x1, y1, x2, y2 = boxes[index]
+    def affine_transform_video(
+        self, video_path=None, video_frames=None, face_cache: Optional[DiskLRUCache] = None, frame_index_map=None
+    ):
+        if video_frames is None:
+            video_frames = read_video(video_path, use_decord=False)
+        # Clip frame i is video_frames[clip_index[i]]; without a frame_index_map every frame is a clip frame
+        clip_index = np.arange(len(video_frames)) if frame_index_map is None else np.asarray(frame_index_map)
+
+        # Repeated frames (e.g. pingpong-extended avatars) are run through face detection once
+        frame_hashes = [hash_array(frame) for frame in video_frames]
+        first_index = {}
+        unique_ids = np.array([first_index.setdefault(h, len(first_index)) for h in frame_hashes])
+        unique_positions = np.unique(unique_ids, return_index=True)[1]
+
+        cache_key = hash_strings([h for h in first_index] + ["landmarks", self.image_processor.fa is None])
+        cached = face_cache.get(cache_key) if face_cache is not None else None
+        if cached is not None:
+            print(f"Reusing cached landmarks of {len(unique_positions)} unique faces")
+            landmarks = cached["landmarks"].numpy()
+        else:
+            print(f"Detecting {len(unique_positions)} unique faces of {len(clip_index)} frames...")
+            detected = self.image_processor.detect_landmarks_batch(
+                rearrange(torch.from_numpy(video_frames[unique_positions]), "b h w c -> b c h w")
+            )
+            for position, lm68 in zip(unique_positions, detected):
+                if lm68 is None:
+                    raise RuntimeError(f"Face not detected in frame {position}")
+            landmarks = np.stack(detected)
+            if face_cache is not None:
+                face_cache.put(cache_key, {"landmarks": torch.from_numpy(landmarks)})
+
+        # The landmark smoothing and the warp bias carry state from frame to frame, so the faces are
+        # aligned over the clip as played, repeats included, and only the detection is shared
+        faces, boxes, affine_matrices = self.image_processor.align_faces_batch(
+            video_frames, landmarks[unique_ids[clip_index]], index=clip_index
+        )
+        return faces, video_frames, boxes, affine_matrices, torch.from_numpy(clip_index), frame_hashes
+
+    def restore_video(self, faces, video_frames, boxes, affine_matrices, index_map=None, batch_size=16):
+        """Paste the generated faces back into their frames, `batch_size` frames at a time on the faces' device."""
+        out_frames = np.empty((len(faces), *video_frames.shape[1:]), dtype=np.uint8)
+        start = 0
+        for chunk in self.iter_restored_video(faces, video_frames, boxes, affine_matrices, index_map, batch_size):
+            out_frames[start : start + len(chunk)] = chunk
+            start += len(chunk)
+        return out_frames
+
+    def iter_restored_video(self, faces, video_frames, boxes, affine_matrices, index_map=None, batch_size=16):
+        """Yield the restored frames in chunks of `batch_size` as uint8 arrays [f, h, w, c]."""
+        if index_map is None:
+            index_map = torch.arange(faces.shape[0])
+        index_map = torch.as_tensor(index_map)
+        device = faces.device
+        for start in range(0, len(faces), batch_size):
+            indices = index_map[start : start + batch_size].numpy()
+            # All boxes share the aligned face size, so the chunk is resized in one call
+            x1, y1, x2, y2 = boxes[indices[0]]
             height = int(y2 - y1)
             width = int(x2 - x1)
-            face = torchvision.transforms.functional.resize(face, size=(height, width), antialias=True)
-            face = rearrange(face, "c h w -> h w c")
+            face = torchvision.transforms.functional.resize(
+                faces[start : start + batch_size], size=(height, width), antialias=True
+            )
             face = (face / 2 + 0.5).clamp(0, 1)
-            face = (face * 255).to(torch.uint8).cpu().numpy()
-            out_frame = self.image_processor.restorer.restore_img(video_frames[index], face, affine_matrices[index])
-            out_frames.append(out_frame)
-        return np.stack(out_frames, axis=0)
+            face = (face * 255).to(torch.uint8)
+            frames = torch.from_numpy(np.ascontiguousarray(video_frames[indices])).to(device)
+            matrices = np.stack([affine_matrices[index] for index in indices])
+            yield self.image_processor.restorer.restore_imgs(frames, face.float(), matrices).cpu().numpy()
 
     @torch.no_grad()
     def __call__(
         self,
-        video_path: str,
-        audio_path: str,
-        video_out_path: str,
+        video_path: Optional[str] = None,
+        audio_path: Optional[str] = None,
+        video_out_path: Optional[str] = None,
         video_mask_path: str = None,
+        video_frames: Optional[np.ndarray] = None,
+        frame_index_map: Optional[np.ndarray] = None,
+        audio_samples: Optional[torch.Tensor] = None,
         num_frames: int = 16,
         video_fps: int = 25,
         audio_sample_rate: int = 16000,
@@ -337,10 +662,47 @@ class LipsyncPipeline(DiffusionPipeline):
         eta: float = 0.0,
         mask: str = "fix_mask",
         generator: Optional[Union[torch.Generator, List[torch.Generator]]] = None,
+        face_cache: Optional[DiskLRUCache] = None,
+        latent_cache: Optional[DiskLRUCache] = None,
+        audio_cache: Optional[DiskLRUCache] = None,
+        denoise_batch_size: int = 1,
+        debug_outputs: Optional[Sequence[str]] = None,
+        streaming: bool = False,
+        overlap_stages: bool = True,
+        scratch_dir: Optional[str] = None,
+        gpu_admission: Optional[GpuAdmission] = None,
         callback: Optional[Callable[[int, int, torch.FloatTensor], None]] = None,
         callback_steps: Optional[int] = 1,
         **kwargs,
     ):
+        """
+        Either `video_path`/`audio_path` or in-memory `video_frames` (uint8 array of shape
+        [f, h, w, c] at `video_fps`) and `audio_samples` (mono waveform at `audio_sample_rate`)
+        must be given. With `frame_index_map`, `video_frames` only holds the distinct source frames and
+        frame i of the clip is `video_frames[frame_index_map[i]]` (e.g. a pingpong-extended clip), so
+        repeats are neither copied nor hashed. When `video_out_path` is None nothing is written to disk and the synced
+        frames and the trimmed audio samples are returned instead.
+
+        `denoise_batch_size` is the number of `num_frames` windows denoised together in one batch;
+        0 picks it automatically from the free device memory after measuring the first window.
+
+        `debug_outputs` opts into artifacts that cost extra work: "masked_video" (the masked faces pasted
+        back into the frames, written to `video_mask_path`) and "affine_faces" (the aligned and masked
+        aligned faces). In the in-memory mode they are returned as a third element, a dict of uint8 arrays.
+
+        With `streaming` the video is decoded, aligned, encoded and written window by window, so memory
+        stays bounded for arbitrarily long inputs; the whole-clip `face_cache` and `latent_cache` are not
+        used then. Each window is restored as soon as it is denoised in both modes.
+
+        With `overlap_stages` decoding and alignment of the next windows and restoring and encoding of
+        the previous windows run on background threads while the current windows are denoised. The
+        busy time and utilization of each stage are kept in `self.stage_stats` after the call.
+
+        Temporary files of the call are created in `scratch_dir`, the job's private scratch directory.
+
+        When several jobs share the models, each call should go through its own `fork()` and the
+        denoising phases of the jobs are admitted by `gpu_admission` according to their memory estimate.
+        """
         is_train = self.unet.training
         self.unet.eval()
 
@@ -350,8 +712,10 @@ class LipsyncPipeline(DiffusionPipeline):
         self.image_processor = ImageProcessor(height, mask=mask, device="cuda")
         self.set_progress_bar_config(desc=f"Sample frames: {num_frames}")
 
-        video_frames, original_video_frames, boxes, affine_matrices = self.affine_transform_video(video_path)
-        audio_samples = read_audio(audio_path)
+        if audio_samples is None:
+            audio_samples = read_audio(audio_path)
+        else:
+            audio_samples = torch.as_tensor(audio_samples, dtype=torch.float32).reshape(-1)
 
         # 1. Default height and width to unet
         if self.latent_space:
@@ -376,30 +740,67 @@ class LipsyncPipeline(DiffusionPipeline):
         self.video_fps = video_fps
 
         if self.unet.add_audio_layer:
-            whisper_feature = self.audio_encoder.audio2feat(audio_path)
+            whisper_feature = self.audio_encoder.audio2feat(
+                audio_path if audio_path is not None else audio_samples, cache=audio_cache
+            )
             whisper_chunks = self.audio_encoder.feature2chunks(feature_array=whisper_feature, fps=video_fps)
-
-            num_inferences = min(len(video_frames), len(whisper_chunks)) // num_frames
+            max_inferences = len(whisper_chunks) // num_frames
         else:
-            num_inferences = len(video_frames) // num_frames
-
-        synced_video_frames = []
-        masked_video_frames = []
-
-        save_affine_faces = False
-        if save_affine_faces:
-            pixel_values_faces = []
-            masked_pixel_values_faces = []
+            whisper_chunks = None
+            max_inferences = None
+
+        debug_outputs = set(debug_outputs or ())
+        unknown_outputs = debug_outputs - set(DEBUG_OUTPUTS)
+        if unknown_outputs:
+            raise ValueError(f"Unknown debug outputs {sorted(unknown_outputs)}, expected some of {DEBUG_OUTPUTS}")
+        if "masked_video" in debug_outputs and video_out_path is not None and video_mask_path is None:
+            raise ValueError("The masked_video debug output needs a video_mask_path when video_out_path is set")
+
+        if streaming:
+            if video_frames is not None:
+                clip_index = np.arange(len(video_frames)) if frame_index_map is None else np.asarray(frame_index_map)
+                frame_chunks = (
+                    video_frames[clip_index[start : start + num_frames]]
+                    for start in range(0, len(clip_index), num_frames)
+                )
+                num_video_frames = len(clip_index)
+            else:
+                frame_chunks = iter_video_frames(video_path, chunk_size=num_frames, scratch_dir=scratch_dir)
+                num_video_frames = None
+            windows = self.iter_streamed_windows(frame_chunks, num_frames, device, weight_dtype)
+        else:
+            faces, original_video_frames, boxes, affine_matrices, clip_index, frame_hashes = (
+                self.affine_transform_video(video_path, video_frames, face_cache, frame_index_map)
+            )
+            face_latents = self.prepare_face_latents(
+                faces,
+                device,
+                weight_dtype,
+                latent_cache,
+                frame_hashes=[frame_hashes[i] for i in clip_index.tolist()],
+            )
+            windows = self.iter_cached_windows(
+                faces, original_video_frames, boxes, affine_matrices, clip_index, face_latents, num_frames
+            )
+            num_video_frames = len(clip_index)
+        if num_video_frames is not None:
+            max_inferences = min(
+                num_video_frames // num_frames, num_video_frames if max_inferences is None else max_inferences
+            )
+        if max_inferences == 0:
+            raise ValueError(f"The audio or the video is shorter than one {num_frames}-frame window, nothing to sync")
+        if max_inferences is not None:
+            windows = itertools.islice(windows, max_inferences)
 
-        # Prepare latent variables
+        # Prepare latent variables; the initial noise is the same for every window
         if self.latent_space:
             num_channels_latents = self.vae.config.latent_channels
         else:
             num_channels_latents = 3
 
-        all_latents = self.prepare_latents(
+        window_latents = self.prepare_latents(
             batch_size,
-            num_frames * num_inferences,
+            num_frames,
             num_channels_latents,
             height,
             width,
@@ -408,115 +809,174 @@ class LipsyncPipeline(DiffusionPipeline):
             generator,
         )
 
-        for i in tqdm.tqdm(range(num_inferences), desc="Doing inference..."):
-            if self.unet.add_audio_layer:
-                # mel_overlap = torch.stack(mel_overlap_list[i * num_frames : (i + 1) * num_frames])
-                # mel_overlap = mel_overlap.unsqueeze(0).to(device, dtype=weight_dtype)
-                mel_overlap = torch.stack(whisper_chunks[i * num_frames : (i + 1) * num_frames])
-                mel_overlap = mel_overlap.to(device, dtype=weight_dtype)
-                if do_classifier_free_guidance:
-                    empty_mel_overlap = torch.zeros_like(mel_overlap)
-                    mel_overlap = torch.cat([empty_mel_overlap, mel_overlap])
+        # Restored frames are written as soon as their window is done, or collected in the in-memory mode
+        synced_video_frames = []
+        # Debug artifacts are only collected when requested
+        masked_video_frames = []
+        pixel_values_faces = []
+        masked_pixel_values_faces = []
+        num_synced_frames = 0
+        writers = {}
+        if video_out_path is not None and max_inferences is not None:
+            # ffmpeg stops at the end of the video (-shortest), so the audio is only trimmed to an upper bound
+            audio_samples = audio_samples[: int(max_inferences * num_frames / video_fps * audio_sample_rate)]
+
+        def emit(name, path, chunk, **audio):
+            if path is None:
+                (synced_video_frames if name == "synced" else masked_video_frames).append(chunk)
+                return
+            if name not in writers:
+                writers[name] = writer_stack.enter_context(
+                    StreamingVideoWriter(
+                        path, chunk.shape[2], chunk.shape[1], fps=video_fps, scratch_dir=scratch_dir, **audio
+                    )
+                )
+            writers[name].write(chunk)
+
+        def restore_window(item):
+            """Paste the generated faces of one window back into its frames and hand them to the sink."""
+            nonlocal num_synced_frames
+            frames, decoded_latents, masked_pixel_values = item
+            for chunk in self.iter_restored_video(
+                decoded_latents, frames["frames"], frames["boxes"], frames["affine_matrices"]
+            ):
+                emit("synced", video_out_path, chunk, audio_samples=audio_samples, audio_sample_rate=audio_sample_rate)
+                num_synced_frames += len(chunk)
+            if masked_pixel_values is not None:
+                for chunk in self.iter_restored_video(
+                    masked_pixel_values.to(device), frames["frames"], frames["boxes"], frames["affine_matrices"]
+                ):
+                    emit("masked", video_mask_path if video_out_path is not None else None, chunk)
+
+        # Decoding/alignment of the next windows and restoring/encoding of the previous ones run on
+        # background threads while the current windows are denoised
+        stage_stats = {name: StageStats(name) for name in ("decode_align", "denoise", "restore_encode")}
+        write_masked_video = "masked_video" in debug_outputs
+        per_window_bytes = None
+        progress = tqdm.tqdm(total=max_inferences, desc="Doing inference...")
+        wall_start = time.perf_counter()
+        with ExitStack() as exit_stack:
+            # Entered first so that the writers are closed only after the restore worker has finished
+            writer_stack = exit_stack.enter_context(ExitStack())
+            if overlap_stages:
+                windows = exit_stack.enter_context(Prefetcher(windows, stats=stage_stats["decode_align"]))
+                submit = exit_stack.enter_context(
+                    StageWorker(restore_window, stats=stage_stats["restore_encode"])
+                ).submit
             else:
-                mel_overlap = None
-            inference_video_frames = video_frames[i * num_frames : (i + 1) * num_frames]
-            latents = all_latents[:, :, i * num_frames : (i + 1) * num_frames]
-            pixel_values, masked_pixel_values, masks = self.image_processor.prepare_masks_and_masked_images(
-                inference_video_frames, affine_transform=False
-            )
-
-            if save_affine_faces:
-                pixel_values_faces.append(pixel_values)
-                masked_pixel_values_faces.append(masked_pixel_values)
-
-            # 7. Prepare mask latent variables
-            mask_latents, masked_image_latents = self.prepare_mask_latents(
-                masks,
-                masked_pixel_values,
-                height,
-                width,
-                weight_dtype,
-                device,
-                generator,
-                do_classifier_free_guidance,
-            )
-
-            # 8. Prepare image latents
-            image_latents = self.prepare_image_latents(
-                pixel_values,
-                device,
-                weight_dtype,
-                generator,
-                do_classifier_free_guidance,
-            )
-
-            # 9. Denoising loop
-            num_warmup_steps = len(timesteps) - num_inference_steps * self.scheduler.order
-            with self.progress_bar(total=num_inference_steps) as progress_bar:
-                for j, t in enumerate(timesteps):
-                    # expand the latents if we are doing classifier free guidance
-                    latent_model_input = torch.cat([latents] * 2) if do_classifier_free_guidance else latents
-
-                    # concat latents, mask, masked_image_latents in the channel dimension
-                    latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
-                    latent_model_input = torch.cat(
-                        [latent_model_input, mask_latents, masked_image_latents, image_latents], dim=1
+                windows = timed_iter(windows, stage_stats["decode_align"])
+                submit = timed_call(restore_window, stage_stats["restore_encode"])
+
+            while True:
+                if denoise_batch_size > 0:
+                    windows_per_batch = denoise_batch_size
+                elif per_window_bytes is None:
+                    windows_per_batch = 1  # the first window measures the memory cost of one window
+                else:
+                    windows_per_batch = self.auto_denoise_batch_size(device, per_window_bytes)
+
+                batch_windows = list(itertools.islice(windows, windows_per_batch))
+                if not batch_windows:
+                    break
+                # The first window of a job runs alone (no estimate yet) and measures its memory
+                measure_window = (denoise_batch_size == 0 or gpu_admission is not None) and per_window_bytes is None
+                estimate_bytes = None
+                if per_window_bytes is not None and per_window_bytes != float("inf"):
+                    estimate_bytes = per_window_bytes * len(batch_windows)
+                admission = gpu_admission.admit(estimate_bytes) if gpu_admission is not None else nullcontext()
+                with admission:
+                    denoise_start = time.perf_counter()
+
+                    if measure_window and device.type == "cuda":
+                        torch.cuda.reset_peak_memory_stats(device)
+                        memory_before = torch.cuda.memory_allocated(device)
+
+                    # Windows are prepared in order so the generator is consumed exactly as in the serial path
+                    prepared = []
+                    for window in batch_windows:
+                        prepared.append(
+                            self.prepare_window(
+                                progress.n + len(prepared),
+                                window,
+                                window_latents,
+                                whisper_chunks,
+                                num_frames,
+                                height,
+                                width,
+                                weight_dtype,
+                                device,
+                                generator,
+                            )
+                        )
+
+                    for window in prepared:
+                        if "affine_faces" in debug_outputs:
+                            pixel_values_faces.append(window["pixel_values"].cpu())
+                            masked_pixel_values_faces.append(window["masked_pixel_values"].cpu())
+
+                    # 9. Denoising loop, all windows of the batch stacked along the batch dimension
+                    latents = self.denoise_windows(
+                        prepared,
+                        timesteps,
+                        num_inference_steps,
+                        do_classifier_free_guidance,
+                        guidance_scale,
+                        extra_step_kwargs,
+                        callback,
+                        callback_steps,
                     )
 
-                    # predict the noise residual
-                    noise_pred = self.unet(latent_model_input, t, encoder_hidden_states=mel_overlap).sample
-
-                    # compute the previous noisy sample x_t -> x_t-1
-                    latents = self.scheduler.step(noise_pred, t, latents, **extra_step_kwargs).prev_sample
-
-                    # call the callback, if provided
-                    if j == len(timesteps) - 1 or (
-                        (j + 1) > num_warmup_steps and (j + 1) % self.scheduler.order == 0
-                    ):
-                        progress_bar.update()
-                        if callback is not None and j % callback_steps == 0:
-                            callback(j, t, latents)
-
-            # Recover the pixel values
-            decoded_latents = self.decode_latents(latents)
-            decoded_latents = self.recover_original_pixel_values(
-                decoded_latents, pixel_values, 1 - masks, device, weight_dtype
-            )
-            synced_video_frames.append(decoded_latents)
-            masked_video_frames.append(masked_pixel_values)
-
-        synced_video_frames = self.restore_video(
-            torch.cat(synced_video_frames), original_video_frames, boxes, affine_matrices
-        )
-        masked_video_frames = self.restore_video(
-            torch.cat(masked_video_frames), original_video_frames, boxes, affine_matrices
+                    # Recover the pixel values
+                    restore_items = []
+                    for window, latents_window in zip(prepared, latents.split(1)):
+                        decoded_latents = self.decode_latents(latents_window)
+                        decoded_latents = self.recover_original_pixel_values(
+                            decoded_latents, window["pixel_values"], 1 - window["masks"], device, weight_dtype
+                        )
+                        masked_pixel_values = window["masked_pixel_values"] if write_masked_video else None
+                        restore_items.append((window["window"], decoded_latents, masked_pixel_values))
+
+                    if measure_window:
+                        if device.type == "cuda":
+                            peak_bytes = torch.cuda.max_memory_allocated(device) - memory_before
+                            per_window_bytes = max(peak_bytes // len(batch_windows), 1)
+                        else:
+                            per_window_bytes = float("inf")
+                    stage_stats["denoise"].add(time.perf_counter() - denoise_start, len(batch_windows))
+
+                for item in restore_items:
+                    submit(item)
+                progress.update(len(prepared))
+        progress.close()
+
+        wall_seconds = time.perf_counter() - wall_start
+        self.stage_stats = {name: stats.summary(wall_seconds) for name, stats in stage_stats.items()}
+        print(
+            "Stage utilization: "
+            + ", ".join(f"{name} {stats['utilization']:.0%}" for name, stats in self.stage_stats.items())
+            + f" over {wall_seconds:.1f}s"
         )
 
-        audio_samples_remain_length = int(synced_video_frames.shape[0] / video_fps * audio_sample_rate)
+        audio_samples_remain_length = int(num_synced_frames / video_fps * audio_sample_rate)
         audio_samples = audio_samples[:audio_samples_remain_length].cpu().numpy()
 
         if is_train:
             self.unet.train()
 
-        temp_dir = "temp"
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir, exist_ok=True)
-
-        if save_affine_faces:
-            pixel_values_faces = torch.cat(pixel_values_faces)
-            masked_pixel_values_faces = torch.cat(masked_pixel_values_faces)
-
-            pixel_values_faces = self.pixel_values_to_images(pixel_values_faces)
-            masked_pixel_values_faces = self.pixel_values_to_images(masked_pixel_values_faces)
-
-            write_video("affine_faces.mp4", pixel_values_faces, fps=25)
-            write_video("masked_affine_faces.mp4", masked_pixel_values_faces, fps=25)
-
-        write_video(os.path.join(temp_dir, "video.mp4"), synced_video_frames, fps=25)
-        # write_video(video_mask_path, masked_video_frames, fps=25)
-
-        sf.write(os.path.join(temp_dir, "audio.wav"), audio_samples, audio_sample_rate)
-
-        command = f"ffmpeg -y -loglevel error -nostdin -i {os.path.join(temp_dir, 'video.mp4')} -i {os.path.join(temp_dir, 'audio.wav')} -c:v libx264 -c:a aac -q:v 0 -q:a 0 {video_out_path}"
-        subprocess.run(command, shell=True)
+        debug = {}
+        if "affine_faces" in debug_outputs:
+            debug["affine_faces"] = self.pixel_values_to_images(torch.cat(pixel_values_faces))
+            debug["masked_affine_faces"] = self.pixel_values_to_images(torch.cat(masked_pixel_values_faces))
+
+        if video_out_path is None:
+            synced_video_frames = np.concatenate(synced_video_frames)
+            if "masked_video" in debug_outputs:
+                debug["masked_video"] = np.concatenate(masked_video_frames)
+            if debug_outputs:
+                return synced_video_frames, audio_samples, debug
+            return synced_video_frames, audio_samples
+
+        if "affine_faces" in debug:
+            out_prefix = os.path.splitext(video_out_path)[0]
+            write_video(out_prefix + "_affine_faces.mp4", debug["affine_faces"], fps=video_fps)
+            write_video(out_prefix + "_masked_affine_faces.mp4", debug["masked_affine_faces"], fps=video_fps)
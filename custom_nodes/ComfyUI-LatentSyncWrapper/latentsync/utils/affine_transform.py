@@ -1,7 +1,11 @@
 # Adapted from https://github.com/guanjz20/StyleSync/blob/main/utils.py
 
+from collections import OrderedDict
+
 import numpy as np
 import cv2
+import torch
+import torch.nn.functional as F
 
 
 def transformation_from_points(points1, points0, smooth=True, p_bias=None):
@@ -32,6 +36,104 @@ def transformation_from_points(points1, points0, smooth=True, p_bias=None):
     return M, p_bias
 
 
+def transformation_from_points_batch(points1, points0, smooth=True, p_bias=None):
+    """Vectorized `transformation_from_points` for points1 of shape [n, k, 2].
+
+    Returns the [n, 2, 3] affine matrices and the bias carried over to the next frame.
+    """
+    points2 = np.asarray(points0, dtype=np.float64)[None]
+    points1 = np.asarray(points1, dtype=np.float64)
+    c1 = points1.mean(axis=1, keepdims=True)
+    c2 = points2.mean(axis=1, keepdims=True)
+    points1 = points1 - c1
+    points2 = points2 - c2
+    s1 = points1.std(axis=(1, 2), keepdims=True)
+    s2 = points2.std(axis=(1, 2), keepdims=True)
+    points1 = points1 / s1
+    points2 = points2 / s2
+    U, S, Vt = np.linalg.svd(np.matmul(points1.transpose(0, 2, 1), points2))
+    R = np.matmul(U, Vt).transpose(0, 2, 1)
+    scale = (s2 / s1)[:, :, 0]  # [n, 1]
+    sR = scale[:, :, None] * R
+    T = c2.transpose(0, 2, 1) - scale[:, :, None] * np.matmul(R, c1.transpose(0, 2, 1))
+    M = np.concatenate((sR, T), axis=2)
+    if smooth:
+        # The bias is an exponential moving average over time, so it is accumulated in order
+        biases = points2[:, 2] - points1[:, 2]
+        for i in range(len(biases)):
+            if p_bias is not None:
+                biases[i] = p_bias * 0.2 + biases[i] * 0.8
+            p_bias = biases[i]
+        M[:, :, 2] = M[:, :, 2] + biases
+    return M, p_bias
+
+
+def warp_affine_torch(images, affine_matrices, dsize, border_value=0.0, mode="bilinear", out_size=None):
+    """Batched equivalent of `cv2.warpAffine` using a single `grid_sample`.
+
+    images: [n, c, h, w] float tensor; affine_matrices: [n, 2, 3] forward (src -> dst) matrices;
+    dsize: (width, height) of the destination plane the matrices map into. If `out_size`
+    (width, height) differs from dsize, the destination plane is resampled to it in the same pass.
+    """
+    n, _, h, w = images.shape
+    dst_w, dst_h = dsize
+    out_w, out_h = out_size or dsize
+    matrices = torch.as_tensor(np.asarray(affine_matrices), dtype=torch.float64, device=images.device)
+    full = torch.zeros((n, 3, 3), dtype=torch.float64, device=images.device)
+    full[:, :2] = matrices
+    full[:, 2, 2] = 1
+    inverse = torch.linalg.inv(full)[:, :2]
+
+    # Pixel centers of the output grid expressed in destination-plane coordinates
+    xs = (torch.arange(out_w, dtype=torch.float64, device=images.device) + 0.5) * (dst_w / out_w) - 0.5
+    ys = (torch.arange(out_h, dtype=torch.float64, device=images.device) + 0.5) * (dst_h / out_h) - 0.5
+    grid_y, grid_x = torch.meshgrid(ys, xs, indexing="ij")
+    dst = torch.stack([grid_x, grid_y, torch.ones_like(grid_x)], dim=-1).reshape(1, -1, 3)
+    src = torch.matmul(dst, inverse.transpose(1, 2))  # [n, out_h * out_w, 2]
+    src[..., 0] = (2 * src[..., 0] + 1) / w - 1
+    src[..., 1] = (2 * src[..., 1] + 1) / h - 1
+    grid = src.reshape(n, out_h, out_w, 2).to(images.dtype)
+
+    warped = F.grid_sample(images - border_value, grid, mode=mode, padding_mode="zeros", align_corners=False)
+    return warped + border_value
+
+
+def erode_torch(masks, ksize):
+    """`cv2.erode` with a (ksize, ksize) rectangle and the default anchor for masks of shape [n, 1, h, w]."""
+    if ksize <= 0:
+        ksize = 3  # cv2 falls back to a 3x3 rectangle for an empty kernel
+    before = ksize // 2
+    after = ksize - 1 - before
+    # Out-of-image pixels never win the minimum, like cv2's default border for morphology
+    padded = F.pad(masks, (before, after, before, after), value=float("inf"))
+    return -F.max_pool2d(-padded, ksize, stride=1)
+
+
+_SMALL_GAUSSIAN_KERNELS = {
+    1: [1.0],
+    3: [0.25, 0.5, 0.25],
+    5: [0.0625, 0.25, 0.375, 0.25, 0.0625],
+    7: [0.03125, 0.109375, 0.21875, 0.28125, 0.21875, 0.109375, 0.03125],
+}
+
+
+def gaussian_blur_torch(masks, ksize):
+    """`cv2.GaussianBlur(mask, (ksize, ksize), 0)` for masks of shape [n, 1, h, w]."""
+    if ksize in _SMALL_GAUSSIAN_KERNELS:
+        kernel = torch.tensor(_SMALL_GAUSSIAN_KERNELS[ksize], dtype=torch.float64)
+    else:
+        sigma = 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+        kernel = torch.exp(-((torch.arange(ksize, dtype=torch.float64) - (ksize - 1) / 2) ** 2) / (2 * sigma**2))
+        kernel = kernel / kernel.sum()
+    if ksize == 1:
+        return masks
+    kernel = kernel.to(device=masks.device, dtype=masks.dtype)
+    radius = ksize // 2
+    # cv2's default BORDER_REFLECT_101 is torch's "reflect"
+    blurred = F.conv2d(F.pad(masks, (radius, radius, 0, 0), mode="reflect"), kernel.view(1, 1, 1, -1))
+    return F.conv2d(F.pad(blurred, (0, 0, radius, radius), mode="reflect"), kernel.view(1, 1, -1, 1))
+
+
 class AlignRestore(object):
     def __init__(self, align_points=3):
         if align_points == 3:
@@ -42,6 +144,8 @@ class AlignRestore(object):
             # self.face_size = (int(100 * self.crop_ratio[0]), int(100 * self.crop_ratio[1]))
             self.face_size = (int(75 * self.crop_ratio[0]), int(100 * self.crop_ratio[1]))
             self.p_bias = None
+        # Hard and soft paste-back masks of the last face placement, reused while the placement stays put
+        self.mask_cache = None
 
     def process(self, img, lmk_align=None, smooth=True, align_points=3):
         aligned_face, affine_matrix = self.align_warp_face(img, lmk_align, smooth)
@@ -63,6 +167,20 @@ class AlignRestore(object):
         )
         return cropped_face, affine_matrix
 
+    def align_warp_faces(self, images, lmks3, smooth=True, out_size=None):
+        """Batched `align_warp_face` for images [n, c, h, w] (float tensor) and lmks3 [n, 3, 2].
+
+        The warp (and an optional resize to `out_size`) runs as one `grid_sample` on the images' device.
+        """
+        affine_matrices, self.p_bias = transformation_from_points_batch(lmks3, self.face_template, smooth, self.p_bias)
+        return self.warp_faces(images, affine_matrices, out_size), affine_matrices
+
+    def warp_faces(self, images, affine_matrices, out_size=None):
+        """Crop the aligned faces of images [n, c, h, w] (float tensor) with known affine matrices."""
+        return warp_affine_torch(
+            images, affine_matrices, self.face_size, border_value=127.0, mode="bicubic", out_size=out_size
+        )
+
     def align_warp_face2(self, img, landmark, border_mode="constant"):
         affine_matrix = cv2.estimateAffinePartial2D(landmark, self.face_template)[0]
         if border_mode == "constant":
@@ -108,6 +226,127 @@ class AlignRestore(object):
             upsample_img = upsample_img.astype(np.uint8)
         return upsample_img
 
+    def restore_imgs(self, input_imgs, faces, affine_matrices, mask_tolerance=0.25):
+        """Batched `restore_img` on the tensors' device.
+
+        input_imgs: [n, h, w, c] uint8 tensor; faces: [n, c, face_h, face_w] float tensor in [0, 255];
+        affine_matrices: [n, 2, 3] alignment matrices. Only the region covered by the pasted faces is
+        processed, and the soft masks are recomputed only for frames whose face corners moved more than
+        `mask_tolerance` pixels from the last computed placement.
+        """
+        n, h, w, _ = input_imgs.shape
+        device = input_imgs.device
+        if self.upscale_factor != 1:
+            h, w = int(h * self.upscale_factor), int(w * self.upscale_factor)
+            input_imgs = F.interpolate(input_imgs.permute(0, 3, 1, 2).float(), size=(h, w), mode="bicubic")
+            input_imgs = input_imgs.round().clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1)
+
+        full = torch.zeros((n, 3, 3), dtype=torch.float64, device=device)
+        full[:, :2] = torch.as_tensor(np.asarray(affine_matrices), dtype=torch.float64, device=device)
+        full[:, 2, 2] = 1
+        inverse_affines = torch.linalg.inv(full)[:, :2] * self.upscale_factor
+        if self.upscale_factor > 1:
+            inverse_affines[:, :, 2] += 0.5 * self.upscale_factor
+
+        # Placement of the face rectangle (with a one pixel margin) in the frame
+        face_w, face_h = self.face_size
+        rect = torch.tensor(
+            [[-1, -1, 1], [face_w, -1, 1], [-1, face_h, 1], [face_w, face_h, 1]], dtype=torch.float64, device=device
+        )
+        corners = torch.matmul(rect, inverse_affines.transpose(1, 2))  # [n, 4, 2]
+        x0 = max(int(corners[..., 0].min().floor()) - 1, 0)
+        y0 = max(int(corners[..., 1].min().floor()) - 1, 0)
+        x1 = min(int(corners[..., 0].max().ceil()) + 2, w)
+        y1 = min(int(corners[..., 1].max().ceil()) + 2, h)
+        if x0 >= x1 or y0 >= y1:
+            return input_imgs
+        roi_affines = inverse_affines.clone()
+        roi_affines[:, 0, 2] -= x0
+        roi_affines[:, 1, 2] -= y0
+        roi_size = (x1 - x0, y1 - y0)
+
+        inv_restored = warp_affine_torch(faces.float(), roi_affines, roi_size)
+        hard_masks, soft_masks = self.paste_masks(corners, roi_affines, (x0, y0), roi_size, (h, w), mask_tolerance)
+
+        roi = input_imgs[:, y0:y1, x0:x1].permute(0, 3, 1, 2).float()
+        pasted_face = hard_masks * inv_restored
+        blended = soft_masks * pasted_face + (1 - soft_masks) * roi
+        output = input_imgs.clone()
+        output[:, y0:y1, x0:x1] = blended.clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1)
+        return output
+
+    def paste_masks(self, corners, roi_affines, roi_origin, roi_size, frame_size, mask_tolerance):
+        """Hard (eroded) and soft paste-back masks of every frame, [n, 1, roi_h, roi_w] each.
+
+        Masks are kept as placements: the masks cropped to where they are non-zero and their origin in the frame.
+        """
+        n = len(corners)
+        device = corners.device
+        x0, y0 = roi_origin
+        roi_w, roi_h = roi_size
+        cache = self.mask_cache
+        if cache is not None and (cache["frame_size"] != frame_size or cache["device"] != device):
+            cache = None
+
+        # Each frame takes the last placement within tolerance, or a new one
+        placements = []
+        recompute = []
+        reference = cache
+        for i in range(n):
+            if reference is None or (corners[i] - reference["corners"]).abs().max() > mask_tolerance:
+                recompute.append(i)
+                reference = {"corners": corners[i], "index": i}
+            placements.append(reference)
+
+        if recompute:
+            face_w, face_h = self.face_size
+            ones = torch.ones((len(recompute), 1, face_h, face_w), device=device)
+            inv_masks = warp_affine_torch(ones, roi_affines[recompute], roi_size)
+            inv_mask_erosions = erode_torch(inv_masks, int(2 * self.upscale_factor))
+            total_face_areas = inv_mask_erosions.sum(dim=(1, 2, 3)).tolist()
+            w_edges = [int(area**0.5) // 20 for area in total_face_areas]
+            inv_soft_masks = torch.empty_like(inv_mask_erosions)
+            for w_edge in set(w_edges):
+                group = [j for j, edge in enumerate(w_edges) if edge == w_edge]
+                inv_mask_centers = erode_torch(inv_mask_erosions[group], w_edge * 2)
+                inv_soft_masks[group] = gaussian_blur_torch(inv_mask_centers, w_edge * 2 + 1)
+
+            new_placements = {}
+            for j, i in enumerate(recompute):
+                placement = {"frame_size": frame_size, "device": device, "corners": corners[i], "origin": None}
+                support = ((inv_mask_erosions[j, 0] > 0) | (inv_soft_masks[j, 0] > 0)).nonzero()
+                if len(support):
+                    ty0, tx0 = support.min(0).values.tolist()
+                    ty1, tx1 = (support.max(0).values + 1).tolist()
+                    placement["origin"] = (x0 + tx0, y0 + ty0)
+                    placement["hard"] = inv_mask_erosions[j, :, ty0:ty1, tx0:tx1]
+                    placement["soft"] = inv_soft_masks[j, :, ty0:ty1, tx0:tx1]
+                new_placements[i] = placement
+            placements = [new_placements[p["index"]] if "index" in p else p for p in placements]
+            # The last placement is the reference of the next chunk
+            self.mask_cache = new_placements[recompute[-1]]
+
+        hard_masks = torch.zeros((n, 1, roi_h, roi_w), device=device)
+        soft_masks = torch.zeros((n, 1, roi_h, roi_w), device=device)
+        groups = OrderedDict()
+        for i, placement in enumerate(placements):
+            groups.setdefault(id(placement), (placement, []))[1].append(i)
+        for placement, frames in groups.values():
+            if placement["origin"] is None:
+                continue
+            px0, py0 = placement["origin"]
+            py1, px1 = py0 + placement["hard"].shape[-2], px0 + placement["hard"].shape[-1]
+            # Clip the placement to this region; the masks are zero outside of either region
+            ix0, iy0, ix1, iy1 = max(px0, x0), max(py0, y0), min(px1, x0 + roi_w), min(py1, y0 + roi_h)
+            if ix0 < ix1 and iy0 < iy1:
+                hard_masks[frames, :, iy0 - y0 : iy1 - y0, ix0 - x0 : ix1 - x0] = placement["hard"][
+                    :, iy0 - py0 : iy1 - py0, ix0 - px0 : ix1 - px0
+                ]
+                soft_masks[frames, :, iy0 - y0 : iy1 - y0, ix0 - x0 : ix1 - x0] = placement["soft"][
+                    :, iy0 - py0 : iy1 - py0, ix0 - px0 : ix1 - px0
+                ]
+        return hard_masks, soft_masks
+
 
 class laplacianSmooth:
     def __init__(self, smoothAlpha=0.3):
@@ -136,3 +375,18 @@ class laplacianSmooth:
         self.pts_last = pts_update.copy()
 
         return pts_update
+
+    def smooth_batch(self, pts_seq):
+        """Smooth a [n, k, 2] landmark sequence; equivalent to calling `smooth` on every frame in order."""
+        pts_seq = np.asarray(pts_seq, dtype=np.float64)
+        out = np.empty_like(pts_seq)
+        widths = pts_seq[:, :, 0].max(axis=1) - pts_seq[:, :, 0].min(axis=1)
+        for i, pts_cur in enumerate(pts_seq):
+            if self.pts_last is None:
+                out[i] = pts_cur
+            else:
+                tmp = ((pts_cur - self.pts_last) ** 2).sum(axis=1, keepdims=True)
+                w = np.exp(-tmp / (widths[i] * self.smoothAlpha))
+                out[i] = self.pts_last * w + pts_cur * (1 - w)
+            self.pts_last = out[i].copy()
+        return out
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import torch
+
+
+def default_cache_root() -> str:
+    return os.environ.get("LATENTSYNC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "latentsync"))
+
+
+def hash_array(array: np.ndarray) -> str:
+    """Content hash of an array (shape and dtype are part of the hash)."""
+    digest = hashlib.sha1(f"{array.shape}{array.dtype}".encode())
+    digest.update(memoryview(np.ascontiguousarray(array)).cast("B"))
+    return digest.hexdigest()
+
+
+def hash_strings(parts: Iterable[Any]) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskLRUCache:
+    """Size-bounded on-disk cache of torch-serializable values.
+
+    Entries are written atomically (temp file + rename) so concurrent readers never see a
+    partial file, and the least recently used entries (by mtime, refreshed on every hit) are
+    evicted once the directory grows beyond `max_bytes`. With `memory_entries` > 0 the most
+    recently used values are also kept in memory, so hot entries skip deserialization; values
+    returned from the memory tier are shared and must not be modified in place.
+    """
+
+    def __init__(self, root: str, max_bytes: int, memory_entries: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self.memory_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key + ".pt")
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+        path = self._path(key)
+        try:
+            value = torch.load(path, map_location="cpu")
+            os.utime(path)
+        except FileNotFoundError:
+            value = None
+        except Exception as e:
+            print(f"Dropping unreadable cache entry {path}: {type(e).__name__} - {e}")
+            self._remove(path)
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key: str, value) -> None:
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key: str, value) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable) -> None:
+        """Store several (key, value) pairs and evict once afterwards."""
+        for key, value in items:
+            with self._lock:
+                self._remember(key, value)
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    torch.save(value, f)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                self._remove(tmp_path)
+                raise
+        self.evict_to(self.max_bytes)
+
+    def evict_to(self, max_bytes: int) -> None:
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.root):
+                if entry.name.endswith(".pt"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        self.evict_to(0)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+_caches: Dict[str, DiskLRUCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, default_mb: int, root: Optional[str] = None, memory_entries: int = 0) -> DiskLRUCache:
+    """Process-wide cache named `name`; its budget can be overridden with LATENTSYNC_<NAME>_CACHE_MB."""
+    with _caches_lock:
+        if name not in _caches:
+            max_mb = int(os.environ.get(f"LATENTSYNC_{name.upper()}_CACHE_MB", default_mb))
+            _caches[name] = DiskLRUCache(
+                os.path.join(root or default_cache_root(), name), max_mb * 1024**2, memory_entries=memory_entries
+            )
+        return _caches[name]
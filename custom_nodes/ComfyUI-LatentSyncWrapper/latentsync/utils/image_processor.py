@@ -21,6 +21,7 @@ import torch
 import numpy as np
 from typing import Union
 from .affine_transform import AlignRestore, laplacianSmooth
+from .model_registry import get_registry
 import face_alignment
 
 """
@@ -43,6 +44,7 @@ class ImageProcessor:
         )
         self.normalize = transforms.Normalize([0.5], [0.5], inplace=True)
         self.mask = mask
+        self.device = device
 
         if mask in ["mouth", "face", "eye"]:
             self.face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True)  # Process single image
@@ -57,8 +59,13 @@ class ImageProcessor:
                 self.mask_image = mask_image
 
             if device != "cpu":
-                self.fa = face_alignment.FaceAlignment(
-                    face_alignment.LandmarksType.TWO_D, flip_input=False, device=device
+                # One detector per device for the whole process, accounted with the other models
+                self.fa = get_registry().get(
+                    "face_alignment",
+                    str(device),
+                    lambda: face_alignment.FaceAlignment(
+                        face_alignment.LandmarksType.TWO_D, flip_input=False, device=device
+                    ),
                 )
                 self.face_mesh = None
             else:
@@ -150,6 +157,80 @@ class ImageProcessor:
         face = rearrange(torch.from_numpy(face), "h w c -> c h w")
         return face, box, affine_matrix
 
+    def detect_landmarks_batch(self, images: torch.Tensor, batch_size: int = 16):
+        """Return one [68, 2] landmark array (or None) per image of a uint8 [n, c, h, w] batch."""
+        landmarks = []
+        for start in range(0, images.shape[0], batch_size):
+            batch = images[start : start + batch_size]
+            if self.fa is None:
+                for image in batch:
+                    landmark_coordinates = self.detect_facial_landmarks(rearrange(image, "c h w -> h w c").numpy())
+                    if landmark_coordinates is None:
+                        landmarks.append(None)
+                    else:
+                        landmarks.append(mediapipe_lm478_to_face_alignment_lm68(landmark_coordinates))
+                continue
+            # The face detector runs on the whole batch in one forward pass
+            detected = self.fa.get_landmarks_from_batch(batch.to(self.device, dtype=torch.float32))
+            if detected is None:
+                detected = [[]] * len(batch)
+            for lm in detected:
+                landmarks.append(lm[:68] if len(lm) > 0 else None)
+        return landmarks
+
+    def align_faces_batch(self, images: Union[torch.Tensor, np.ndarray], landmarks, index=None, batch_size: int = 16):
+        """Crop the aligned faces of a clip from its landmark sequence.
+
+        Face i is cropped from `images[index[i]]` (`images[i]` without `index`) with `landmarks[i]`;
+        images are uint8 frames [n, h, w, c] or [n, c, h, w]. The landmarks are smoothed and the warp
+        bias averaged from frame to frame, so they must be given in playback order, repeats included.
+        Returns uint8 faces [n, c, res, res], the boxes and the [n, 2, 3] affine matrices.
+        """
+        if isinstance(images, np.ndarray):
+            images = torch.from_numpy(images)
+        if index is None:
+            index = np.arange(len(landmarks))
+        for i, lm68 in enumerate(landmarks):
+            if lm68 is None:
+                raise RuntimeError(f"Face not detected in frame {i}")
+
+        points = self.smoother.smooth_batch(np.stack(landmarks))
+        lmk3 = np.stack(
+            [points[:, 17:22].mean(1), points[:, 22:27].mean(1), points[:, 27:36].mean(1)], axis=1
+        )
+
+        faces = []
+        affine_matrices = []
+        for start in range(0, len(index), batch_size):
+            batch = images[torch.as_tensor(np.asarray(index[start : start + batch_size]))]
+            if batch.shape[-1] == 3:
+                batch = rearrange(batch, "b h w c -> b c h w")
+            face, affine_matrix = self.restorer.align_warp_faces(
+                batch.to(self.device, dtype=torch.float32),
+                lmk3[start : start + batch_size],
+                smooth=True,
+                out_size=(self.resolution, self.resolution),
+            )
+            faces.append(face.round().clamp(0, 255).to(torch.uint8).cpu())
+            affine_matrices.extend(affine_matrix)
+
+        box = [0, 0, self.restorer.face_size[0], self.restorer.face_size[1]]  # x1, y1, x2, y2
+        boxes = [box] * len(affine_matrices)
+        return torch.cat(faces), boxes, affine_matrices
+
+    def affine_transform_batch(self, images: Union[torch.Tensor, np.ndarray], batch_size: int = 16):
+        """Batched `affine_transform` over a whole clip.
+
+        images: uint8 frames [n, h, w, c] or [n, c, h, w]. Returns uint8 faces [n, c, res, res],
+        the boxes and the [n, 2, 3] affine matrices.
+        """
+        if isinstance(images, np.ndarray):
+            images = torch.from_numpy(images)
+        if images.shape[-1] == 3:
+            images = rearrange(images, "b h w c -> b c h w")
+        landmarks = self.detect_landmarks_batch(images, batch_size)
+        return self.align_faces_batch(images, landmarks, batch_size=batch_size)
+
     def preprocess_fixed_mask_image(self, image: torch.Tensor, affine_transform=False):
         if affine_transform:
             result = self.affine_transform(image)
@@ -0,0 +1,194 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import torch
+
+
+def free_device_memory(device) -> Optional[int]:
+    """Free memory of `device` as reported by ComfyUI's model management, or by CUDA outside of ComfyUI."""
+    device = torch.device(device)
+    try:
+        import comfy.model_management as model_management
+
+        return model_management.get_free_memory(device)
+    except ImportError:
+        if device.type != "cuda" or not torch.cuda.is_available():
+            return None
+        return torch.cuda.mem_get_info(device)[0]
+
+
+class GpuAdmission:
+    """Admission control for the GPU phases of concurrent jobs sharing one model instance.
+
+    A phase declares its estimated device memory and is admitted, in arrival order, once the
+    estimates of all admitted phases fit in `headroom` of the memory that was free while no phase
+    ran (or in a fixed `budget_bytes`). Phases without an estimate run alone.
+    """
+
+    def __init__(
+        self,
+        device="cuda",
+        headroom: float = 0.9,
+        budget_bytes: Optional[int] = None,
+        free_memory: Callable = free_device_memory,
+    ):
+        self.device = device
+        self.headroom = headroom
+        self.budget_bytes = budget_bytes
+        self._free_memory = free_memory
+        self._idle_budget = budget_bytes
+        self._cond = threading.Condition()
+        self._waiting = collections.deque()
+        self.in_flight = 0
+        self.reserved = 0
+        # Set while a phase without an estimate runs; nothing else is admitted next to it
+        self.exclusive = False
+        self.admitted = 0
+        self.max_in_flight = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _fits(self, estimate_bytes) -> bool:
+        if self.in_flight == 0:
+            return True
+        if self.exclusive or estimate_bytes is None or self._idle_budget is None:
+            return False
+        return self.reserved + estimate_bytes <= self._idle_budget
+
+    @contextmanager
+    def admit(self, estimate_bytes: Optional[int] = None):
+        start = time.perf_counter()
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            while self._waiting[0] is not ticket or not self._fits(estimate_bytes):
+                self._cond.wait()
+            self._waiting.popleft()
+            if self.in_flight == 0 and self.budget_bytes is None:
+                free_memory = self._free_memory(self.device)
+                self._idle_budget = None if free_memory is None else free_memory * self.headroom
+            self.in_flight += 1
+            self.reserved += estimate_bytes or 0
+            self.exclusive = estimate_bytes is None
+            waited = time.perf_counter() - start
+            self.admitted += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            # The next phase in line may fit as well
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self.reserved -= estimate_bytes or 0
+                if estimate_bytes is None:
+                    self.exclusive = False
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "admitted": self.admitted,
+                "mean_wait_seconds": self.wait_seconds / self.admitted if self.admitted else 0.0,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+_gpu_admission = None
+_gpu_admission_lock = threading.Lock()
+
+
+def get_gpu_admission() -> GpuAdmission:
+    """Process-wide admission control shared by every pipeline call."""
+    global _gpu_admission
+    with _gpu_admission_lock:
+        if _gpu_admission is None:
+            _gpu_admission = GpuAdmission()
+        return _gpu_admission
+
+
+class JobScheduler:
+    """Run up to `max_jobs` jobs concurrently and report queue depth, wait times and throughput.
+
+    The CPU stages of the admitted jobs overlap freely; their GPU phases go through `gpu_admission`.
+    """
+
+    def __init__(self, process: Callable, max_jobs: int = 2, gpu_admission: Optional[GpuAdmission] = None):
+        self.process = process
+        self.max_jobs = max_jobs
+        self.gpu_admission = gpu_admission
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="latentsync-job")
+        self._lock = threading.Lock()
+        self._first_submit = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def submit(self, *args, **kwargs) -> Future:
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            if self._first_submit is None:
+                self._first_submit = submitted
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.queue_wait_seconds += started - submitted
+                self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, started - submitted)
+            succeeded = False
+            try:
+                result = self.process(*args, **kwargs)
+                succeeded = True
+                return result
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.run_seconds += time.perf_counter() - started
+                    if succeeded:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        return self._executor.submit(run)
+
+    def run(self, *args, **kwargs):
+        return self.submit(*args, **kwargs).result()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            finished = self.completed + self.failed
+            started = finished + self.running
+            elapsed = time.perf_counter() - self._first_submit if self._first_submit is not None else 0.0
+            stats = {
+                "max_jobs": self.max_jobs,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "mean_queue_wait_seconds": self.queue_wait_seconds / started if started else 0.0,
+                "max_queue_wait_seconds": self.max_queue_wait_seconds,
+                "mean_run_seconds": self.run_seconds / finished if finished else 0.0,
+                "throughput_jobs_per_minute": 60.0 * self.completed / elapsed if elapsed > 0 else 0.0,
+            }
+        if self.gpu_admission is not None:
+            stats["gpu"] = self.gpu_admission.stats()
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
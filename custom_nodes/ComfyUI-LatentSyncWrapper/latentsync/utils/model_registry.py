@@ -0,0 +1,228 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import torch
+
+
+def held_modules(component) -> List[torch.nn.Module]:
+    """The component itself if it is a module, else the modules it holds up to two attributes deep
+    (e.g. `Audio2Feature.model`, or the detector and landmark networks of a FaceAlignment)."""
+    if isinstance(component, torch.nn.Module):
+        return [component]
+    modules = []
+    for value in getattr(component, "__dict__", {}).values():
+        if isinstance(value, torch.nn.Module):
+            modules.append(value)
+        else:
+            modules += [v for v in getattr(value, "__dict__", {}).values() if isinstance(v, torch.nn.Module)]
+    return modules
+
+
+def module_nbytes(component) -> int:
+    """Sum the size of all parameters and buffers of the modules a component holds."""
+    tensors = {}
+    for module in held_modules(component):
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            tensors[id(tensor)] = tensor
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+
+def config_key(config) -> str:
+    """Stable string key for a (possibly OmegaConf) model config."""
+    try:
+        from omegaconf import OmegaConf
+
+        if OmegaConf.is_config(config):
+            config = OmegaConf.to_container(config, resolve=True)
+    except ImportError:
+        pass
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+@dataclass
+class ComponentRecord:
+    name: str
+    key: Hashable
+    value: Any
+    loader: Callable[[], Any] = field(repr=False)
+    requires: Tuple[Tuple[str, Hashable], ...] = ()
+    load_seconds: float = 0.0
+    param_bytes: int = 0
+    cuda_bytes: int = 0
+    hits: int = 0
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "load_seconds": round(self.load_seconds, 3),
+            "param_mb": round(self.param_bytes / 1024**2, 1),
+            "cuda_mb": round(self.cuda_bytes / 1024**2, 1),
+            "hits": self.hits,
+        }
+
+
+class ModelRegistry:
+    """Process-resident store of loaded model components.
+
+    Each component is loaded once per (name, key) and reused by every later call in the
+    same process. `evict` drops components so that their memory can be reclaimed and
+    `reload` forces a fresh load with the loader that originally created them; they are the
+    hooks for freeing or refreshing models of a running worker, e.g.
+    `get_registry().evict("unet")` also drops the pipelines built on that UNet.
+    """
+
+    def __init__(self):
+        self._records: Dict[Tuple[str, Hashable], ComponentRecord] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str, key: Hashable, loader: Callable[[], Any], requires=()):
+        """Return the component stored under (name, key), loading it with `loader` on a miss.
+
+        `requires` lists the (name, key) pairs the component holds references to; evicting
+        any of them evicts this component as well.
+        """
+        with self._lock:
+            record = self._records.get((name, key))
+            if record is not None:
+                record.hits += 1
+                return record.value
+            record = self._load(name, key, loader)
+            record.requires = tuple(requires)
+            self._records[(name, key)] = record
+            return record.value
+
+    def _load(self, name: str, key: Hashable, loader: Callable[[], Any]) -> ComponentRecord:
+        cuda_before = torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+        start = time.perf_counter()
+        value = loader()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        load_seconds = time.perf_counter() - start
+        cuda_after = torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+        record = ComponentRecord(
+            name=name,
+            key=key,
+            value=value,
+            loader=loader,
+            load_seconds=load_seconds,
+            param_bytes=module_nbytes(value),
+            cuda_bytes=max(cuda_after - cuda_before, 0),
+        )
+        print(
+            f"Loaded {name} in {record.load_seconds:.2f}s "
+            f"({record.param_bytes / 1024**2:.1f} MB weights, {record.cuda_bytes / 1024**2:.1f} MB CUDA)"
+        )
+        return record
+
+    def contains(self, name: str, key: Hashable) -> bool:
+        with self._lock:
+            return (name, key) in self._records
+
+    def evict(self, name: Optional[str] = None, key: Optional[Hashable] = None) -> List[str]:
+        """Drop every component matching `name` and/or `key` (all components if both are None)."""
+        with self._lock:
+            matches = [
+                k for k in self._records if (name is None or k[0] == name) and (key is None or k[1] == key)
+            ]
+            pending = list(matches)
+            while pending:
+                evicted = pending.pop()
+                self._records.pop(evicted, None)
+                for k, record in list(self._records.items()):
+                    if evicted in record.requires and k not in matches:
+                        matches.append(k)
+                        pending.append(k)
+        if matches and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return [k[0] for k in matches]
+
+    def reload(self, name: str, key: Hashable):
+        with self._lock:
+            record = self._records.get((name, key))
+            if record is None:
+                raise KeyError(f"{name} is not loaded for key {key}")
+            loader, requires = record.loader, record.requires
+        self.evict(name, key)
+        return self.get(name, key, loader, requires=requires)
+
+    def clear(self):
+        self.evict()
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [record.stats() for record in self._records.values()]
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
+
+
+def load_lipsync_pipeline(
+    config,
+    inference_ckpt_path: str,
+    scheduler_config_path: str,
+    whisper_ckpt_path: str,
+    dtype: torch.dtype = torch.float16,
+    device: str = "cuda",
+    registry: Optional[ModelRegistry] = None,
+):
+    """Return a LipsyncPipeline whose components are shared through the registry."""
+    from diffusers import AutoencoderKL, DDIMScheduler
+    from omegaconf import OmegaConf
+
+    from ..models.unet import UNet3DConditionModel
+    from ..pipelines.lipsync_pipeline import LipsyncPipeline
+    from ..whisper.audio2feature import Audio2Feature
+
+    registry = registry or _registry
+
+    if config.model.cross_attention_dim not in (768, 384):
+        raise NotImplementedError("cross_attention_dim must be 768 or 384")
+
+    unet_key = (config_key(config.model), inference_ckpt_path, str(dtype), device)
+    whisper_key = (whisper_ckpt_path, device, config.data.num_frames)
+    vae_key = ("stabilityai/sd-vae-ft-mse", str(dtype), device)
+
+    def load_scheduler():
+        return DDIMScheduler.from_pretrained(scheduler_config_path)
+
+    def load_audio_encoder():
+        return Audio2Feature(model_path=whisper_ckpt_path, device=device, num_frames=config.data.num_frames)
+
+    def load_vae():
+        vae = AutoencoderKL.from_pretrained("stabilityai/sd-vae-ft-mse", torch_dtype=dtype)
+        vae.config.scaling_factor = 0.18215
+        vae.config.shift_factor = 0
+        return vae.to(device)
+
+    def load_unet():
+        unet, _ = UNet3DConditionModel.from_pretrained(
+            OmegaConf.to_container(config.model),
+            inference_ckpt_path,  # load checkpoint
+            device="cpu",
+        )
+        return unet.to(device=device, dtype=dtype)
+
+    def load_pipeline():
+        return LipsyncPipeline(
+            vae=registry.get("vae", vae_key, load_vae),
+            audio_processor=None,
+            audio_encoder=registry.get("audio_encoder", whisper_key, load_audio_encoder),
+            unet=registry.get("unet", unet_key, load_unet),
+            scheduler=registry.get("scheduler", scheduler_config_path, load_scheduler),
+        ).to(device)
+
+    requires = (
+        ("vae", vae_key),
+        ("audio_encoder", whisper_key),
+        ("unet", unet_key),
+        ("scheduler", scheduler_config_path),
+    )
+    pipeline_key = (unet_key, whisper_key, vae_key, scheduler_config_path)
+    return registry.get("pipeline", pipeline_key, load_pipeline, requires=requires)
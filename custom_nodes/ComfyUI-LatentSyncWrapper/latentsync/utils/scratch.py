@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Optional
+
+TMPFS_ROOT = "/dev/shm"
+
+
+def default_scratch_root(tmpfs: Optional[bool] = None) -> str:
+    """Where job scratch directories are created.
+
+    LATENTSYNC_SCRATCH_DIR wins; otherwise tmpfs (/dev/shm) is used when requested, either by `tmpfs`
+    or by LATENTSYNC_SCRATCH_TMPFS=1, and available, and the system temp dir in every other case.
+    """
+    root = os.environ.get("LATENTSYNC_SCRATCH_DIR")
+    if root:
+        os.makedirs(root, exist_ok=True)
+        return root
+    if tmpfs is None:
+        tmpfs = os.environ.get("LATENTSYNC_SCRATCH_TMPFS", "0") == "1"
+    if tmpfs and os.path.isdir(TMPFS_ROOT) and os.access(TMPFS_ROOT, os.W_OK):
+        return TMPFS_ROOT
+    return tempfile.gettempdir()
+
+
+class JobScratch:
+    """Private scratch directory of one job.
+
+    Every job gets its own uniquely named directory, so concurrent jobs in one process or in one
+    container never share temp paths. The directory and everything in it is removed by `cleanup`,
+    when leaving the context, or at the latest when the object is garbage collected.
+    """
+
+    def __init__(self, prefix: str = "latentsync-", root: Optional[str] = None, tmpfs: Optional[bool] = None):
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=root or default_scratch_root(tmpfs))
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, ignore_errors=True)
+
+    def file(self, name: str) -> str:
+        """Path of `name` inside the scratch directory (not created)."""
+        return os.path.join(self.path, name)
+
+    def subdir(self, name: str) -> str:
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self) -> None:
+        self._finalizer()
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+    def __repr__(self):
+        return f"JobScratch({self.path!r})"
@@ -0,0 +1,183 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import torch
+
+_DONE = object()
+
+
+class StageStats:
+    """Busy time and item count of one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.busy_seconds = 0.0
+        self.items = 0
+
+    def add(self, seconds: float, items: int = 1) -> None:
+        self.busy_seconds += seconds
+        self.items += items
+
+    def summary(self, wall_seconds: float) -> Dict[str, float]:
+        return {
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items": self.items,
+            "utilization": round(self.busy_seconds / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        }
+
+
+def timed_iter(iterable: Iterable, stats: StageStats):
+    """Serial counterpart of `Prefetcher`: iterate in the calling thread and time every item."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        stats.add(time.perf_counter() - start)
+        yield item
+
+
+def timed_call(func: Callable, stats: StageStats):
+    """Serial counterpart of `StageWorker.submit`."""
+
+    def call(item):
+        start = time.perf_counter()
+        func(item)
+        stats.add(time.perf_counter() - start)
+
+    return call
+
+
+class Prefetcher:
+    """Run an iterator on a background thread, keeping at most `maxsize` items ahead of the consumer.
+
+    Exceptions raised by the iterator are re-raised in the consuming thread.
+    """
+
+    def __init__(self, iterable: Iterable, maxsize: int = 2, stats: Optional[StageStats] = None):
+        self.stats = stats or StageStats("prefetch")
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, args=(iter(iterable),), daemon=True)
+        self._thread.start()
+
+    def _run(self, iterator):
+        # Grad mode is thread local
+        with torch.no_grad():
+            try:
+                while not self._stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    self.stats.add(time.perf_counter() - start)
+                    self._put((item, None))
+            except BaseException as e:
+                self._put((_DONE, e))
+                return
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+        self._put((_DONE, None))
+
+    def _put(self, entry):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        item, error = self._queue.get()
+        if item is _DONE:
+            self._finished = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        self._stop.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StageWorker:
+    """Apply `func` to submitted items, in order, on a background thread with a bounded queue.
+
+    `submit` blocks while `maxsize` items are pending. An exception raised by `func` is re-raised
+    by the next `submit` or by `close`; leaving the context on an exception drops pending items.
+    """
+
+    def __init__(self, func: Callable, maxsize: int = 2, stats: Optional[StageStats] = None):
+        self.stats = stats or StageStats(getattr(func, "__name__", "worker"))
+        self._func = func
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with torch.no_grad():
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                if self._error is not None or self._cancelled:
+                    continue
+                start = time.perf_counter()
+                try:
+                    self._func(item)
+                except BaseException as e:
+                    self._error = e
+                self.stats.add(time.perf_counter() - start)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, item) -> None:
+        while True:
+            self._raise_error()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, cancel: bool = False) -> None:
+        self._cancelled = self._cancelled or cancel
+        self._queue.put(_DONE)
+        self._thread.join()
+        if not cancel:
+            self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(cancel=exc_type is not None)
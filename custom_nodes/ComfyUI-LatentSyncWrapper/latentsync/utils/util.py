@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+import re
 import imageio
 import numpy as np
 import json
@@ -30,8 +31,9 @@ from tqdm import tqdm
 from einops import rearrange
 import cv2
 from decord import AudioReader, VideoReader
-import shutil
 import subprocess
+import tempfile
+import soundfile as sf
 
 
 # Machine epsilon for a float32 (single precision)
@@ -44,33 +46,134 @@ def read_json(filepath: str):
     return json_dict
 
 
+def probe_video(video_path: str):
+    """Displayed (width, height) and duration in seconds of the first video stream, from `ffmpeg -i`."""
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostdin", "-i", video_path], capture_output=True, text=True, errors="replace"
+    )
+    info = result.stderr
+    stream = re.search(r"Stream #.*?: Video: (.*)", info)
+    size = re.search(r", (\d+)x(\d+)[\s,\[]", stream.group(1) + " ") if stream else None
+    if size is None:
+        raise IOError(f"Could not find a video stream in {video_path}: {info.strip().splitlines()[-1:]}")
+    width, height = int(size.group(1)), int(size.group(2))
+
+    # ffmpeg applies the rotation metadata when decoding
+    rotation = re.search(r"rotate\s*:\s*(-?\d+)|rotation of (-?[\d.]+) degrees", info[stream.start() :])
+    if rotation and round(float(rotation.group(1) or rotation.group(2))) % 180 == 90:
+        width, height = height, width
+
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", info)
+    seconds = None
+    if duration:
+        seconds = int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3))
+    return width, height, seconds
+
+
+def stderr_log(scratch_dir: str = None):
+    """Unnamed temp file (in `scratch_dir` if given) for the stderr of an ffmpeg that streams frames.
+
+    A stderr pipe that is only read once ffmpeg exits can fill up with error lines, after which ffmpeg
+    blocks on it and never finishes the stdin/stdout the caller waits on; a file can't fill up.
+    """
+    return tempfile.TemporaryFile(dir=scratch_dir)
+
+
+def read_stderr_log(log) -> str:
+    log.seek(0)
+    text = log.read().decode(errors="replace").strip()
+    log.close()
+    return text
+
+
+def open_video_pipe(video_path: str, fps: int = None, scratch_dir: str = None):
+    """Start ffmpeg decoding `video_path` to rgb24 rawvideo on stdout, resampled to `fps` if given.
+
+    Returns the process and the probed (width, height, duration); no frames are written to disk.
+    """
+    width, height, duration = probe_video(video_path)
+    command = ["ffmpeg", "-loglevel", "error", "-nostdin", "-i", video_path]
+    if fps is not None:
+        command += ["-r", str(fps)]
+    command += ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    log = stderr_log(scratch_dir)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+    process.stderr_log = log
+    return process, (width, height, duration)
+
+
+def close_video_pipe(process, video_path: str, check: bool = True):
+    """Wait for the decoder; with `check` a failed decode raises, otherwise ffmpeg is stopped early."""
+    if not check:
+        process.kill()
+    process.stdout.close()
+    return_code = process.wait()
+    error = read_stderr_log(process.stderr_log)
+    if return_code != 0 and check:
+        raise RuntimeError(f"ffmpeg failed to decode {video_path}: {error}")
+
+
+def read_video_ffmpeg(video_path: str, fps: int = 25, scratch_dir: str = None):
+    """Decode a whole video into one uint8 array [f, h, w, c] straight from an ffmpeg rawvideo pipe.
+
+    The array is allocated from the probed duration and only grown if ffmpeg delivers more frames.
+    """
+    process, (width, height, duration) = open_video_pipe(video_path, fps, scratch_dir)
+    frame_bytes = width * height * 3
+    capacity = int((duration or 0) * (fps or 30)) + (fps or 30)
+    frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+    filled = 0  # bytes
+    completed = False
+    try:
+        while True:
+            if filled == frames.nbytes:
+                frames = np.concatenate([frames, np.empty_like(frames[: max(capacity // 2, 16)])])
+            read = process.stdout.readinto(memoryview(frames.reshape(-1))[filled:])
+            if not read:
+                break
+            filled += read
+        completed = True
+    finally:
+        close_video_pipe(process, video_path, check=completed)
+    print(f"Read {filled // frame_bytes} frames from video")
+    return frames[: filled // frame_bytes]
+
+
 def read_video(video_path: str, change_fps=True, use_decord=True):
     if change_fps:
-        # Create temp directory next to the video file
-        temp_dir = os.path.join(os.path.dirname(video_path), "temp")
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Normalize paths for Windows
-        video_path = os.path.normpath(video_path).replace('\\', '/')
-        temp_video = os.path.join(temp_dir, 'video.mp4').replace('\\', '/')
-        
-        # Use proper path quoting for FFmpeg
-        command = f'ffmpeg -loglevel error -y -nostdin -i "{video_path}" -r 25 -crf 18 "{temp_video}"'
-        
-        print(f"Running FFmpeg command: {command}")
-        subprocess.run(command, shell=True, check=True)
-        target_video_path = temp_video
-    else:
-        target_video_path = video_path
+        # One decode at 25 fps, without an intermediate file
+        return read_video_ffmpeg(video_path, fps=25)
 
-    print(f"Reading video from: {target_video_path}")
+    print(f"Reading video from: {video_path}")
     
     if use_decord:
-        return read_video_decord(target_video_path)
+        return read_video_decord(video_path)
     else:
-        return read_video_cv2(target_video_path)
+        return read_video_cv2(video_path)
+
+
+def iter_video_frames(video_path: str, chunk_size: int = 16, change_fps=True, scratch_dir: str = None):
+    """Yield the RGB frames of a video in uint8 chunks [f, h, w, c] without decoding the whole clip."""
+    process, (width, height, _) = open_video_pipe(video_path, 25 if change_fps else None, scratch_dir)
+    frame_bytes = width * height * 3
+    completed = False
+    try:
+        while True:
+            chunk = np.empty((chunk_size, height, width, 3), dtype=np.uint8)
+            view = memoryview(chunk.reshape(-1))
+            filled = 0
+            while filled < len(view):
+                read = process.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled >= frame_bytes:
+                yield chunk[: filled // frame_bytes]
+            if filled < len(view):
+                break
+        completed = True
+    finally:
+        close_video_pipe(process, video_path, check=completed)
 
 
 def read_video_decord(video_path: str):
@@ -136,6 +239,85 @@ def write_video(video_output_path: str, video_frames: np.ndarray, fps: int):
     out.release()
 
 
+class StreamingVideoWriter:
+    """Encode RGB frames into an H.264/AAC file with a single ffmpeg process.
+
+    Frames are piped to ffmpeg as raw rgb24 as soon as they are written, so memory is bounded by
+    the chunk size instead of the clip length. The audio, if any, is muxed as a second input; its
+    temporary wav goes to `scratch_dir` (the job's scratch directory) when given.
+    """
+
+    def __init__(
+        self,
+        video_output_path: str,
+        width: int,
+        height: int,
+        fps: int = 25,
+        audio_samples: np.ndarray = None,
+        audio_sample_rate: int = 16000,
+        scratch_dir: str = None,
+    ):
+        self.width = width
+        self.height = height
+        self.frame_count = 0
+        self.audio_path = None
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error", "-nostdin",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+        ]  # fmt: skip
+        if audio_samples is not None:
+            fd, self.audio_path = tempfile.mkstemp(suffix=".wav", dir=scratch_dir)
+            os.close(fd)
+            sf.write(self.audio_path, audio_samples, audio_sample_rate)
+            # -shortest cuts the audio to the frames actually written when the clip length is not known upfront
+            command += ["-i", self.audio_path, "-c:a", "aac", "-q:a", "0", "-shortest"]
+        command += ["-c:v", "libx264", "-pix_fmt", "yuv420p", video_output_path]
+        self.stderr_log = stderr_log(scratch_dir)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self.stderr_log)
+
+    def write(self, video_frames: np.ndarray):
+        """Append uint8 RGB frames of shape [f, h, w, 3] (or a single [h, w, 3] frame)."""
+        video_frames = np.ascontiguousarray(video_frames, dtype=np.uint8)
+        if video_frames.ndim == 3:
+            video_frames = video_frames[None]
+        if video_frames.shape[1:] != (self.height, self.width, 3):
+            raise ValueError(f"Expected frames of shape {(self.height, self.width, 3)}, got {video_frames.shape[1:]}")
+        try:
+            self.process.stdin.write(memoryview(video_frames).cast("B"))
+        except BrokenPipeError:
+            self.close()
+            raise
+        self.frame_count += len(video_frames)
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        return_code = self.process.wait()
+        stderr = read_stderr_log(self.stderr_log) if not self.stderr_log.closed else ""
+        if self.audio_path is not None:
+            if os.path.exists(self.audio_path):
+                os.remove(self.audio_path)
+            self.audio_path = None
+        if return_code != 0:
+            raise RuntimeError(f"ffmpeg exited with code {return_code}: {stderr.strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.process.kill()
+            try:
+                self.close()
+            except RuntimeError:
+                pass
+
+
 def init_dist(backend="nccl", **kwargs):
     """Initializes distributed environment."""
     rank = int(os.environ["RANK"])
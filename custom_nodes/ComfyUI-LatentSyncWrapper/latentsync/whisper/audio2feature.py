@@ -1,6 +1,8 @@
 # Adapted from https://github.com/TMElyralab/MuseTalk/blob/main/musetalk/whisper/audio2feature.py
 
 from .whisper import load_model
+from .whisper.audio import load_audio
+from ..utils.cache import DiskLRUCache, hash_array, hash_strings
 import numpy as np
 import torch
 import os
@@ -15,7 +17,9 @@ class Audio2Feature:
         num_frames=16,
     ):
         self.model = load_model(model_path, device)
+        self.model_path = model_path
         self.audio_cache_dir = audio_cache_dir
+        self.audio_cache = None
         self.num_frames = num_frames
         self.embedding_dim = self.model.dims.n_audio_state
 
@@ -81,68 +85,82 @@ class Audio2Feature:
         return selected_feature, selected_idx
 
     def feature2chunks(self, feature_array, fps, audio_feat_length=[2, 2]):
-        whisper_chunks = []
-        whisper_idx_multiplier = 50.0 / fps
-        i = 0
+        """
+        Build the whisper chunk of every video frame at once
+        :param feature_array: whisper features of shape [length, layers, embedding_dim] at 50 FPS
+        :return: tensor of shape [num_frames, 50, embedding_dim], one 50*384 chunk per video frame
+        """
+        length = len(feature_array)
         print(f"video in {fps} FPS, audio idx in 50FPS")
 
-        while True:
-            start_idx = int(i * whisper_idx_multiplier)
-            selected_feature, selected_idx = self.get_sliced_feature(
-                feature_array=feature_array, vid_idx=i, audio_feat_length=audio_feat_length, fps=fps
-            )
-            # print(f"i:{i},selected_idx {selected_idx}")
-            whisper_chunks.append(selected_feature)
-            i += 1
-            if start_idx > len(feature_array):
-                break
-
-        return whisper_chunks
-
-    def _audio2feat(self, audio_path: str):
-        # get the sample rate of the audio
-        result = self.model.transcribe(audio_path)
-        embed_list = []
-        for emb in result["segments"]:
-            encoder_embeddings = emb["encoder_embeddings"]
-            encoder_embeddings = encoder_embeddings.transpose(0, 2, 1, 3)
-            encoder_embeddings = encoder_embeddings.squeeze(0)
-            start_idx = int(emb["start"])
-            end_idx = int(emb["end"])
-            emb_end_idx = int((end_idx - start_idx) / 2)
-            embed_list.append(encoder_embeddings[:emb_end_idx])
-        concatenated_array = torch.from_numpy(np.concatenate(embed_list, axis=0))
-        return concatenated_array
-
-    def audio2feat(self, audio_path):
-        if self.audio_cache_dir == "" or self.audio_cache_dir is None:
-            return self._audio2feat(audio_path)
+        # Chunks are produced up to and including the first frame whose start index is past the audio
+        vid_idx = np.arange(int(np.ceil((length + 1) * fps / 50.0)) + 2)
+        start_idx = (vid_idx * (50.0 / fps)).astype(np.int64)
+        num_chunks = int(np.argmax(start_idx > length)) + 1
+
+        return self.gather_sliced_features(feature_array, vid_idx[:num_chunks], audio_feat_length, fps)
 
-        audio_cache_path = os.path.join(self.audio_cache_dir, os.path.basename(audio_path) + ".pt")
+    def gather_sliced_features(self, feature_array, vid_idx, audio_feat_length=[2, 2], fps=25):
+        """
+        Vectorized get_sliced_feature for many video indices
+        :param vid_idx: 1-d array of video frame indices
+        :return: tensor of shape [len(vid_idx), 50, embedding_dim]
+        """
+        center_idx = (np.asarray(vid_idx) * 50 / fps).astype(np.int64)
+        offsets = np.arange(-audio_feat_length[0] * 2, (audio_feat_length[1] + 1) * 2)
+        selected_idx = np.clip(center_idx[:, None] + offsets[None, :], 0, len(feature_array) - 1)
+
+        selected_idx = torch.from_numpy(selected_idx).to(feature_array.device)
+        selected_feature = feature_array[selected_idx]  # [len(vid_idx), 10, layers, embedding_dim]
+        return selected_feature.reshape(len(center_idx), -1, self.embedding_dim)
+
+    def _audio2feat(self, audio_path):
+        # `audio_path` may also be a 16 kHz mono waveform (np.ndarray or torch.Tensor)
+        return self.model.extract_embeddings(audio_path)
+
+    def model_identity(self):
+        """Identity of the whisper checkpoint and of how it is run, used in feature cache keys."""
+        try:
+            stat = os.stat(self.model_path)
+            checkpoint = (os.path.abspath(self.model_path), stat.st_size, stat.st_mtime_ns)
+        except (OSError, TypeError):
+            checkpoint = (str(self.model_path),)
+        return (*checkpoint, self.model.device.type, self.embedding_dim)
+
+    def get_audio_cache(self):
+        if self.audio_cache is None and self.audio_cache_dir:
+            max_mb = int(os.environ.get("LATENTSYNC_WHISPER_CACHE_MB", 1024))
+            self.audio_cache = DiskLRUCache(self.audio_cache_dir, max_mb * 1024**2, memory_entries=8)
+        return self.audio_cache
+
+    def audio2feat(self, audio_path, cache=None):
+        """
+        Whisper features of an audio file or of a 16 kHz mono waveform
+        :param cache: DiskLRUCache for the features, defaults to one in `audio_cache_dir` if that is set
+        The cache key is the content hash of the 16 kHz waveform and the checkpoint identity, so the
+        same audio hits the cache whatever file it came from.
+        """
+        cache = cache if cache is not None else self.get_audio_cache()
+        if cache is None:
+            return self._audio2feat(audio_path)
 
-        if os.path.isfile(audio_cache_path):
-            try:
-                audio_feat = torch.load(audio_cache_path)
-            except Exception as e:
-                print(f"{type(e).__name__} - {e} - {audio_cache_path}")
-                os.remove(audio_cache_path)
-                audio_feat = self._audio2feat(audio_path)
-                torch.save(audio_feat, audio_cache_path)
+        if isinstance(audio_path, str):
+            audio = load_audio(audio_path)
+        elif isinstance(audio_path, torch.Tensor):
+            audio = audio_path.detach().float().cpu().numpy()
         else:
-            audio_feat = self._audio2feat(audio_path)
-            torch.save(audio_feat, audio_cache_path)
+            audio = np.asarray(audio_path, dtype=np.float32)
+        key = hash_strings([hash_array(audio), *self.model_identity()])
 
+        audio_feat = cache.get(key)
+        if audio_feat is None:
+            audio_feat = self._audio2feat(audio)
+            cache.put(key, audio_feat)
         return audio_feat
 
     def crop_overlap_audio_window(self, audio_feat, start_index):
-        selected_feature_list = []
-        for i in range(start_index, start_index + self.num_frames):
-            selected_feature, selected_idx = self.get_sliced_feature(
-                feature_array=audio_feat, vid_idx=i, audio_feat_length=[2, 2], fps=25
-            )
-            selected_feature_list.append(selected_feature)
-        mel_overlap = torch.stack(selected_feature_list)
-        return mel_overlap
+        vid_idx = np.arange(start_index, start_index + self.num_frames)
+        return self.gather_sliced_features(audio_feat, vid_idx, audio_feat_length=[2, 2], fps=25)
 
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ import torch.nn.functional as F
 from torch import Tensor
 from torch import nn
 
-from .transcribe import transcribe as transcribe_function
+from .transcribe import transcribe as transcribe_function, extract_embeddings as extract_embeddings_function
 from .decoding import detect_language as detect_language_function, decode as decode_function
 
 
@@ -140,12 +140,14 @@ class AudioEncoder(nn.Module):
         )
         self.ln_post = LayerNorm(n_state)
 
-    def forward(self, x: Tensor, include_embeddings: bool = False):
+    def forward(self, x: Tensor, include_embeddings: bool = False, embeddings_on_device: bool = False):
         """
         x : torch.Tensor, shape = (batch_size, n_mels, n_ctx)
             the mel spectrogram of the audio
         include_embeddings: bool
             whether to include intermediate steps in the output
+        embeddings_on_device: bool
+            return the intermediate steps as one tensor on the input device instead of a numpy array
         """
         x = F.gelu(self.conv1(x))
         x = F.gelu(self.conv2(x))
@@ -155,17 +157,20 @@ class AudioEncoder(nn.Module):
         x = (x + self.positional_embedding).to(x.dtype)
 
         if include_embeddings:
-            embeddings = [x.cpu().detach().numpy()]
+            embeddings = [x.detach()]
 
         for block in self.blocks:
             x = block(x)
             if include_embeddings:
-                embeddings.append(x.cpu().detach().numpy())
+                embeddings.append(x.detach())
 
         x = self.ln_post(x)
 
         if include_embeddings:
-            embeddings = np.stack(embeddings, axis=1)
+            # Stacked on device so that the host copy happens once, not once per layer
+            embeddings = torch.stack(embeddings, dim=1)
+            if not embeddings_on_device:
+                embeddings = embeddings.cpu().numpy()
             return x, embeddings
         else:
             return x
@@ -287,4 +292,5 @@ class Whisper(nn.Module):
 
     detect_language = detect_language_function
     transcribe = transcribe_function
+    extract_embeddings = extract_embeddings_function
     decode = decode_function
@@ -128,6 +128,61 @@ def transcribe(
     return dict(segments=all_segments)
 
 
+def extract_embeddings(
+        model: "Whisper",
+        audio: Union[str, np.ndarray, torch.Tensor],
+        *,
+        fp16: bool = True,
+        batch_size: int = 16,
+):
+    """
+    Compute the per-layer encoder embeddings of the whole audio with batched encoder passes
+
+    The mel spectrogram is cut into the same 3000-frame (30s) segments as `transcribe`, the segments are
+    padded and run through the encoder `batch_size` at a time, and the embeddings stay on the model device
+    until the final stacked tensor is copied to the host.
+
+    Parameters
+    ----------
+    model: Whisper
+        The Whisper model instance
+
+    audio: Union[str, np.ndarray, torch.Tensor]
+        The path to the audio file to open, or the audio waveform
+
+    fp16: bool
+        Whether to run the encoder in half precision (ignored on CPU)
+
+    batch_size: int
+        Maximum number of segments per encoder forward
+
+    Returns
+    -------
+    A tensor of shape (n_audio_frames, n_audio_layer + 1, n_audio_state) at 50 frames per second, on CPU
+    """
+    dtype = torch.float16 if fp16 and model.device != torch.device("cpu") else torch.float32
+
+    mel = log_mel_spectrogram(audio)
+    num_frames = mel.shape[-1]
+    sample_skip = 3000
+    seeks = list(range(0, num_frames, sample_skip))
+    segments = torch.stack([pad_or_trim(mel[:, seek:seek + sample_skip], N_FRAMES) for seek in seeks])
+    segments = segments.to(model.device, dtype=dtype)
+
+    embed_list = []
+    for batch_start in range(0, len(seeks), batch_size):
+        _, embeddings = model.encoder(
+            segments[batch_start:batch_start + batch_size], include_embeddings=True, embeddings_on_device=True
+        )
+        # (batch, layers, n_ctx, n_state) -> (batch, n_ctx, layers, n_state)
+        embeddings = embeddings.transpose(1, 2)
+        for seek, encoder_embeddings in zip(seeks[batch_start:batch_start + batch_size], embeddings):
+            end_seek = min(seek + sample_skip, num_frames)
+            embed_list.append(encoder_embeddings[:int((end_seek - seek) / 2)])
+
+    return torch.cat(embed_list).cpu()
+
+
 def cli():
     from . import available_models
 
@@ -11,6 +11,7 @@ import sys
 import importlib.util
 import importlib.machinery
 import argparse
+import weakref
 from omegaconf import OmegaConf
 from PIL import Image
 import shutil
@@ -39,6 +40,42 @@ def import_inference_script(script_path):
 
     return module
 
+_inference_module = None
+
+# id of a clip produced by VideoLengthAdjuster -> (weak reference to the clip, source frames, frame index map),
+# so that repeated frames are handed to the pipeline once instead of once per repeat. Tensors compare
+# elementwise, so they cannot be keys of a WeakKeyDictionary.
+_frame_sources = {}
+
+def register_frame_source(frames, source, index_map):
+    key = id(frames)
+    _frame_sources[key] = (weakref.ref(frames, lambda _: _frame_sources.pop(key, None)), source, index_map)
+
+def get_frame_source(frames):
+    """(source frames, index map) of a clip produced by VideoLengthAdjuster, or None."""
+    entry = _frame_sources.get(id(frames))
+    if entry is None or entry[0]() is not frames:
+        return None
+    return entry[1], entry[2]
+
+def frame_index_map(num_frames, target_frames, mode):
+    """Source frame of every output frame of VideoLengthAdjuster."""
+    if mode == "normal":
+        return torch.arange(num_frames)
+    if mode == "pingpong":
+        # forward then backward without repeating the endpoints
+        cycle = torch.cat([torch.arange(num_frames), torch.arange(max(num_frames - 2, 0), 0, -1)])
+    else:
+        cycle = torch.arange(num_frames)
+    return cycle[torch.arange(target_frames) % len(cycle)]
+
+def get_inference_module(script_path):
+    """Import the inference script once per process so its model registry stays warm."""
+    global _inference_module
+    if _inference_module is None:
+        _inference_module = import_inference_script(script_path)
+    return _inference_module
+
 def check_ffmpeg():
     try:
         if platform.system() == "Windows":
@@ -175,10 +212,63 @@ def setup_models():
             print(f"   with whisper/tiny.pt in: {whisper_dir}")
             raise RuntimeError("Model download failed. See instructions above.")
 
-class LatentSyncNode:
-    def __init__(self):
+_environment_ready = False
+
+def ensure_latentsync_environment():
+    """Check dependencies and checkpoints once per process instead of on every node instantiation."""
+    global _environment_ready
+    if not _environment_ready:
         check_and_install_dependencies()
         setup_models()  # This will now pre-download all required models
+        _environment_ready = True
+
+class LatentSyncNode:
+    def __init__(self):
+        ensure_latentsync_environment()
+
+    def prepare_inference(self):
+        """Return the cached inference module, the unet config and the checkpoint arguments."""
+        cur_dir = get_ext_dir()
+        ckpt_dir = os.path.join(cur_dir, "checkpoints")
+
+        if not os.path.exists(ckpt_dir):
+            print("Downloading model checkpoints... This may take a while.")
+            from huggingface_hub import snapshot_download
+            snapshot_download(repo_id="chunyu-li/LatentSync",
+                                    allow_patterns=["latentsync_unet.pt", "whisper/tiny.pt"],
+                                    local_dir=ckpt_dir, local_dir_use_symlinks=False)
+            print("Model checkpoints downloaded successfully!")
+
+        inference_script_path = os.path.join(cur_dir, "scripts", "inference.py")
+        unet_config_path = normalize_path(os.path.join(cur_dir, "configs", "unet", "second_stage.yaml"))
+
+        # Add the package root to Python path
+        package_root = os.path.dirname(cur_dir)
+        if package_root not in sys.path:
+            sys.path.insert(0, package_root)
+
+        # Add the current directory to Python path
+        if cur_dir not in sys.path:
+            sys.path.insert(0, cur_dir)
+
+        # Import the inference module (cached, models stay loaded between calls)
+        inference_module = get_inference_module(inference_script_path)
+
+        # Load the config
+        config = OmegaConf.load(unet_config_path)
+
+        checkpoint_args = dict(
+            unet_config_path=unet_config_path,
+            inference_ckpt_path=normalize_path(os.path.join(ckpt_dir, "latentsync_unet.pt")),
+            scheduler_config_path=normalize_path(os.path.join(cur_dir, "configs")),
+            whisper_ckpt_path=normalize_path(os.path.join(ckpt_dir, "whisper", "tiny.pt")),
+        )
+        return inference_module, config, checkpoint_args
+
+    def warmup(self):
+        """Load every model component into the process-wide registry ahead of the first request."""
+        inference_module, config, checkpoint_args = self.prepare_inference()
+        inference_module.load_pipeline(config, argparse.Namespace(**checkpoint_args))
 
     @classmethod
     def INPUT_TYPES(s):
@@ -195,74 +285,33 @@ class LatentSyncNode:
     FUNCTION = "inference"
 
     def inference(self, images, audio, seed):
-        # Existing inference logic
+        # Frames and audio are handed to the pipeline in memory; nothing is encoded to disk
         torch.cuda.empty_cache()
-        cur_dir = get_ext_dir()
-        ckpt_dir = os.path.join(cur_dir, "checkpoints")
-        output_dir = folder_paths.get_output_directory()
-        temp_dir = os.path.join(output_dir, "temp_frames")
-        os.makedirs(output_dir, exist_ok=True)
-        os.makedirs(temp_dir, exist_ok=True)
-
 
-
-        # Create a temporary video file from the input frames
-        output_name = ''.join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(5))
-        temp_video_path = os.path.join(output_dir, f"temp_{output_name}.mp4")
-        output_video_path = os.path.join(output_dir, f"latentsync_{output_name}_out.mp4")
-
-        # Save frames as temporary video
-        import torchvision.io as io
         if isinstance(images, list):
             frames = torch.stack(images)
         else:
             frames = images
         print(f"Initial frame count: {frames.shape[0]}")
-
-        frames = (frames * 255).byte()
+        # Compact (uint8) frames from the VHS loaders are used as they are and returned compact as well
+        compact = frames.dtype == torch.uint8
+
+        # Extended clips are converted and sent as their source frames plus the index map
+        source = get_frame_source(frames)
+        index_map = None
+        if source is not None:
+            frames, index_map = source
+            print(f"Using {frames.shape[0]} source frames through the frame index map")
+
+        if not compact:
+            frames = (frames * 255).byte()
         if len(frames.shape) == 3:
             frames = frames.unsqueeze(0)
-        print(f"Frame count before writing video: {frames.shape[0]}")
+        if frames.shape[-1] == 4:  # If RGBA
+            frames = frames[..., :3]
+        video_frames = frames.cpu().numpy()
 
-        if isinstance(frames, torch.Tensor):
-            frames = frames.cpu()
-        try:
-            io.write_video(temp_video_path, frames, fps=25, video_codec='h264')
-        except TypeError:
-            # Fallback for newer versions
-            import av
-            container = av.open(temp_video_path, mode='w')
-            stream = container.add_stream('h264', rate=25)
-            stream.width = frames.shape[2]
-            stream.height = frames.shape[1]
-            
-            for frame in frames:
-                frame = av.VideoFrame.from_ndarray(frame.numpy(), format='rgb24')
-                packet = stream.encode(frame)
-                container.mux(packet)
-            
-            # Flush stream
-            packet = stream.encode(None)
-            container.mux(packet)
-            container.close()
-        video_path = normalize_path(temp_video_path)
-        torch.cuda.empty_cache()
-
-        if not os.path.exists(ckpt_dir):
-            print("Downloading model checkpoints... This may take a while.")
-            from huggingface_hub import snapshot_download
-            snapshot_download(repo_id="chunyu-li/LatentSync",
-                                    allow_patterns=["latentsync_unet.pt", "whisper/tiny.pt"],
-                                    local_dir=ckpt_dir, local_dir_use_symlinks=False)
-            print("Model checkpoints downloaded successfully!")
-
-        inference_script_path = os.path.join(cur_dir, "scripts", "inference.py")
-        unet_config_path = normalize_path(os.path.join(cur_dir, "configs", "unet", "second_stage.yaml"))
-        scheduler_config_path = normalize_path(os.path.join(cur_dir, "configs"))
-        ckpt_path = normalize_path(os.path.join(ckpt_dir, "latentsync_unet.pt"))
-        whisper_ckpt_path = normalize_path(os.path.join(ckpt_dir, "whisper", "tiny.pt"))
-
-        # resample audio to 16k hz and save to wav
+        # resample audio to 16k hz
         waveform = audio["waveform"]
         sample_rate = audio["sample_rate"]
 
@@ -279,109 +328,33 @@ class LatentSyncNode:
             "waveform": waveform.unsqueeze(0),  # Add batch dim
             "sample_rate": sample_rate
         }
+        audio_samples = waveform.float().mean(dim=0).cpu()  # mono
         torch.cuda.empty_cache()
 
-        audio_path = normalize_path(os.path.join(output_dir, f"latentsync_{output_name}_audio.wav"))
-        torchaudio.save(audio_path, waveform, sample_rate)
-
-        print(f"Using video path: {video_path}")
-        print(f"Video file exists: {os.path.exists(video_path)}")
-        print(f"Video file size: {os.path.getsize(video_path)} bytes")
-
-        assert os.path.exists(video_path), f"video_path not exists: {video_path}"
-        assert os.path.exists(audio_path), f"audio_path not exists: {audio_path}"
-
         try:
-            torch.cuda.empty_cache()
-            # Add the package root to Python path
-            package_root = os.path.dirname(cur_dir)
-            if package_root not in sys.path:
-                sys.path.insert(0, package_root)
-               
-            # Add the current directory to Python path
-            if cur_dir not in sys.path:
-                sys.path.insert(0, cur_dir)
-
-            # Import the inference module
-            inference_module = import_inference_script(inference_script_path)
-           
+            inference_module, config, checkpoint_args = self.prepare_inference()
+
             # Create a Namespace object with the arguments
             args = argparse.Namespace(
-                unet_config_path=unet_config_path,
-                inference_ckpt_path=ckpt_path,
-                video_path=video_path,
-                audio_path=audio_path,
-                video_out_path=output_video_path,
+                video_frames=video_frames,
+                frame_index_map=index_map.numpy() if index_map is not None else None,
+                audio_samples=audio_samples,
+                video_out_path=None,
                 seed=seed,
-                scheduler_config_path=scheduler_config_path,
-                whisper_ckpt_path=whisper_ckpt_path
+                **checkpoint_args
             )
-           
-            # Load the config
-            config = OmegaConf.load(unet_config_path)
-           
-            # Call main with both config and args
-            inference_module.main(config, args)
 
-            # Load the processed video back as frames
-            processed_frames = io.read_video(output_video_path, pts_unit='sec')[0]  # [T, H, W, C]
-            print(f"Frame count after reading video: {processed_frames.shape[0]}")
-            torch.cuda.empty_cache()
-            # Process frames following wav2lip.py pattern
-            out_tensor_list = []
-            for frame in processed_frames:
-                # Convert to numpy and ensure correct format
-                frame = frame.numpy()
-                
-                # Convert frame to float32 and normalize
-                frame = frame.astype(np.float32) / 255.0
-                
-                # Convert back to tensor
-                frame = torch.from_numpy(frame)
-                
-                # Ensure we have 3 channels
-                if len(frame.shape) == 2:  # If grayscale
-                    frame = frame.unsqueeze(2).repeat(1, 1, 3)
-                elif frame.shape[2] == 4:  # If RGBA
-                    frame = frame[:, :, :3]
-                
-                # Change to [C, H, W] format
-                frame = frame.permute(2, 0, 1)
-                
-                out_tensor_list.append(frame)
-
-            processed_frames = io.read_video(output_video_path, pts_unit='sec')[0]  # [T, H, W, C]
-            processed_frames = processed_frames.float() / 255.0
-            print(f"Frame count after normalization: {processed_frames.shape[0]}")
-            torch.cuda.empty_cache()
-            # Fix dimensions for VideoCombine compatibility
-            if len(processed_frames.shape) == 3:  
-                processed_frames = processed_frames.unsqueeze(0)
-            if processed_frames.shape[0] == 1 and len(processed_frames.shape) == 4:
-                processed_frames = processed_frames.squeeze(0)
-            if processed_frames.shape[0] == 3:  # If in CHW format
-                processed_frames = processed_frames.permute(1, 2, 0)  # Convert to HWC
-            if processed_frames.shape[-1] == 4:  # If RGBA
-                processed_frames = processed_frames[..., :3]
+            # Call main with both config and args
+            synced_frames, _ = inference_module.main(config, args)
 
+            processed_frames = torch.from_numpy(synced_frames)  # [T, H, W, C]
+            if not compact:
+                processed_frames = processed_frames.float() / 255.0
             print(f"Final frame count: {processed_frames.shape[0]}")
-
             print(f"Final shape: {processed_frames.shape}")
+            torch.cuda.empty_cache()
 
-            # Clean up
-            if os.path.exists(temp_video_path):
-                os.remove(temp_video_path)
-            if os.path.exists(output_video_path):
-                os.remove(output_video_path)
-            shutil.rmtree(temp_dir, ignore_errors=True)
-                
         except Exception as e:
-            # Clean up on error
-            if os.path.exists(temp_video_path):
-                os.remove(temp_video_path)
-            if os.path.exists(output_video_path):
-                os.remove(output_video_path)
-            shutil.rmtree(temp_dir, ignore_errors=True)
             print(f"Error during inference: {str(e)}")
             import traceback
             traceback.print_exc()
@@ -410,11 +383,13 @@ class VideoLengthAdjuster:
     def adjust(self, images, audio, mode, fps=25.0, silent_padding_sec=0.5):
         waveform = audio["waveform"].squeeze(0)
         sample_rate = int(audio["sample_rate"])
-        original_frames = [images[i] for i in range(images.shape[0])] if isinstance(images, torch.Tensor) else images.copy()
+        if not isinstance(images, torch.Tensor):
+            images = torch.stack(list(images))
+        num_frames = images.shape[0]
 
         if mode == "normal":
             # Bypass video frames exactly
-            video_duration = len(original_frames) / fps
+            video_duration = num_frames / fps
             required_samples = int(video_duration * sample_rate)
             
             # Adjust audio to match video duration
@@ -425,44 +400,26 @@ class VideoLengthAdjuster:
                 adjusted_audio = torch.cat([waveform, silence], dim=1)  # Pad audio
             
             return (
-                torch.stack(original_frames),
+                images,
                 {"waveform": adjusted_audio.unsqueeze(0), "sample_rate": sample_rate}
             )
 
-        elif mode == "pingpong":
-            # Add silent padding then pingpong loop
-            silence_samples = math.ceil(silent_padding_sec * sample_rate)
-            silence = torch.zeros((waveform.shape[0], silence_samples), dtype=waveform.dtype)
-            padded_audio = torch.cat([waveform, silence], dim=1)
-            total_duration = (waveform.shape[1] + silence_samples) / sample_rate
-            target_frames = math.ceil(total_duration * fps)
-
-            reversed_frames = original_frames[::-1][1:-1]  # Remove endpoints
-            frames = original_frames + reversed_frames
-            while len(frames) < target_frames:
-                frames += frames[:target_frames - len(frames)]
-            
-            return (
-                torch.stack(frames[:target_frames]),
-                {"waveform": padded_audio.unsqueeze(0), "sample_rate": sample_rate}
-            )
-
-        elif mode == "loop_to_audio":
-            # Add silent padding then simple loop
-            silence_samples = math.ceil(silent_padding_sec * sample_rate)
-            silence = torch.zeros((waveform.shape[0], silence_samples), dtype=waveform.dtype)
-            padded_audio = torch.cat([waveform, silence], dim=1)
-            total_duration = (waveform.shape[1] + silence_samples) / sample_rate
-            target_frames = math.ceil(total_duration * fps)
-
-            frames = original_frames.copy()
-            while len(frames) < target_frames:
-                frames += original_frames[:target_frames - len(frames)]
-            
-            return (
-                torch.stack(frames[:target_frames]),
-                {"waveform": padded_audio.unsqueeze(0), "sample_rate": sample_rate}
-            )
+        # Add silent padding then pingpong or simple loop
+        silence_samples = math.ceil(silent_padding_sec * sample_rate)
+        silence = torch.zeros((waveform.shape[0], silence_samples), dtype=waveform.dtype)
+        padded_audio = torch.cat([waveform, silence], dim=1)
+        total_duration = (waveform.shape[1] + silence_samples) / sample_rate
+        target_frames = math.ceil(total_duration * fps)
+
+        # One gather instead of a list of per-frame tensors and a stack
+        index_map = frame_index_map(num_frames, target_frames, mode)
+        frames = images.index_select(0, index_map.to(images.device))
+        register_frame_source(frames, images, index_map)
+
+        return (
+            frames,
+            {"waveform": padded_audio.unsqueeze(0), "sample_rate": sample_rate}
+        )
 
 NODE_CLASS_MAPPINGS = {
     "D_LatentSyncNode": LatentSyncNode,
@@ -13,71 +13,77 @@
 # limitations under the License.
 
 import argparse
+import random
 from omegaconf import OmegaConf
 import torch
-from diffusers import AutoencoderKL, DDIMScheduler
-from latentsync.models.unet import UNet3DConditionModel
-from latentsync.pipelines.lipsync_pipeline import LipsyncPipeline
 from diffusers.utils.import_utils import is_xformers_available
-from accelerate.utils import set_seed
-from latentsync.whisper.audio2feature import Audio2Feature
+from latentsync.utils.model_registry import get_registry, load_lipsync_pipeline
+from latentsync.utils.cache import get_cache
+from latentsync.utils.scratch import JobScratch
+from latentsync.utils.job_scheduler import get_gpu_admission
+
+
+def load_pipeline(config, args):
+    # Components are loaded once per process and shared by later calls through the registry
+    return load_lipsync_pipeline(
+        config,
+        inference_ckpt_path=args.inference_ckpt_path,
+        scheduler_config_path=args.scheduler_config_path,
+        whisper_ckpt_path=args.whisper_ckpt_path,
+        dtype=torch.float16,
+        device="cuda",
+    )
 
 
 def main(config, args):
-    scheduler = DDIMScheduler.from_pretrained(args.scheduler_config_path)
-
-    if config.model.cross_attention_dim == 768:
-        whisper_model_path = args.whisper_ckpt_path
-    elif config.model.cross_attention_dim == 384:
-        whisper_model_path = args.whisper_ckpt_path
-    else:
-        raise NotImplementedError("cross_attention_dim must be 768 or 384")
-
-    audio_encoder = Audio2Feature(model_path=whisper_model_path, device="cuda", num_frames=config.data.num_frames)
-
-    vae = AutoencoderKL.from_pretrained("stabilityai/sd-vae-ft-mse", torch_dtype=torch.float16)
-    vae.config.scaling_factor = 0.18215
-    vae.config.shift_factor = 0
-
-    unet, _ = UNet3DConditionModel.from_pretrained(
-        OmegaConf.to_container(config.model),
-        args.inference_ckpt_path,  # load checkpoint
-        device="cpu",
-    )
-
-    unet = unet.to(dtype=torch.float16)
+    # Concurrent jobs share the models but not the scheduler state
+    pipeline = load_pipeline(config, args).fork()
 
     # set xformers
     #if is_xformers_available():
-    #    unet.enable_xformers_memory_efficient_attention()
-
-    pipeline = LipsyncPipeline(
-        vae=vae,
-        audio_processor=None,
-        audio_encoder=audio_encoder,
-        unet=unet,
-        scheduler=scheduler,
-    ).to("cuda")
-
-    if args.seed != -1:
-        set_seed(args.seed)
-    else:
-        torch.seed()
-
-    print(f"Initial seed: {torch.initial_seed()}")
-
-    pipeline(
-        video_path=args.video_path,
-        audio_path=args.audio_path,
-        video_out_path=args.video_out_path,
-        video_mask_path=args.video_out_path.replace(".mp4", "_mask.mp4"),
-        num_frames=config.data.num_frames,
-        num_inference_steps=config.run.inference_steps,
-        guidance_scale=config.run.guidance_scale,
-        weight_dtype=torch.float16,
-        width=config.data.resolution,
-        height=config.data.resolution,
-    )
+    #    pipeline.unet.enable_xformers_memory_efficient_attention()
+
+    # The seed stays local to this job: reseeding the global RNGs would change the random numbers of
+    # every other job running concurrently
+    seed = args.seed if args.seed != -1 else random.randrange(2**63)
+    print(f"Initial seed: {seed}")
+    generator = torch.Generator(device=pipeline._execution_device).manual_seed(seed)
+
+    video_out_path = getattr(args, "video_out_path", None)
+    # Temporary files of this job live in its own scratch directory, removed when the job ends
+    with JobScratch(prefix="latentsync-job-") as scratch:
+        result = pipeline(
+            video_path=getattr(args, "video_path", None),
+            audio_path=getattr(args, "audio_path", None),
+            video_out_path=video_out_path,
+            video_mask_path=video_out_path.replace(".mp4", "_mask.mp4") if video_out_path else None,
+            video_frames=getattr(args, "video_frames", None),
+            frame_index_map=getattr(args, "frame_index_map", None),
+            audio_samples=getattr(args, "audio_samples", None),
+            num_frames=config.data.num_frames,
+            num_inference_steps=config.run.inference_steps,
+            guidance_scale=config.run.guidance_scale,
+            weight_dtype=torch.float16,
+            width=config.data.resolution,
+            height=config.data.resolution,
+            face_cache=get_cache("faces", default_mb=2048),
+            latent_cache=get_cache("latents", default_mb=1024),
+            audio_cache=get_cache("whisper", default_mb=1024, memory_entries=8),
+            denoise_batch_size=getattr(args, "denoise_batch_size", 0),
+            debug_outputs=getattr(args, "debug_outputs", None),
+            streaming=getattr(args, "streaming", False),
+            generator=generator,
+            scratch_dir=scratch.path,
+            gpu_admission=get_gpu_admission(),
+        )
+
+    for component in get_registry().stats():
+        print(f"Model component stats: {component}")
+    print(f"Face cache stats: {get_cache('faces', default_mb=2048).stats()}")
+    print(f"Latent cache stats: {get_cache('latents', default_mb=1024).stats()}")
+    print(f"Whisper feature cache stats: {get_cache('whisper', default_mb=1024).stats()}")
+
+    return result
 
 
 if __name__ == "__main__":
@@ -90,6 +96,11 @@ if __name__ == "__main__":
     parser.add_argument("--seed", type=int, default=1247)
     parser.add_argument("--scheduler_config_path", type=str, default="configs")
     parser.add_argument("--whisper_ckpt_path", type=str, default="checkpoints/whisper/tiny.pt")
+    parser.add_argument(
+        "--debug_outputs", nargs="*", default=None, choices=["masked_video", "affine_faces"], help="extra artifacts to write"
+    )
+    parser.add_argument("--denoise_batch_size", type=int, default=0, help="windows denoised together, 0 = auto")
+    parser.add_argument("--streaming", action="store_true", help="process long videos window by window in bounded memory")
     args = parser.parse_args()
 
     config = OmegaConf.load(args.unet_config_path)
@@ -102,7 +102,7 @@ def main(config):
     syncnet_eval_model = SyncNetEval(device=device)
     syncnet_eval_model.loadParameters("checkpoints/auxiliary/syncnet_v2.model")
 
-    syncnet_detector = SyncNetDetector(device=device, detect_results_dir="detect_results")
+    syncnet_detector = SyncNetDetector(device=device)
 
     if config.model.cross_attention_dim == 768:
         whisper_model_path = "checkpoints/whisper/small.pt"
@@ -478,7 +478,7 @@ def main(config):
 
                 if config.model.add_audio_layer:
                     try:
-                        _, conf = syncnet_eval(syncnet_eval_model, syncnet_detector, validation_video_out_path, "temp")
+                        _, conf = syncnet_eval(syncnet_eval_model, syncnet_detector, validation_video_out_path)
                     except Exception as e:
                         logger.info(e)
                         conf = 0
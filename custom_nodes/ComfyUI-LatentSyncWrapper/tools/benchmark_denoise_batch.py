@@ -0,0 +1,92 @@
+# Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import time
+
+import torch
+from omegaconf import OmegaConf
+
+from latentsync.utils.model_registry import load_lipsync_pipeline
+
+
+def benchmark(config, args, denoise_batch_size):
+    pipeline = load_lipsync_pipeline(
+        config,
+        inference_ckpt_path=args.inference_ckpt_path,
+        scheduler_config_path=args.scheduler_config_path,
+        whisper_ckpt_path=args.whisper_ckpt_path,
+        dtype=torch.float16,
+        device="cuda",
+    )
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    synced_frames, _ = pipeline(
+        video_path=args.video_path,
+        audio_path=args.audio_path,
+        num_frames=config.data.num_frames,
+        num_inference_steps=config.run.inference_steps,
+        guidance_scale=config.run.guidance_scale,
+        weight_dtype=torch.float16,
+        width=config.data.resolution,
+        height=config.data.resolution,
+        generator=torch.Generator(device="cuda").manual_seed(args.seed),
+        denoise_batch_size=denoise_batch_size,
+    )
+    torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    return {
+        "denoise_batch_size": denoise_batch_size,
+        "frames": len(synced_frames),
+        "seconds": round(seconds, 3),
+        "frames_per_second": round(len(synced_frames) / seconds, 2),
+        "peak_cuda_mb": round(torch.cuda.max_memory_allocated() / 1024**2, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure LipsyncPipeline throughput for several denoise batch sizes")
+    parser.add_argument("--unet_config_path", type=str, default="configs/unet/second_stage.yaml")
+    parser.add_argument("--inference_ckpt_path", type=str, required=True)
+    parser.add_argument("--video_path", type=str, required=True)
+    parser.add_argument("--audio_path", type=str, required=True)
+    parser.add_argument("--scheduler_config_path", type=str, default="configs")
+    parser.add_argument("--whisper_ckpt_path", type=str, default="checkpoints/whisper/tiny.pt")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=1247)
+    parser.add_argument("--output", type=str, default="denoise_batch_benchmark.json")
+    args = parser.parse_args()
+
+    config = OmegaConf.load(args.unet_config_path)
+
+    # The first run also loads the models, so it is repeated and excluded from the results
+    benchmark(config, args, args.batch_sizes[0])
+
+    results = []
+    for denoise_batch_size in args.batch_sizes:
+        try:
+            results.append(benchmark(config, args, denoise_batch_size))
+        except torch.cuda.OutOfMemoryError:
+            results.append({"denoise_batch_size": denoise_batch_size, "error": "out of memory"})
+            torch.cuda.empty_cache()
+        print(results[-1])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Copyright (c) 2024 Bytedance Ltd. and/or its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure VHS video loading (time and peak memory) across source resolutions and loader options.
+
+Run from the ComfyUI root, e.g.
+    python custom_nodes/ComfyUI-LatentSyncWrapper/tools/benchmark_video_load.py --resolutions 1920x1080 3840x2160
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def setup_comfyui(cpu=False):
+    """Import the VHS loaders outside of a running ComfyUI server."""
+    import asyncio
+
+    sys.path.insert(0, os.getcwd())
+    from comfy.cli_args import args
+
+    # Loading is CPU work, a GPU is only needed because ComfyUI initializes one by default
+    args.cpu = cpu
+    # Like main.py, before nodes.py puts comfy/ (and its utils.py) first on sys.path
+    import utils.extra_config  # noqa: F401
+    import execution
+    import server
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    execution.PromptQueue(server.PromptServer(loop))
+    sys.path.append(os.path.join(os.getcwd(), "custom_nodes", "ComfyUI-VideoHelperSuite"))
+    from videohelpersuite import load_video_nodes
+
+    return load_video_nodes
+
+
+def make_source(path, resolution, seconds, fps):
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={resolution}:rate={fps}"]
+        + ["-t", str(seconds), "-pix_fmt", "yuv420p", "-c:v", "libx264", path],
+        check=True,
+    )
+
+
+def run_case(case):
+    """Load one video in this (fresh) process and report its load time and peak memory."""
+    load_video_nodes = setup_comfyui(case["cpu"])
+    options = dict(case["options"])
+    kwargs = dict(
+        video=case["video"],
+        force_rate=case["fps"],
+        custom_width=case["width"],
+        custom_height=case["height"],
+        frame_load_cap=0,
+    )
+    if options.pop("loader") == "ffmpeg":
+        kwargs.update(generator=load_video_nodes.ffmpeg_frame_generator, start_time=0)
+    else:
+        kwargs.update(skip_first_frames=0, select_every_nth=1)
+    kwargs.update(options)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    images = load_video_nodes.load_video(**kwargs)[0]
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "resolution": case["resolution"],
+        "options": case["options"],
+        "frames": len(images),
+        "output_shape": list(images.shape),
+        "seconds": round(seconds, 3),
+        "frames_per_second": round(len(images) / seconds, 2),
+        "peak_rss_increase_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare VHS video loader options across source resolutions")
+    parser.add_argument("--resolutions", type=str, nargs="+", default=["640x360", "1280x720", "1920x1080", "3840x2160"])
+    parser.add_argument("--seconds", type=float, default=4)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--loaders", type=str, nargs="+", choices=["cv", "ffmpeg"], default=["cv", "ffmpeg"])
+    parser.add_argument("--resize_modes", type=str, nargs="+", default=["quality", "performance"])
+    parser.add_argument("--compact_frames", action="store_true", help="Load uint8 instead of float32 frames")
+    parser.add_argument(
+        "--decode_workers", type=int, nargs="+", default=[1], help="Parallel decoders of the cv loader (0 = one per core)"
+    )
+    parser.add_argument("--cpu", action="store_true", help="Don't initialize a GPU (for machines without one)")
+    parser.add_argument("--output", type=str, default="video_load_benchmark.json")
+    parser.add_argument("--case", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="video-load-benchmark-") as source_dir:
+        for resolution in args.resolutions:
+            video = os.path.join(source_dir, f"{resolution}.mp4")
+            make_source(video, resolution, args.seconds, args.fps)
+            # resize_mode only applies to the cv loader, the ffmpeg loader scales inside ffmpeg
+            loader_options = [
+                {"loader": "cv", "resize_mode": mode, "decode_workers": workers}
+                for mode in args.resize_modes
+                for workers in args.decode_workers
+                if "cv" in args.loaders
+            ]
+            if "ffmpeg" in args.loaders:
+                loader_options.append({"loader": "ffmpeg"})
+            for options in loader_options:
+                case = dict(
+                    video=video,
+                    resolution=resolution,
+                    fps=args.fps,
+                    width=args.width,
+                    height=args.height,
+                    options=dict(options, compact_frames=args.compact_frames),
+                    cpu=args.cpu,
+                )
+                # Every case runs in its own process so that peak memory is not shared between cases
+                output = subprocess.run(
+                    [sys.executable, __file__, "--case", json.dumps(case)], check=True, capture_output=True, text=True
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+                print(results[-1])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -130,6 +130,9 @@ descriptions = {
          'skip_first_frames': 'A number of frames which are discarded before producing output.',
          'select_every_nth': 'Similar to frame rate. Keeps only the first of every n frames and discard the rest. Has better compatibility with variable frame rate inputs such as gifs. When combined with force_rate, select_every_nth_applies after force_rate so the resulting output has a frame rate equivalent to force_rate/select_every_nth. select_every_nth does not apply to skip_first_frames',
          'format': 'Updates other widgets so that only values supported by the given format can be entered and provides recommended defaults.',
+         'compact_frames': 'Output images as 8 bit (uint8) tensors instead of 32 bit floats, using a quarter of the memory. Only enable this when every connected node accepts compact frames, such as Video Combine and the LatentSync nodes. Ignored when a vae is connected.',
+         'resize_mode': 'How frames are resized when custom_width or custom_height is set. Both crop and resize each 8 bit frame as it is decoded. quality uses lanczos and matches previous versions, performance uses area interpolation which is considerably faster for large downscales.',
+         'decode_workers': 'Number of parallel decoders. Above 1, the video is split into keyframe aligned segments that are decoded by separate ffmpeg processes, loading the exact same frames considerably faster on machines with many cores. 0 uses one per core. Ignored when a meta batch or vae is connected.',
          'choose video to upload': 'An upload button is provided to upload local files to the input folder',
          'videopreview': 'Displays a preview for the selected video input. If advanced previews is enabled, this preview will reflect the frame_load_cap, force_rate, skip_first_frames, and select_every_nth values chosen. If the video has audio, it will also be previewed when moused over. Additional preview options can be accessed with right click.',
          }
@@ -158,6 +161,7 @@ descriptions = {
          'frame_load_cap': 'The maximum number of frames to load. If 0, all frames are loaded.',
          'start_time': 'A timestamp, in seconds from the start of the video, to start loading frames from. ',
          'format': 'Updates other widgets so that only values supported by the given format can be entered and provides recommended defaults.',
+         'compact_frames': 'Output images as 8 bit (uint8) tensors instead of 32 bit floats, using a quarter of the memory. Only enable this when every connected node accepts compact frames, such as Video Combine and the LatentSync nodes. Ignored when a vae is connected.',
          'choose video to upload': 'An upload button is provided to upload local files to the input folder',
          'videopreview': 'Displays a preview for the selected video input. If advanced previews is enabled, this preview will reflect the frame_load_cap, force_rate, skip_first_frames, and select_every_nth values chosen. If the video has audio, it will also be previewed when moused over. Additional preview options can be accessed with right click.',
          }
@@ -186,6 +190,9 @@ descriptions = {
          'skip_first_frames': 'A number of frames which are discarded before producing output.',
          'select_every_nth': 'Similar to frame rate. Keeps only the first of every n frames and discard the rest. Has better compatibility with variable frame rate inputs such as gifs. When combined with force_rate, select_every_nth_applies after force_rate so the resulting output has a frame rate equivalent to force_rate/select_every_nth. select_every_nth does not apply to skip_first_frames',
          'format': 'Updates other widgets so that only values supported by the given format can be entered and provides recommended defaults.',
+         'compact_frames': 'Output images as 8 bit (uint8) tensors instead of 32 bit floats, using a quarter of the memory. Only enable this when every connected node accepts compact frames, such as Video Combine and the LatentSync nodes. Ignored when a vae is connected.',
+         'resize_mode': 'How frames are resized when custom_width or custom_height is set. Both crop and resize each 8 bit frame as it is decoded. quality uses lanczos and matches previous versions, performance uses area interpolation which is considerably faster for large downscales.',
+         'decode_workers': 'Number of parallel decoders. Above 1, the video is split into keyframe aligned segments that are decoded by separate ffmpeg processes, loading the exact same frames considerably faster on machines with many cores. 0 uses one per core. Ignored when a meta batch or vae is connected.',
          'videopreview': 'Displays a preview for the selected video input. Will only be shown if Advanced Previews is enabled. This preview will reflect the frame_load_cap, force_rate, skip_first_frames, and select_every_nth values chosen. If the video has audio, it will also be previewed when moused over. Additional preview options can be accessed with right click.',
          }
         }],
@@ -214,6 +221,7 @@ descriptions = {
          'skip_first_frames': 'A number of frames which are discarded before producing output.',
          'select_every_nth': 'Similar to frame rate. Keeps only the first of every n frames and discard the rest. Has better compatibility with variable frame rate inputs such as gifs. When combined with force_rate, select_every_nth_applies after force_rate so the resulting output has a frame rate equivalent to force_rate/select_every_nth. select_every_nth does not apply to skip_first_frames',
          'format': 'Updates other widgets so that only values supported by the given format can be entered and provides recommended defaults.',
+         'compact_frames': 'Output images as 8 bit (uint8) tensors instead of 32 bit floats, using a quarter of the memory. Only enable this when every connected node accepts compact frames, such as Video Combine and the LatentSync nodes. Ignored when a vae is connected.',
          'videopreview': 'Displays a preview for the selected video input. Will only be shown if Advanced Previews is enabled. This preview will reflect the frame_load_cap, force_rate, skip_first_frames, and select_every_nth values chosen. If the video has audio, it will also be previewed when moused over. Additional preview options can be accessed with right click.',
          }
         }],
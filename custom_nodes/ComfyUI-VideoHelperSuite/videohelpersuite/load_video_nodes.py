@@ -6,17 +6,20 @@ from PIL import Image, ImageOps
 import cv2
 import psutil
 import subprocess
-import re
 import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import folder_paths
-from comfy.utils import common_upscale, ProgressBar
+from comfy.utils import ProgressBar
 import nodes
 from comfy.k_diffusion.utils import FolderOfImages
 from .logger import logger
 from .utils import BIGMAX, DIMMAX, calculate_file_hash, get_sorted_dir_files_from_directory,\
         lazy_get_audio, hash_path, validate_path, strip_path, try_download_video,  \
-        is_url, imageOrLatent, ffmpeg_path, ENCODE_ARGS, floatOrInt
+        is_url, imageOrLatent, ffmpeg_path, ENCODE_ARGS, floatOrInt, images_to_float, \
+        probe_media, probe_frame_index
 
 
 video_extensions = ['webm', 'mp4', 'mkv', 'gif', 'mov']
@@ -73,8 +76,34 @@ def target_size(width, height, custom_width, custom_height, downscale_ratio=8) -
     height = int(height/downscale_ratio + 0.5) * downscale_ratio
     return (width, height)
 
+def cv_frame_selection(base_frame_time, target_frame_time, skip_first_frames, select_every_nth):
+    """Yields (source frame index, selected) for every frame after resampling, without end
+
+    Source frames are resampled to target_frame_time by accumulated time, so a source frame can be
+    dropped or repeated. Of the resampled frames, the first skip_first_frames and all but every
+    select_every_nth are not selected.
+    """
+    index = 0
+    time_offset = target_frame_time
+    total_frame_count = 0
+    total_frames_evaluated = -1
+    while True:
+        if time_offset < target_frame_time:
+            index += 1
+            time_offset += base_frame_time
+        if time_offset < target_frame_time:
+            continue
+        time_offset -= target_frame_time
+        # if not at start_index, skip doing anything with frame
+        total_frame_count += 1
+        if total_frame_count <= skip_first_frames:
+            continue
+        else:
+            total_frames_evaluated += 1
+        yield index, total_frames_evaluated%select_every_nth == 0
+
 def cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames,
-                       select_every_nth, meta_batch=None, unique_id=None):
+                       select_every_nth, meta_batch=None, unique_id=None, compact_frames=False):
     video_cap = cv2.VideoCapture(video)
     if not video_cap.isOpened() or not video_cap.grab():
         raise ValueError(f"{video} could not be loaded with cv.")
@@ -92,9 +121,6 @@ def cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames,
         _, frame = video_cap.retrieve()
         height, width, _ = frame.shape
 
-    # set video_cap to look at start_index frame
-    total_frame_count = 0
-    total_frames_evaluated = -1
     frames_added = 0
     base_frame_time = 1 / fps
     prev_frame = None
@@ -117,26 +143,16 @@ def cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames,
         yieldable_frames = 0
     yield (width, height, fps, duration, total_frames, target_frame_time, yieldable_frames)
     pbar = ProgressBar(yieldable_frames)
-    time_offset=target_frame_time
-    while video_cap.isOpened():
-        if time_offset < target_frame_time:
-            is_returned = video_cap.grab()
-            # if didn't return frame, video has ended
-            if not is_returned:
-                break
-            time_offset += base_frame_time
-        if time_offset < target_frame_time:
-            continue
-        time_offset -= target_frame_time
-        # if not at start_index, skip doing anything with frame
-        total_frame_count += 1
-        if total_frame_count <= skip_first_frames:
-            continue
-        else:
-            total_frames_evaluated += 1
-
+    grabbed = 0
+    for index, selected in cv_frame_selection(base_frame_time, target_frame_time,
+                                              skip_first_frames, select_every_nth):
+        while grabbed < index and video_cap.grab():
+            grabbed += 1
+        # if didn't return frame, video has ended
+        if grabbed < index:
+            break
         # if should not be selected, skip doing anything with frame
-        if total_frames_evaluated%select_every_nth != 0:
+        if not selected:
             continue
 
         # opencv loads images in BGR format (yuck), so need to convert to RGB for ComfyUI use
@@ -146,8 +162,9 @@ def cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames,
         frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         # convert frame to comfyui's expected format
         # TODO: frame contains no exif information. Check if opencv2 has already applied
-        frame = np.array(frame, dtype=np.float32)
-        torch.from_numpy(frame).div_(255)
+        if not compact_frames:
+            frame = np.array(frame, dtype=np.float32)
+            torch.from_numpy(frame).div_(255)
         if prev_frame is not None:
             inp  = yield prev_frame
             if inp is not None:
@@ -166,40 +183,46 @@ def cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames,
     if prev_frame is not None:
         yield prev_frame
 
-def ffmpeg_frame_generator(video, force_rate, frame_load_cap, start_time,
-                           custom_width, custom_height, downscale_ratio=8,
-                           meta_batch=None, unique_id=None):
-    args_dummy = [ffmpeg_path, "-i", video, '-c', 'copy', '-frames:v', '1', "-f", "null", "-"]
-    size_base = None
-    fps_base = None
-    try:
-        dummy_res = subprocess.run(args_dummy, stdout=subprocess.DEVNULL,
-                                 stderr=subprocess.PIPE, check=True)
-    except subprocess.CalledProcessError as e:
-        raise Exception("An error occurred in the ffmpeg subprocess:\n" \
-                + e.stderr.decode(*ENCODE_ARGS))
-    lines = dummy_res.stderr.decode(*ENCODE_ARGS)
-
-    for line in lines.split('\n'):
-        match = re.search("^ *Stream .* Video.*, ([1-9]|\\d{2,})x(\\d+)", line)
-        if match is not None:
-            size_base = [int(match.group(1)), int(match.group(2))]
-            fps_match = re.search(", ([\\d\\.]+) fps", line)
-            if fps_match:
-                fps_base = float(fps_match.group(1))
-            else:
-                fps_base = 1
-            alpha = re.search("(yuva|rgba)", line) is not None
+def read_frame_batches(stream, frame_shape, batch_frames):
+    """Read raw uint8 frames from stream into a preallocated ring of batch_frames frames
+
+    Yields the filled part of the ring each time it is full (and once more at EOF). The
+    yielded array is overwritten by the next read, so it must be consumed before resuming.
+    """
+    ring = np.empty((batch_frames, *frame_shape), dtype=np.uint8)
+    view = memoryview(ring).cast('B')
+    filled = 0
+    while True:
+        bytes_read = stream.readinto(view[filled:])
+        if bytes_read is None:#sleep to wait for more data
+            time.sleep(.1)
+            continue
+        if bytes_read == 0:#EOF
             break
-    else:
-        raise Exception("Failed to parse video/image information. FFMPEG output:\n" + lines)
+        filled += bytes_read
+        if filled == len(view):
+            yield ring
+            filled = 0
+    #A trailing partial frame is discarded
+    if filled >= ring[0].nbytes:
+        yield ring[:filled // ring[0].nbytes]
 
-    durs_match = re.search("Duration: (\\d+:\\d+:\\d+\\.\\d+),", lines)
-    if durs_match:
-        durs = durs_match.group(1).split(':')
-        duration = int(durs[0])*360 + int(durs[1])*60 + float(durs[2])
-    else:
-        duration = 0
+def ffmpeg_frame_generator(video, force_rate, frame_load_cap, start_time,
+                           custom_width, custom_height, downscale_ratio=8,
+                           meta_batch=None, unique_id=None, compact_frames=False,
+                           frame_batches=False):
+    """Yields an info tuple, then the frames
+
+    With frame_batches, the frames are instead yielded as batches of raw uint8 frames in a
+    buffer that is reused for the next batch (see read_frame_batches)
+    """
+    info = probe_media(video)
+    if info['video'] is None:
+        raise Exception(f"No video stream found in {video}")
+    size_base = info['video']['size']
+    fps_base = info['video']['fps'] or 1
+    alpha = info['video']['alpha']
+    duration = info['duration'] or 0
 
     if start_time > 0:
         if start_time > 4:
@@ -239,28 +262,26 @@ def ffmpeg_frame_generator(video, force_rate, frame_load_cap, start_time,
 
     args_all_frames += ["-f", "rawvideo", "-"]
     pbar = ProgressBar(yieldable_frames)
+    frame_shape = (size[1], size[0], 4 if alpha else 3)
+    ring_frames = (1920 * 1080 * 4) // (size[0] * size[1]) or 1
+    prev_frame = None
     try:
         with subprocess.Popen(args_all_frames, stdout=subprocess.PIPE) as proc:
-            #Manually buffer enough bytes for an image
-            bpi = size[0] * size[1] * (4 if alpha else 3)
-            current_bytes = bytearray(bpi)
-            current_offset=0
-            prev_frame = None
-            while True:
-                bytes_read = proc.stdout.read(bpi - current_offset)
-                if bytes_read is None:#sleep to wait for more data
-                    time.sleep(.1)
+            for raw_frames in read_frame_batches(proc.stdout, frame_shape, ring_frames):
+                if frame_batches:
+                    yield raw_frames
+                    pbar.update(len(raw_frames))
                     continue
-                if len(bytes_read) == 0:#EOF
-                    break
-                current_bytes[current_offset:len(bytes_read)] = bytes_read
-                current_offset+=len(bytes_read)
-                if current_offset == bpi:
+                #One allocation and conversion per batch instead of per frame
+                if compact_frames:
+                    frames = raw_frames.copy()
+                else:
+                    frames = np.divide(raw_frames, np.float32(255), dtype=np.float32)
+                for frame in frames:
                     if prev_frame is not None:
                         yield prev_frame
                         pbar.update(1)
-                    prev_frame = np.array(current_bytes, dtype=np.float32).reshape(size[1], size[0], 4 if alpha else 3) / 255.0
-                    current_offset = 0
+                    prev_frame = frame
     except BrokenPipeError as e:
         raise Exception("An error occured in the ffmpeg subprocess:\n" \
                 + proc.stderr.read().decode(*ENCODE_ARGS))
@@ -274,34 +295,186 @@ def ffmpeg_frame_generator(video, force_rate, frame_load_cap, start_time,
 def batched(it, n):
     while batch := tuple(itertools.islice(it, n)):
         yield batch
+def stack_frame_batches(batches, frame_shape, compact_frames, count_hint, max_frames):
+    """Convert batches of raw uint8 frames straight into one preallocated array
+
+    The array is sized by count_hint and only grown if the hint was too small
+    """
+    out = np.empty((max(min(int(count_hint) + 1, max_frames), 1), *frame_shape), dtype=np.uint8 if compact_frames else np.float32)
+    count = 0
+    for batch in batches:
+        if count + len(batch) > max_frames:
+            raise RuntimeError(f"Memory limit hit after loading {count} frames. Stopping execution.")
+        if count + len(batch) > len(out):
+            grown = np.empty((max(count + len(batch), len(out) * 5 // 4), *frame_shape), dtype=out.dtype)
+            grown[:count] = out[:count]
+            out = grown
+        if compact_frames:
+            out[count:count+len(batch)] = batch
+        else:
+            np.divide(batch, np.float32(255), out=out[count:count+len(batch)])
+        count += len(batch)
+    return out[:count]
 def batched_vae_encode(images, vae, frames_per_batch):
     for batch in batched(images, frames_per_batch):
         image_batch = torch.from_numpy(np.array(batch))
         yield from vae.encode(image_batch).numpy()
-def resized_cv_frame_gen(custom_width, custom_height, downscale_ratio, **kwargs):
-    gen = cv_frame_generator(**kwargs)
+def resize_frame(frame, size, resize_mode="quality"):
+    """Center crop an 8 bit HWC frame to the aspect ratio of size (width, height) and resize it
+
+    quality matches common_upscale(..., "lanczos", "center"), which also resamples 8 bit images,
+    performance uses cv2's area interpolation
+    """
+    height, width = frame.shape[:2]
+    old_aspect = width / height
+    new_aspect = size[0] / size[1]
+    x = 0
+    y = 0
+    if old_aspect > new_aspect:
+        x = round((width - width * (new_aspect / old_aspect)) / 2)
+    elif old_aspect < new_aspect:
+        y = round((height - height * (old_aspect / new_aspect)) / 2)
+    frame = frame[y:height-y, x:width-x]
+    if resize_mode == "performance":
+        return cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+    return np.asarray(Image.fromarray(frame).resize(tuple(size), resample=Image.Resampling.LANCZOS))
+def frame_to_float(frame):
+    frame = np.array(frame, dtype=np.float32)
+    torch.from_numpy(frame).div_(255)
+    return frame
+def resized_cv_frame_gen(custom_width, custom_height, downscale_ratio, resize_mode="quality",
+                         compact_frames=False, **kwargs):
+    #Frames are decoded and resized as 8 bit images. Only the (smaller) output is converted to float
+    gen = cv_frame_generator(compact_frames=True, **kwargs)
     info =  next(gen)
     width, height = info[0], info[1]
-    frames_per_batch = (1920 * 1080 * 16) // (width * height) or 1
-    if kwargs.get('meta_batch', None) is not None:
-        frames_per_batch = min(frames_per_batch, kwargs['meta_batch'].frames_per_batch)
     if custom_width != 0 or custom_height != 0 or downscale_ratio is not None:
         new_size = target_size(width, height, custom_width, custom_height, downscale_ratio)
         yield (*info, new_size[0], new_size[1], False)
         if new_size[0] != width or new_size[1] != height:
-            def rescale(frame):
-                s = torch.from_numpy(np.fromiter(frame, np.dtype((np.float32, (height, width, 3)))))
-                s = s.movedim(-1,1)
-                s = common_upscale(s, new_size[0], new_size[1], "lanczos", "center")
-                return s.movedim(1,-1).numpy()
-            yield from itertools.chain.from_iterable(map(rescale, batched(gen, frames_per_batch)))
-            return
+            gen = map(lambda frame: resize_frame(frame, new_size, resize_mode), gen)
     else:
         yield (*info, info[0], info[1], False)
+    if not compact_frames:
+        gen = map(frame_to_float, gen)
     yield from gen
 
+def split_segments(keyframes, first, end, count):
+    """Split the source frames [first, end) into up to count segments that start at keyframes
+
+    Returns (start, end, seek time) per segment, the first starting at the last keyframe before first
+    """
+    start = [keyframe for keyframe in keyframes if keyframe[0] <= first][-1]
+    candidates = [keyframe for keyframe in keyframes if start[0] < keyframe[0] < end]
+    bounds = [start]
+    for i in range(1, count):
+        #The keyframe closest to an even split that is past the previous bound
+        target = start[0] + (end - start[0]) * i / count
+        remaining = [keyframe for keyframe in candidates if keyframe[0] > bounds[-1][0]]
+        if len(remaining) == 0:
+            break
+        bounds.append(min(remaining, key=lambda keyframe: abs(keyframe[0] - target)))
+    ends = [bound[0] for bound in bounds[1:]] + [end]
+    return [(bound[0], segment_end, bound[1]) for bound, segment_end in zip(bounds, ends)]
+
+def decode_segment(video, start, seek_time, sources, out, first_slot, end_slot, frame_shape,
+                   new_size, resize_mode, compact_frames, progress):
+    """Decode source frames from the keyframe start into out[first_slot:end_slot]
+
+    sources holds the source frame index of every output slot. Returns the slot after the last one filled.
+    """
+    args = [ffmpeg_path, "-v", "error", "-an"]
+    if seek_time is not None:
+        args += ["-ss", seek_time]
+    #passthrough, so that every decoded frame is output once like with cv
+    args += ["-i", video, "-map", "0:v:0", "-vsync", "passthrough", "-pix_fmt", "rgb24",
+             "-frames:v", str(sources[end_slot-1] - start + 1), "-f", "rawvideo", "-"]
+    resize = (frame_shape[1], frame_shape[0]) != tuple(new_size)
+    slot = first_slot
+    #stderr is left to the console, a pipe that isn't read while decoding could fill up and stall ffmpeg
+    with subprocess.Popen(args, stdout=subprocess.PIPE) as proc:
+        for index, frames in enumerate(read_frame_batches(proc.stdout, frame_shape, 1), start):
+            frame = frames[0]
+            if slot < end_slot and sources[slot] == index:
+                if resize:
+                    frame = resize_frame(frame, new_size, resize_mode)
+                if compact_frames:
+                    out[slot] = frame
+                else:
+                    np.divide(frame, np.float32(255), out=out[slot])
+                slot += 1
+                #repeated frames when force_rate exceeds the source rate
+                while slot < end_slot and sources[slot] == index:
+                    out[slot] = out[slot-1]
+                    slot += 1
+                progress(slot - first_slot)
+    if proc.returncode != 0:
+        raise Exception(f"ffmpeg failed to decode {video} from frame {start}, see the console for details")
+    return slot
+
+def parallel_cv_frame_gen(video, force_rate, frame_load_cap, skip_first_frames, select_every_nth,
+                          custom_width, custom_height, downscale_ratio, resize_mode="quality",
+                          compact_frames=False, decode_workers=0, **kwargs):
+    """Loads the same frames as resized_cv_frame_gen, decoding the video in parallel
+
+    The timeline is split into keyframe aligned segments, each decoded by its own ffmpeg process
+    while a thread per segment writes the selected frames straight into their slots of the output.
+    Yields the info tuple, then the complete output array
+    """
+    #Same metadata, and so the same frame selection, as the cv loader
+    gen = cv_frame_generator(video, force_rate, frame_load_cap, skip_first_frames, select_every_nth,
+                             compact_frames=True)
+    (width, height, fps, duration, total_frames, target_frame_time, _) = next(gen)
+    gen.close()
+    frame_index = probe_frame_index(video)
+    selection = itertools.takewhile(lambda entry: entry[0] < frame_index['frames'],
+                                    cv_frame_selection(1 / fps, target_frame_time,
+                                                       skip_first_frames, select_every_nth))
+    sources = (index for index, selected in selection if selected)
+    if frame_load_cap > 0:
+        sources = itertools.islice(sources, frame_load_cap)
+    sources = np.fromiter(sources, dtype=np.int64)
+    if custom_width != 0 or custom_height != 0 or downscale_ratio is not None:
+        new_size = target_size(width, height, custom_width, custom_height, downscale_ratio)
+    else:
+        new_size = (width, height)
+    yield (width, height, fps, duration, total_frames, target_frame_time, len(sources),
+           new_size[0], new_size[1], False)
+
+    out = np.empty((len(sources), new_size[1], new_size[0], 3), dtype=np.uint8 if compact_frames else np.float32)
+    if len(sources) == 0:
+        yield out
+        return
+    segments = split_segments(frame_index['keyframes'], sources[0], sources[-1] + 1,
+                              decode_workers or os.cpu_count() or 1)
+    pbar = ProgressBar(len(sources))
+    pbar_lock = threading.Lock()
+    decoded = [0] * len(segments)
+    def progress(segment, count):
+        with pbar_lock:
+            decoded[segment] = count
+            pbar.update_absolute(sum(decoded), len(sources))
+    with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        futures = []
+        for i, (start, end, seek_time) in enumerate(segments):
+            first_slot, end_slot = np.searchsorted(sources, [start, end])
+            if first_slot == end_slot:
+                continue
+            futures.append((end_slot, executor.submit(decode_segment, video, start, seek_time, sources, out,
+                                                      first_slot, end_slot, (height, width, 3), new_size,
+                                                      resize_mode, compact_frames,
+                                                      functools.partial(progress, i))))
+        filled = [(end_slot, future.result()) for end_slot, future in futures]
+    for i, (end_slot, slot) in enumerate(filled):
+        if slot < end_slot:
+            if i < len(filled) - 1:
+                raise Exception(f"Decoding {video} in parallel stopped {end_slot - slot} frames short of a segment end")
+            #As with a single stream, the video simply ends early
+            out = out[:slot]
+    yield out
+
 def load_video(meta_batch=None, unique_id=None, memory_limit_mb=None, vae=None,
-               generator=resized_cv_frame_gen, format='None',  **kwargs):
+               generator=resized_cv_frame_gen, format='None', compact_frames=False, **kwargs):
     if 'force_size' in kwargs:
         kwargs.pop('force_size')
         logger.warn("force_size has been removed. Did you reload the webpage after updating?")
@@ -311,8 +484,26 @@ def load_video(meta_batch=None, unique_id=None, memory_limit_mb=None, vae=None,
         downscale_ratio = getattr(vae, "downscale_ratio", 8)
     else:
         downscale_ratio = format.get('dim', (1,))[0]
+    #Latents are encoded from float images, so compact frames only apply to image output
+    compact_frames = compact_frames and vae is None
+    #Without a vae or meta batch, the ffmpeg reader hands over whole batches of raw frames
+    #which are converted straight into the output
+    frame_batches = generator is ffmpeg_frame_generator and vae is None and meta_batch is None
+    if frame_batches:
+        kwargs['frame_batches'] = True
+    #The parallel decoder needs the whole selection up front, so it can't stream into a meta batch or vae
+    decode_workers = kwargs.pop('decode_workers', 1)
+    parallel_decode = decode_workers != 1 and generator is resized_cv_frame_gen \
+            and vae is None and meta_batch is None
+    if parallel_decode and ffmpeg_path is None:
+        logger.warn("Parallel decoding requires ffmpeg. Decoding with a single stream instead")
+        parallel_decode = False
+    if parallel_decode:
+        generator = parallel_cv_frame_gen
+        kwargs['decode_workers'] = decode_workers
     if meta_batch is None or unique_id not in meta_batch.inputs:
-        gen = generator(meta_batch=meta_batch, unique_id=unique_id, downscale_ratio=downscale_ratio, **kwargs)
+        gen = generator(meta_batch=meta_batch, unique_id=unique_id, downscale_ratio=downscale_ratio,
+                        compact_frames=compact_frames, **kwargs)
         (width, height, fps, duration, total_frames, target_frame_time, yieldable_frames, new_width, new_height, alpha) = next(gen)
 
         if meta_batch is not None:
@@ -348,7 +539,7 @@ def load_video(meta_batch=None, unique_id=None, memory_limit_mb=None, vae=None,
         if meta_batch.frames_per_batch > max_loadable_frames:
             raise RuntimeError(f"Meta Batch set to {meta_batch.frames_per_batch} frames but only {max_loadable_frames} can fit in memory")
         gen = itertools.islice(gen, meta_batch.frames_per_batch)
-    else:
+    elif not frame_batches and not parallel_decode:
         original_gen = gen
         gen = itertools.islice(gen, max_loadable_frames)
     frames_per_batch = (1920 * 1080 * 16) // (width * height) or 1
@@ -357,10 +548,19 @@ def load_video(meta_batch=None, unique_id=None, memory_limit_mb=None, vae=None,
         vw,vh = new_width//downscale_ratio, new_height//downscale_ratio
         channels = getattr(vae, 'latent_channels', 4)
         images = torch.from_numpy(np.fromiter(gen, np.dtype((np.float32, (channels,vh,vw)))))
+    elif frame_batches:
+        images = torch.from_numpy(stack_frame_batches(gen, (new_height, new_width, 4 if alpha else 3),
+                                                      compact_frames, yieldable_frames, max_loadable_frames))
+    elif parallel_decode:
+        #The frame count is exact here, so the limit is checked before anything is decoded
+        if yieldable_frames > max_loadable_frames:
+            raise RuntimeError(f"Memory limit hit: {yieldable_frames} frames were requested but only {max_loadable_frames} can be loaded. Stopping execution.")
+        images = torch.from_numpy(next(gen))
     else:
         #Some minor wizardry to eliminate a copy and reduce max memory by a factor of ~2
-        images = torch.from_numpy(np.fromiter(gen, np.dtype((np.float32, (new_height, new_width, 4 if alpha else 3)))))
-    if meta_batch is None and memory_limit is not None:
+        frame_dtype = np.uint8 if compact_frames else np.float32
+        images = torch.from_numpy(np.fromiter(gen, np.dtype((frame_dtype, (new_height, new_width, 4 if alpha else 3)))))
+    if meta_batch is None and memory_limit is not None and not frame_batches and not parallel_decode:
         try:
             next(original_gen)
             raise RuntimeError(f"Memory limit hit after loading {len(images)} frames. Stopping execution.")
@@ -427,6 +627,9 @@ class LoadVideoUpload:
                     "meta_batch": ("VHS_BatchManager",),
                     "vae": ("VAE",),
                      "format": get_load_formats(),
+                    "compact_frames": ("BOOLEAN", {"default": False}),
+                    "resize_mode": (["quality", "performance"], {"default": "quality"}),
+                    "decode_workers": ("INT", {"default": 1, "min": 0, "max": 64, "step": 1}),
                 },
                 "hidden": {
                     "force_size": "STRING",
@@ -474,6 +677,9 @@ class LoadVideoPath:
                 "meta_batch": ("VHS_BatchManager",),
                 "vae": ("VAE",),
                 "format": get_load_formats(),
+                "compact_frames": ("BOOLEAN", {"default": False}),
+                "resize_mode": (["quality", "performance"], {"default": "quality"}),
+                "decode_workers": ("INT", {"default": 1, "min": 0, "max": 64, "step": 1}),
             },
             "hidden": {
                 "force_size": "STRING",
@@ -525,6 +731,7 @@ class LoadVideoFFmpegUpload:
                     "meta_batch": ("VHS_BatchManager",),
                     "vae": ("VAE",),
                      "format": get_load_formats(),
+                    "compact_frames": ("BOOLEAN", {"default": False}),
                 },
                 "hidden": {
                     "force_size": "STRING",
@@ -545,7 +752,7 @@ class LoadVideoFFmpegUpload:
         kwargs['video'] = folder_paths.get_annotated_filepath(strip_path(kwargs['video']))
         image, _, audio, video_info =  load_video(**kwargs, generator=ffmpeg_frame_generator)
         if image.size(3) == 4:
-            return (image[:,:,:,:3], 1-image[:,:,:,3], audio, video_info)
+            return (image[:,:,:,:3], 1-images_to_float(image[:,:,:,3]), audio, video_info)
         return (image, torch.zeros(image.size(0), 64, 64, device="cpu"), audio, video_info)
 
     @classmethod
@@ -576,6 +783,7 @@ class LoadVideoFFmpegPath:
                 "meta_batch": ("VHS_BatchManager",),
                 "vae": ("VAE",),
                 "format": get_load_formats(),
+                "compact_frames": ("BOOLEAN", {"default": False}),
             },
             "hidden": {
                 "force_size": "STRING",
@@ -600,7 +808,7 @@ class LoadVideoFFmpegPath:
         if isinstance(image, dict):
             return (image, None, audio, video_info)
         if image.size(3) == 4:
-            return (image[:,:,:,:3], 1-image[:,:,:,3], audio, video_info)
+            return (image[:,:,:,:3], 1-images_to_float(image[:,:,:,3]), audio, video_info)
         return (image, torch.zeros(image.size(0), 64, 64, device="cpu"), audio, video_info)
 
     @classmethod
@@ -646,7 +854,7 @@ class LoadImagePath:
         if isinstance(image, dict):
             return (image, None)
         if image.size(3) == 4:
-            return (image[:,:,:,:3], 1-image[:,:,:,3])
+            return (image[:,:,:,:3], 1-images_to_float(image[:,:,:,3]))
         return (image, torch.zeros(image.size(0), 64, 64, device="cpu"))
 
     @classmethod
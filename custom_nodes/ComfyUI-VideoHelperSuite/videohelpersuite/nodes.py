@@ -22,7 +22,7 @@ from .load_images_nodes import LoadImagesFromDirectoryUpload, LoadImagesFromDire
 from .batched_nodes import VAEEncodeBatched, VAEDecodeBatched
 from .utils import ffmpeg_path, get_audio, hash_path, validate_path, requeue_workflow, \
         gifski_path, calculate_file_hash, strip_path, try_download_video, is_url, \
-        imageOrLatent, BIGMAX, merge_filter_args, ENCODE_ARGS, floatOrInt
+        imageOrLatent, BIGMAX, merge_filter_args, ENCODE_ARGS, floatOrInt, is_compact
 from comfy.utils import ProgressBar
 
 if 'VHS_video_formats' not in folder_paths.folder_names_and_paths:
@@ -98,8 +98,13 @@ def tensor_to_int(tensor, bits):
     tensor = tensor.cpu().numpy() * (2**bits-1)
     return np.clip(tensor, 0, (2**bits-1))
 def tensor_to_shorts(tensor):
+    if is_compact(tensor):
+        #257 maps 255 to 65535 exactly
+        return tensor.cpu().numpy().astype(np.uint16) * 257
     return tensor_to_int(tensor, 16).astype(np.uint16)
 def tensor_to_bytes(tensor):
+    if is_compact(tensor):
+        return tensor.cpu().numpy()
     return tensor_to_int(tensor, 8).astype(np.uint8)
 
 def ffmpeg_process(args, video_format, video_metadata, file_path, env):
@@ -419,7 +424,8 @@ class VideoCombine:
                 padfunc = torch.nn.ReplicationPad2d(padding)
                 def pad(image):
                     image = image.permute((2,0,1))#HWC to CHW
-                    padded = padfunc(image.to(dtype=torch.float32))
+                    #Replication only copies values, so compact frames can be cast back losslessly
+                    padded = padfunc(image.to(dtype=torch.float32)).to(dtype=image.dtype)
                     return padded.permute((1,2,0))
                 images = map(pad, images)
                 new_dims = (-first_image.shape[1] % dim_alignment + first_image.shape[1],
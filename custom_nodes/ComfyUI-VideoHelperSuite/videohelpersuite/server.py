@@ -2,12 +2,11 @@ import server
 import folder_paths
 import os
 import subprocess
-import re
 
 import asyncio
 
 from .utils import is_url, get_sorted_dir_files_from_directory, ffmpeg_path, \
-        validate_sequence, is_safe_path, strip_path, try_download_video, ENCODE_ARGS
+        validate_sequence, is_safe_path, strip_path, try_download_video, probe_media
 from comfy.k_diffusion.utils import FolderOfImages
 
 
@@ -42,29 +41,25 @@ async def view_video(request):
                 f.write("file '" + os.path.abspath(path) + "'\n")
                 f.write("duration 0.125\n")
         in_args = ["-safe", "0", "-i", concat_file]
+        #matches the duration of each image in the concat file
+        base_fps = 8
+    elif '%' in file:
+        in_args = ['-framerate', str(frame_rate), "-i", file]
+        base_fps = float(frame_rate)
     else:
         in_args = ["-i", file]
-        if '%' in file:
-            in_args = ['-framerate', str(frame_rate)] + in_args
-    #Do prepass to pull info
-    #breaks skip_first frames if this default is ever actually needed
-    base_fps = 30
-    try:
-        proc = await asyncio.create_subprocess_exec(ffmpeg_path, *in_args, '-t',
-                                   '0','-f', 'null','-', stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
-        _, res_stderr = await proc.communicate()
-
-        match = re.search(': Video: (\\w+) .+, (\\d+) fps,', res_stderr.decode(*ENCODE_ARGS))
-        if match:
-            base_fps = float(match.group(2))
-            if match.group(1) == 'vp9':
+        #breaks skip_first frames if this default is ever actually needed
+        base_fps = 30
+        try:
+            info = await asyncio.get_running_loop().run_in_executor(None, probe_media, file)
+        except Exception as e:
+            print("An error occurred in the ffmpeg prepass:\n" + str(e))
+            return web.Response(status=500)
+        if info['video'] is not None:
+            base_fps = info['video']['fps'] or base_fps
+            if info['video']['codec'] == 'vp9':
                 #force libvpx for transparency
                 in_args = ['-c:v', 'libvpx-vp9'] + in_args
-    except subprocess.CalledProcessError as e:
-        print("An error occurred in the ffmpeg prepass:\n" \
-                + e.stderr.decode(*ENCODE_ARGS))
-        return web.Response(status=500)
     vfilters = []
     target_rate = float(query.get('force_rate', 0)) or base_fps
     modified_rate = target_rate / float(query.get('select_every_nth',1))
@@ -131,53 +126,25 @@ async def view_video(request):
         pass
     return resp
 
-query_cache = {}
 @server.PromptServer.instance.routes.get("/vhs/queryvideo")
 async def query_video(request):
     query = request.rel_url.query
     filepath = await resolve_path(query)
-    #TODO: cache lookup
     if isinstance(filepath, web.Response):
         return filepath
     filepath = filepath[0]
-    if filepath in query_cache and query_cache[filepath][0] == os.stat(filepath).st_mtime:
-        source = query_cache[filepath][1]
-    else:
-        args_dummy = [ffmpeg_path, "-i", filepath, '-c', 'copy', '-frames:v', '1', "-f", "null", "-"]
-        try:
-            dummy_res = subprocess.run(args_dummy, stdout=subprocess.DEVNULL,
-                                     stderr=subprocess.PIPE, check=True)
-        except subprocess.CalledProcessError as e:
-            raise Exception("An error occurred in the ffmpeg subprocess:\n" \
-                    + e.stderr.decode(*ENCODE_ARGS))
-        lines = dummy_res.stderr.decode(*ENCODE_ARGS)
-        source = {}
-
-        for line in lines.split('\n'):
-            match = re.search("^ *Stream .* Video.*, ([1-9]|\\d{2,})x(\\d+)", line)
-            if match is not None:
-                source['size'] = [int(match.group(1)), int(match.group(2))]
-                fps_match = re.search(", ([\\d\\.]+) fps", line)
-                if not fps_match:
-                    return web.Response(status=500)
-                source['fps'] = float(fps_match.group(1))
-                if re.search("(yuva|rgba)", line):
-                    source['alpha'] = True
-                break
-        else:
-            raise Exception("Failed to parse video/image information. FFMPEG output:\n" + lines)
-
-        durs_match = re.search("Duration: (\\d+:\\d+:\\d+\\.\\d+),", lines)
-        if not (durs_match and 'fps' in source):
-            return web.Response(status=500)
-        durs = durs_match.group(1).split(':')
-        duration = int(durs[0])*360 + int(durs[1])*60 + float(durs[2])
-        source['duration'] = duration
-        source['frames'] = int(duration*source['fps'])
-        query_cache[filepath] = (os.stat(filepath).st_mtime, source)
-    loaded = {}
-    if 'duration' not in source:
+    #probe_media caches by file, so repeated queries don't spawn ffprobe
+    info = await asyncio.get_running_loop().run_in_executor(None, probe_media, filepath)
+    if info['video'] is None:
+        raise Exception("Failed to parse video/image information of " + filepath)
+    if info['video']['fps'] is None or info['duration'] is None:
         return web.Response(status=500)
+    source = {'size': info['video']['size'], 'fps': info['video']['fps']}
+    if info['video']['alpha']:
+        source['alpha'] = True
+    source['duration'] = info['duration']
+    source['frames'] = int(info['duration']*source['fps'])
+    loaded = {}
     loaded['duration'] = source['duration']
     loaded['duration'] -= float(query.get('start_time',0))
     loaded['fps'] = float(query.get('force_rate', 0)) or source['fps']
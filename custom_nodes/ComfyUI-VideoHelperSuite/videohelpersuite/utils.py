@@ -7,6 +7,7 @@ import re
 from collections.abc import Mapping
 from typing import Union
 import functools
+import json
 import torch
 from torch import Tensor
 
@@ -54,6 +55,20 @@ class MultiInput(str):
 imageOrLatent = MultiInput("IMAGE", ["IMAGE", "LATENT"])
 floatOrInt = MultiInput("FLOAT", ["FLOAT", "INT"])
 
+def is_compact(images) -> bool:
+    """Compact frames are IMAGE tensors of dtype uint8 (0-255, still [..., H, W, C]) instead of float32 (0-1).
+
+    They take a quarter of the memory and are produced by the loaders when compact_frames is enabled.
+    Nodes that understand them pass them through untouched; everything else should call images_to_float.
+    """
+    return isinstance(images, Tensor) and images.dtype == torch.uint8
+
+def images_to_float(images):
+    """Convert compact frames to the regular float representation; other images are returned unchanged"""
+    if is_compact(images):
+        return images.to(torch.float32).div_(255)
+    return images
+
 if "VHS_FORCE_FFMPEG_PATH" in os.environ:
     ffmpeg_path = os.environ.get("VHS_FORCE_FFMPEG_PATH")
 else:
@@ -85,6 +100,18 @@ else:
             ffmpeg_path = ffmpeg_paths[0]
         else:
             ffmpeg_path = max(ffmpeg_paths, key=ffmpeg_suitability)
+if "VHS_FORCE_FFPROBE_PATH" in os.environ:
+    ffprobe_path = os.environ.get("VHS_FORCE_FFPROBE_PATH")
+else:
+    #Most ffmpeg builds ship ffprobe alongside, imageio_ffmpeg does not
+    ffprobe_path = None
+    if ffmpeg_path is not None:
+        ffmpeg_dir, ffmpeg_name = os.path.split(ffmpeg_path)
+        sibling_path = os.path.join(ffmpeg_dir, ffmpeg_name.replace("ffmpeg", "ffprobe", 1))
+        if sibling_path != ffmpeg_path and os.path.isfile(sibling_path):
+            ffprobe_path = sibling_path
+    if ffprobe_path is None:
+        ffprobe_path = shutil.which("ffprobe")
 gifski_path = os.environ.get("VHS_GIFSKI", None)
 if gifski_path is None:
     gifski_path = os.environ.get("JOV_GIFSKI", None)
@@ -197,6 +224,172 @@ def requeue_workflow(requeue_required=(-1,True)):
     if requeue_guard[1] == requeue_guard[2] and max(requeue_guard[3].values()):
         requeue_workflow_unchecked()
 
+def parse_rate(rate):
+    """Convert an ffprobe rational like '30000/1001' to a float, None if it is unset"""
+    num, _, den = (rate or "").partition("/")
+    try:
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
+
+def parse_ffprobe_info(probe):
+    """Reduce the json output of ffprobe -show_format -show_streams to the stream info used by VHS"""
+    info = {'duration': None, 'video': None, 'audio': None}
+    if 'duration' in probe.get('format', {}):
+        info['duration'] = float(probe['format']['duration'])
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video' and info['video'] is None:
+            if stream.get('disposition', {}).get('attached_pic'):
+                #cover art of audio files
+                continue
+            pix_fmt = stream.get('pix_fmt', '')
+            info['video'] = {'codec': stream.get('codec_name'),
+                             'size': [int(stream['width']), int(stream['height'])],
+                             'fps': parse_rate(stream.get('avg_frame_rate')) \
+                                     or parse_rate(stream.get('r_frame_rate')),
+                             'pix_fmt': pix_fmt,
+                             'alpha': re.search("(yuva|rgba)", pix_fmt) is not None}
+            if info['duration'] is None and 'duration' in stream:
+                info['duration'] = float(stream['duration'])
+        elif stream.get('codec_type') == 'audio' and info['audio'] is None:
+            info['audio'] = {'codec': stream.get('codec_name'),
+                             'sample_rate': int(stream['sample_rate']) if 'sample_rate' in stream else None,
+                             'channels': stream.get('channels')}
+    return info
+
+CHANNEL_LAYOUTS = {'mono': 1, 'stereo': 2, 'downmix': 2, 'binaural': 2, 'quad': 4,
+                   'hexagonal': 6, 'octagonal': 8, 'hexadecagonal': 16}
+def parse_channel_layout(layout):
+    """Channel count of an ffmpeg layout like 'stereo', '5.1(side)' or '6 channels', None if unknown"""
+    layout = layout.strip()
+    match = re.fullmatch("(\\d+) channels( \\(.*\\))?", layout)
+    if match:
+        return int(match.group(1))
+    match = re.fullmatch("(\\d+(\\.\\d+)+)(\\(\\w+\\))?", layout)
+    if match:
+        #e.g. 5.1 is 5 full range channels and 1 lfe, 7.1.4 adds 4 height channels
+        return sum(int(part) for part in match.group(1).split('.'))
+    return CHANNEL_LAYOUTS.get(re.sub("\\(\\w+\\)$", "", layout))
+
+def parse_ffmpeg_info(lines):
+    """Fallback for when ffprobe is unavailable: parse the same info from the stderr of ffmpeg -i"""
+    info = {'duration': None, 'video': None, 'audio': None}
+    durs_match = re.search("Duration: (\\d+):(\\d+):(\\d+\\.\\d+),", lines)
+    if durs_match:
+        info['duration'] = int(durs_match.group(1))*3600 + int(durs_match.group(2))*60 \
+                + float(durs_match.group(3))
+    for line in lines.split('\n'):
+        if not re.search("^ *Stream #0:", line):
+            #Only the input streams, not those of the (null) output
+            if line.startswith("Output #"):
+                break
+            continue
+        match = re.search(": Video: (\\w+).*, ([1-9]|\\d{2,})x(\\d+)", line)
+        if match is not None and info['video'] is None and "(attached pic)" not in line:
+            fps_match = re.search(", ([\\d\\.]+) fps", line)
+            pix_fmt_match = re.search(": Video: [^,]+, (\\w+)", line)
+            info['video'] = {'codec': match.group(1),
+                             'size': [int(match.group(2)), int(match.group(3))],
+                             'fps': float(fps_match.group(1)) if fps_match else None,
+                             'pix_fmt': pix_fmt_match.group(1) if pix_fmt_match else '',
+                             'alpha': re.search("(yuva|rgba)", line) is not None}
+        match = re.search(": Audio: (\\w+).*, (\\d+) Hz, ([^,]+)", line)
+        if match is not None and info['audio'] is None:
+            info['audio'] = {'codec': match.group(1),
+                             'sample_rate': int(match.group(2)),
+                             'channels': parse_channel_layout(match.group(3))}
+    return info
+
+def _probe_media(path):
+    if ffprobe_path is not None:
+        args = [ffprobe_path, "-v", "error", "-of", "json", "-show_format", "-show_streams", path]
+        try:
+            res = subprocess.run(args, capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception("An error occurred in the ffprobe subprocess:\n" \
+                    + e.stderr.decode(*ENCODE_ARGS))
+        return parse_ffprobe_info(json.loads(res.stdout.decode(*ENCODE_ARGS)))
+    args = [ffmpeg_path, "-i", path, '-c', 'copy', '-frames:v', '1', "-f", "null", "-"]
+    try:
+        res = subprocess.run(args, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        raise Exception("An error occurred in the ffmpeg subprocess:\n" \
+                + e.stderr.decode(*ENCODE_ARGS))
+    return parse_ffmpeg_info(res.stderr.decode(*ENCODE_ARGS))
+
+@functools.lru_cache(maxsize=256)
+def _probe_media_cached(path, mtime, size):
+    return _probe_media(path)
+
+def probe_media(path):
+    """Stream info of a video or audio file, cached by (path, mtime, size)
+
+    Returns {'duration', 'video': {'codec', 'size', 'fps', 'pix_fmt', 'alpha'},
+    'audio': {'codec', 'sample_rate', 'channels'}}, where duration, video, audio and the
+    fps, sample_rate and channels fields are None when unknown or absent.
+    The result is shared between callers and must not be modified.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        #urls and image sequence patterns have no single file to key on
+        return _probe_media(path)
+    return _probe_media_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+def _probe_frame_index(path):
+    #Stream copy only demuxes, the packet list gives each frame's timestamp and keyframe flag
+    args = [ffmpeg_path, "-v", "error", "-i", path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    try:
+        res = subprocess.run(args, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise Exception("An error occurred in the ffmpeg subprocess:\n" \
+                + e.stderr.decode(*ENCODE_ARGS))
+    time_base = None
+    packets = []
+    for line in res.stdout.decode(*ENCODE_ARGS).split('\n'):
+        if line.startswith("#tb 0:"):
+            time_base = [int(x) for x in line.split(':')[1].split('/')]
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = [field.strip() for field in line.split(',')]
+        #F= is only printed for packets that aren't plain keyframes
+        flags = 1
+        for field in fields[6:]:
+            if field.startswith("F="):
+                flags = int(field[2:], 16)
+        if flags & 4:
+            #discarded packets (e.g. outside of an edit list) produce no frame
+            continue
+        packets.append((int(fields[2]), flags & 1))
+    packets.sort()
+    keyframes = [(0, None)]
+    if time_base is not None and all(pts != -2**63 for pts, _ in packets):
+        for index, (pts, key) in enumerate(packets):
+            #Rounded to the microseconds ffmpeg parses -ss with, which maps back to pts exactly
+            us = (2 * pts * time_base[0] * 1000000 + time_base[1]) // (2 * time_base[1])
+            if key and index > 0 and us > 0:
+                keyframes.append((index, f"{us // 1000000}.{us % 1000000:06d}"))
+    return {'frames': len(packets), 'keyframes': keyframes}
+
+@functools.lru_cache(maxsize=64)
+def _probe_frame_index_cached(path, mtime, size):
+    return _probe_frame_index(path)
+
+def probe_frame_index(path):
+    """Frame count and keyframes of the first video stream, cached like probe_media
+
+    Returns {'frames', 'keyframes': [(frame index, seek time)]}, with frames indexed in
+    presentation order. Seeking to the seek time with ffmpeg starts decoding exactly at that
+    keyframe. The first entry is always frame 0 with no seek.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return _probe_frame_index(path)
+    return _probe_frame_index_cached(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
 def get_audio(file, start_time=0, duration=0):
     args = [ffmpeg_path, "-i", file]
     if start_time > 0:
@@ -204,22 +397,19 @@ def get_audio(file, start_time=0, duration=0):
     if duration > 0:
         args += ["-t", str(duration)]
     try:
-        #TODO: scan for sample rate and maintain
-        res =  subprocess.run(args + ["-f", "f32le", "-"],
+        #The first audio stream, which is the one probe_media describes
+        res =  subprocess.run(args + ["-map", "0:a:0", "-f", "f32le", "-"],
                               capture_output=True, check=True)
         audio = torch.frombuffer(bytearray(res.stdout), dtype=torch.float32)
-        match = re.search(', (\\d+) Hz, (\\w+), ',res.stderr.decode(*ENCODE_ARGS))
     except subprocess.CalledProcessError as e:
         raise Exception(f"VHS failed to extract audio from {file}:\n" \
                 + e.stderr.decode(*ENCODE_ARGS))
-    if match:
-        ar = int(match.group(1))
-        #NOTE: Just throwing an error for other channel types right now
-        #Will deal with issues if they come
-        ac = {"mono": 1, "stereo": 2}[match.group(2)]
-    else:
-        ar = 44100
-        ac = 2
+    #f32le output keeps the sample rate and channels of the source stream
+    audio_info = probe_media(file)['audio'] or {}
+    ar = audio_info.get('sample_rate') or 44100
+    ac = audio_info.get('channels')
+    if ac is None:
+        raise Exception(f"VHS could not determine the number of audio channels of {file}")
     audio = audio.reshape((-1,ac)).transpose(0,1).unsqueeze(0)
     return {'waveform': audio, 'sample_rate': ar}
 
@@ -0,0 +1,129 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+lipsync_pipeline = pytest.importorskip("latentsync.pipelines.lipsync_pipeline")
+image_processor = pytest.importorskip("latentsync.utils.image_processor")
+cache = pytest.importorskip("latentsync.utils.cache")
+
+BASE_LANDMARKS = np.array([[60 + 40 * np.cos(t), 70 + 50 * np.sin(t)] for t in np.linspace(0, 6.28, 68)])
+
+
+class CountingProcessor(image_processor.ImageProcessor):
+    """Landmarks derived from the image content, so the face moves from frame to frame."""
+
+    detected = 0
+
+    def detect_landmarks_batch(self, images, batch_size=16):
+        self.detected += len(images)
+        return [BASE_LANDMARKS + float(image.float().mean()) / 255.0 * 20 for image in images]
+
+
+def make_pipeline():
+    # Skip __init__, alignment only needs the image processor
+    pipeline = lipsync_pipeline.LipsyncPipeline.__new__(lipsync_pipeline.LipsyncPipeline)
+    pipeline.image_processor = CountingProcessor(64, device="cpu")
+    return pipeline
+
+
+def pingpong_clip(num_source=6, num_frames=20):
+    rng = np.random.default_rng(0)
+    source = rng.integers(0, 255, (num_source, 140, 120, 3)).astype(np.uint8)
+    cycle = np.concatenate([np.arange(num_source), np.arange(num_source - 2, 0, -1)])
+    return source, np.resize(cycle, num_frames)
+
+
+def test_repeated_frames_are_detected_once_and_aligned_as_played():
+    source, frame_index_map = pingpong_clip()
+    pipeline = make_pipeline()
+    faces, frames, boxes, matrices, clip_index, _ = pipeline.affine_transform_video(
+        video_frames=source, frame_index_map=frame_index_map
+    )
+    assert pipeline.image_processor.detected == len(source)
+
+    # Smoothing and warp bias run over the whole clip, exactly as without deduplication
+    reference = CountingProcessor(64, device="cpu")
+    ref_faces, ref_boxes, ref_matrices = reference.affine_transform_batch(source[frame_index_map])
+    assert torch.equal(faces, ref_faces)
+    np.testing.assert_array_equal(np.stack(matrices), np.stack(ref_matrices))
+    assert boxes == ref_boxes
+    np.testing.assert_array_equal(frames[clip_index.numpy()], source[frame_index_map])
+
+
+def test_face_cache_keeps_landmarks_only(tmp_path):
+    source, frame_index_map = pingpong_clip()
+    face_cache = cache.DiskLRUCache(str(tmp_path), max_bytes=1 << 30)
+    first = make_pipeline().affine_transform_video(
+        video_frames=source, frame_index_map=frame_index_map, face_cache=face_cache
+    )
+    pipeline = make_pipeline()
+    second = pipeline.affine_transform_video(video_frames=source, frame_index_map=frame_index_map, face_cache=face_cache)
+    assert pipeline.image_processor.detected == 0
+    assert torch.equal(first[0], second[0])
+
+    # A different order of the same frames reuses the detection but not the alignment
+    shuffled = make_pipeline().affine_transform_video(
+        video_frames=source, frame_index_map=frame_index_map[::-1].copy(), face_cache=face_cache
+    )
+    reference = CountingProcessor(64, device="cpu").affine_transform_batch(source[frame_index_map[::-1]])
+    assert torch.equal(shuffled[0], reference[0])
+
+
+def test_latent_cache_is_shared_across_clip_lengths(tmp_path):
+    diffusers = pytest.importorskip("diffusers")
+    torch.manual_seed(0)
+    vae = diffusers.AutoencoderKL(
+        block_out_channels=[8, 8],
+        down_block_types=["DownEncoderBlock2D"] * 2,
+        up_block_types=["UpDecoderBlock2D"] * 2,
+        norm_num_groups=4,
+        latent_channels=4,
+    )
+    latent_cache = cache.DiskLRUCache(str(tmp_path), max_bytes=1 << 30)
+    source, _ = pingpong_clip()
+    encoded = []
+
+    def run(num_frames):
+        # The same source extended to two audio lengths, as VideoLengthAdjuster does
+        _, frame_index_map = pingpong_clip(num_frames=num_frames)
+        pipeline = make_pipeline()
+        pipeline.vae = vae
+        pipeline.latent_space = True
+        encode_moments = pipeline.encode_moments
+
+        def counting_encode_moments(images, device, dtype):
+            encoded.append(len(images))
+            return encode_moments(images, device, dtype)
+
+        pipeline.encode_moments = counting_encode_moments
+        faces, _, _, _, clip_index, frame_hashes = pipeline.affine_transform_video(
+            video_frames=source, frame_index_map=frame_index_map
+        )
+        with torch.no_grad():
+            return faces, pipeline.prepare_face_latents(
+                faces, "cpu", torch.float32, latent_cache, frame_hashes=[frame_hashes[i] for i in clip_index.tolist()]
+            )
+
+    short_faces, short = run(20)
+    assert sum(encoded) == 2 * len(short_faces)
+    encoded.clear()
+    long_faces, long = run(30)
+    # Smoothing is causal, so the first 20 faces are those of the shorter clip and come from the cache
+    assert torch.equal(long_faces[:20], short_faces)
+    assert latent_cache.stats()["hits"] == 20
+    assert sum(encoded) == 2 * 10
+    for name in ("image_moments", "masked_image_moments"):
+        assert torch.equal(long[name][:20], short[name])
+
+    # Cached moments equal a fresh encode
+    with torch.no_grad():
+        pipeline = make_pipeline()
+        pipeline.vae = vae
+        pipeline.latent_space = True
+        fresh = pipeline.prepare_face_latents(long_faces, "cpu", torch.float32)
+    for name in ("image_moments", "masked_image_moments"):
+        torch.testing.assert_close(long[name], fresh[name])
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+audio2feature = pytest.importorskip("latentsync.whisper.audio2feature")
+
+
+def make_encoder(embedding_dim=384, num_frames=16):
+    # Skip __init__ so no whisper checkpoint is needed
+    encoder = audio2feature.Audio2Feature.__new__(audio2feature.Audio2Feature)
+    encoder.embedding_dim = embedding_dim
+    encoder.num_frames = num_frames
+    return encoder
+
+
+def reference_feature2chunks(encoder, feature_array, fps, audio_feat_length=[2, 2]):
+    whisper_chunks = []
+    whisper_idx_multiplier = 50.0 / fps
+    i = 0
+    while True:
+        start_idx = int(i * whisper_idx_multiplier)
+        selected_feature, _ = encoder.get_sliced_feature(
+            feature_array=feature_array, vid_idx=i, audio_feat_length=audio_feat_length, fps=fps
+        )
+        whisper_chunks.append(selected_feature)
+        i += 1
+        if start_idx > len(feature_array):
+            break
+    return whisper_chunks
+
+
+@pytest.mark.parametrize("length", [1, 7, 50, 163, 1500])
+@pytest.mark.parametrize("fps", [25, 30, 29.97, 24])
+def test_feature2chunks_matches_reference(length, fps):
+    encoder = make_encoder()
+    feature_array = torch.randn(length, 5, 384, generator=torch.Generator().manual_seed(length))
+
+    expected = reference_feature2chunks(encoder, feature_array, fps)
+    chunks = encoder.feature2chunks(feature_array=feature_array, fps=fps)
+
+    assert chunks.shape == (len(expected), 50, 384)
+    assert torch.equal(chunks, torch.stack(expected))
+
+
+def test_crop_overlap_audio_window_matches_reference():
+    encoder = make_encoder(embedding_dim=8)
+    feature_array = torch.randn(120, 5, 8)
+
+    for start_index in [0, 3, 40, 60]:
+        expected = torch.stack(
+            [
+                encoder.get_sliced_feature(feature_array=feature_array, vid_idx=i, audio_feat_length=[2, 2], fps=25)[0]
+                for i in range(start_index, start_index + encoder.num_frames)
+            ]
+        )
+        assert torch.equal(encoder.crop_overlap_audio_window(feature_array, start_index), expected)
@@ -0,0 +1,125 @@
+import asyncio
+import base64
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+job_scheduler = pytest.importorskip("latentsync.utils.job_scheduler")
+worker = pytest.importorskip("LatentSync_basic")
+
+
+class FakeServerless:
+    """Stands in for runpod.serverless and keeps the handler config it is started with."""
+
+    def __init__(self):
+        self.config = None
+
+    def start(self, config):
+        self.config = config
+
+
+@pytest.fixture
+def serverless(monkeypatch):
+    serverless = FakeServerless()
+    monkeypatch.setitem(sys.modules, "runpod", types.SimpleNamespace(serverless=serverless))
+    return serverless
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    # ComfyUI and the models are not set up in unit tests, the worker counts as bootstrapped
+    monkeypatch.setattr(worker, "_worker_ready", True)
+    monkeypatch.setattr(worker, "_scheduler", None)
+    admission = job_scheduler.GpuAdmission(budget_bytes=100)
+    monkeypatch.setattr(job_scheduler, "_gpu_admission", admission)
+    yield admission
+    if worker._scheduler is not None:
+        worker._scheduler.shutdown()
+
+
+def fake_process(admission, gpu_seconds, release=None):
+    def process(video_data, audio_data, video_name, custom_width_, custom_height_):
+        if release is not None:
+            assert release.wait(5)
+        # Both jobs' GPU phases don't fit in the budget together
+        with admission.admit(80):
+            time.sleep(gpu_seconds)
+        return {"output": {"video_data": base64.b64encode(video_data).decode("utf-8"), "video_name": video_name}}
+
+    return process
+
+
+def event(i):
+    return {
+        "input": {
+            "video": base64.b64encode(b"video %d" % i).decode("utf-8"),
+            "audio": base64.b64encode(b"audio").decode("utf-8"),
+            "video_name": f"clip{i}.mp4",
+            "custom_width_": 0,
+            "custom_height_": 0,
+        }
+    }
+
+
+def start(serverless):
+    worker.start_worker()
+    assert serverless.config is not None
+    return serverless.config
+
+
+async def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_requests_beyond_max_jobs_wait_in_the_queue(serverless, admission, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(worker, "MAX_CONCURRENT_JOBS", 1)
+    monkeypatch.setattr(worker, "process_latentsync", fake_process(admission, 0.01, release))
+    config = start(serverless)
+    assert config["concurrency_modifier"](0) == 1
+
+    async def run():
+        jobs = [asyncio.ensure_future(config["handler"](event(i))) for i in range(2)]
+        await wait_for(lambda: worker._scheduler is not None and worker._scheduler.stats()["queue_depth"] == 1)
+        release.set()
+        return await asyncio.gather(*jobs)
+
+    results = asyncio.run(run())
+    assert [result["output"]["video_name"] for result in results] == ["clip0.mp4", "clip1.mp4"]
+    assert base64.b64decode(results[1]["output"]["video_data"]) == b"video 1"
+    stats = worker.get_scheduler().stats()
+    assert stats["queue_depth"] == 0 and stats["running"] == 0
+    assert stats["completed"] == 2 and stats["failed"] == 0
+    assert stats["max_queue_wait_seconds"] > 0
+    assert stats["throughput_jobs_per_minute"] > 0
+    assert all("scheduler" in result["metrics"] for result in results)
+
+
+def test_concurrent_requests_share_the_gpu_through_admission(serverless, admission, monkeypatch):
+    monkeypatch.setattr(worker, "MAX_CONCURRENT_JOBS", 2)
+    monkeypatch.setattr(worker, "process_latentsync", fake_process(admission, 0.2))
+    config = start(serverless)
+    assert config["concurrency_modifier"](0) == 2
+
+    async def run():
+        return await asyncio.gather(*(config["handler"](event(i)) for i in range(2)))
+
+    results = asyncio.run(run())
+    assert all("error" not in result for result in results)
+    stats = worker.get_scheduler().stats()
+    assert stats["completed"] == 2
+    # Both jobs ran at once, but their GPU phases one after the other
+    assert stats["max_queue_wait_seconds"] < 0.1
+    assert stats["gpu"]["admitted"] == 2
+    assert stats["gpu"]["max_in_flight"] == 1
+    assert stats["gpu"]["max_wait_seconds"] > 0.1
+    assert results[-1]["metrics"]["scheduler"]["gpu"]["admitted"] >= 1
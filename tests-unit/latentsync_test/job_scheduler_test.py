@@ -0,0 +1,151 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+job_scheduler = pytest.importorskip("latentsync.utils.job_scheduler")
+
+
+def hold(admission, estimate_bytes, entered, release, log, name):
+    with admission.admit(estimate_bytes):
+        log.append(name)
+        entered.set()
+        release.wait(5)
+
+
+def test_phases_that_fit_run_together():
+    admission = job_scheduler.GpuAdmission(budget_bytes=100)
+    release = threading.Event()
+    log = []
+    entered = [threading.Event(), threading.Event()]
+    threads = [
+        threading.Thread(target=hold, args=(admission, 40, entered[i], release, log, i)) for i in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    assert all(event.wait(5) for event in entered)
+    assert admission.stats()["in_flight"] == 2
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert admission.stats()["max_in_flight"] == 2
+    assert admission.stats()["in_flight"] == 0
+
+
+def test_phases_over_budget_or_without_estimate_wait_in_order():
+    admission = job_scheduler.GpuAdmission(budget_bytes=100)
+    releases = [threading.Event() for _ in range(3)]
+    entered = [threading.Event() for _ in range(3)]
+    log = []
+    estimates = [80, 40, None]
+    threads = []
+    for i, estimate in enumerate(estimates):
+        threads.append(threading.Thread(target=hold, args=(admission, estimate, entered[i], releases[i], log, i)))
+        threads[-1].start()
+        if i == 0:
+            assert entered[0].wait(5)
+        else:
+            time.sleep(0.05)
+    assert not entered[1].is_set() and not entered[2].is_set()
+    assert admission.stats()["waiting"] == 2
+
+    releases[0].set()
+    assert entered[1].wait(5)
+    # The phase without an estimate only runs once nothing else does
+    time.sleep(0.05)
+    assert not entered[2].is_set()
+    releases[1].set()
+    assert entered[2].wait(5)
+    releases[2].set()
+    for thread in threads:
+        thread.join()
+    assert log == [0, 1, 2]
+    assert admission.stats()["max_in_flight"] == 1
+
+
+def test_phase_without_estimate_blocks_later_phases():
+    admission = job_scheduler.GpuAdmission(budget_bytes=100)
+    releases = [threading.Event() for _ in range(2)]
+    entered = [threading.Event() for _ in range(2)]
+    log = []
+    threads = [
+        threading.Thread(target=hold, args=(admission, estimate, entered[i], releases[i], log, i))
+        for i, estimate in enumerate([None, 10])
+    ]
+    threads[0].start()
+    assert entered[0].wait(5)
+    threads[1].start()
+    # 10 bytes would fit in the budget, but the phase without an estimate runs alone
+    time.sleep(0.05)
+    assert not entered[1].is_set()
+    assert admission.stats()["waiting"] == 1
+
+    releases[0].set()
+    assert entered[1].wait(5)
+    releases[1].set()
+    for thread in threads:
+        thread.join()
+    assert log == [0, 1]
+    assert admission.stats()["max_in_flight"] == 1
+
+
+def test_budget_is_measured_while_idle():
+    calls = []
+
+    def free_memory(device):
+        calls.append(device)
+        return 1000
+
+    admission = job_scheduler.GpuAdmission(device="cuda:1", headroom=0.5, free_memory=free_memory)
+    with admission.admit(400):
+        # 400 + 100 fits in 0.5 * 1000, 400 + 200 would not
+        assert admission._fits(100)
+        assert not admission._fits(200)
+        with admission.admit(100):
+            pass
+    assert calls == ["cuda:1"]
+
+
+def test_unknown_free_memory_runs_phases_alone():
+    admission = job_scheduler.GpuAdmission(free_memory=lambda device: None)
+    with admission.admit(1):
+        assert not admission._fits(1)
+    assert admission._fits(None)
+
+
+def test_scheduler_limits_concurrency_and_reports_stats():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def process(value):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        if value < 0:
+            raise ValueError("bad job")
+        return value * 2
+
+    admission = job_scheduler.GpuAdmission(budget_bytes=1)
+    scheduler = job_scheduler.JobScheduler(process, max_jobs=2, gpu_admission=admission)
+    futures = [scheduler.submit(i) for i in range(5)]
+    failing = scheduler.submit(-1)
+    assert [future.result() for future in futures] == [0, 2, 4, 6, 8]
+    with pytest.raises(ValueError):
+        failing.result()
+    scheduler.shutdown()
+
+    assert peak[0] == 2
+    stats = scheduler.stats()
+    assert stats["completed"] == 5
+    assert stats["failed"] == 1
+    assert stats["queue_depth"] == 0 and stats["running"] == 0
+    assert stats["max_queue_wait_seconds"] > 0
+    assert stats["throughput_jobs_per_minute"] > 0
+    assert stats["gpu"]["admitted"] == 0
@@ -0,0 +1,177 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+NODE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper")
+sys.path.insert(0, NODE_DIR)
+lipsync_pipeline = pytest.importorskip("latentsync.pipelines.lipsync_pipeline")
+image_processor = pytest.importorskip("latentsync.utils.image_processor")
+diffusers = pytest.importorskip("diffusers")
+omegaconf = pytest.importorskip("omegaconf")
+
+from latentsync.models.unet import UNet3DConditionModel  # noqa: E402
+from latentsync.whisper.audio2feature import Audio2Feature  # noqa: E402
+from latentsync.whisper.whisper.model import ModelDimensions, Whisper  # noqa: E402
+
+BASE_LANDMARKS = np.array([[30 + 20 * np.cos(t), 35 + 25 * np.sin(t)] for t in np.linspace(0, 6.28, 68)])
+
+
+class CpuProcessor(image_processor.ImageProcessor):
+    """Runs on the CPU with landmarks derived from the image content instead of a face detector."""
+
+    def __init__(self, resolution=512, mask="fix_mask", device="cpu", mask_image=None):
+        super().__init__(resolution, mask=mask, device="cpu", mask_image=mask_image)
+
+    def detect_landmarks_batch(self, images, batch_size=16):
+        return [BASE_LANDMARKS + float(image.float().mean()) / 255.0 * 10 for image in images]
+
+
+def randomize(module, generator):
+    with torch.no_grad():
+        for parameter in module.parameters():
+            parameter.copy_(torch.randn(parameter.shape, generator=generator) * 0.05)
+    return module
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    # Tiny randomly initialized models, the outputs only have to be compared with each other
+    generator = torch.Generator().manual_seed(1)
+    config = omegaconf.OmegaConf.to_container(
+        omegaconf.OmegaConf.load(os.path.join(NODE_DIR, "configs", "unet", "second_stage.yaml")).model
+    )
+    config.update(block_out_channels=[32, 32, 32, 32], attention_head_dim=4, norm_num_groups=8, cross_attention_dim=16)
+    unet = randomize(UNet3DConditionModel.from_config(config), generator)
+    vae = diffusers.AutoencoderKL(
+        block_out_channels=[16, 16, 16, 16],
+        down_block_types=["DownEncoderBlock2D"] * 4,
+        up_block_types=["UpDecoderBlock2D"] * 4,
+        norm_num_groups=8,
+        latent_channels=4,
+    )
+    randomize(vae, generator)
+    vae.config.scaling_factor = 0.18215
+    vae.config.shift_factor = 0
+    # Skip __init__ so no whisper checkpoint is needed
+    audio_encoder = Audio2Feature.__new__(Audio2Feature)
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=16, n_audio_head=2, n_audio_layer=4,
+        n_vocab=100, n_text_ctx=8, n_text_state=16, n_text_head=2, n_text_layer=1,
+    )
+    audio_encoder.model = randomize(Whisper(dims), generator)
+    audio_encoder.audio_cache_dir = None
+    audio_encoder.audio_cache = None
+    audio_encoder.model_path = "tiny"
+    audio_encoder.num_frames = 16
+    audio_encoder.embedding_dim = 16
+    scheduler = diffusers.DDIMScheduler.from_pretrained(os.path.join(NODE_DIR, "configs"))
+    return lipsync_pipeline.LipsyncPipeline(
+        vae=vae, audio_processor=None, audio_encoder=audio_encoder, unet=unet, scheduler=scheduler
+    )
+
+
+@pytest.fixture(autouse=True)
+def cpu_image_processor(monkeypatch):
+    monkeypatch.setattr(lipsync_pipeline, "ImageProcessor", CpuProcessor)
+
+
+def clip(num_frames=48):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 255, (num_frames, 72, 64, 3)).astype(np.uint8)
+    audio = torch.from_numpy(rng.normal(0, 0.1, int(num_frames / 25 * 16000) + 8000).astype(np.float32))
+    return frames, audio
+
+
+def run(pipeline, frames, audio, **kwargs):
+    kwargs = {"num_inference_steps": 2, "guidance_scale": 1.0, **kwargs}
+    return pipeline.fork()(
+        video_frames=frames,
+        audio_samples=audio,
+        num_frames=16,
+        width=32,
+        height=32,
+        weight_dtype=torch.float32,
+        generator=torch.Generator().manual_seed(0),
+        **kwargs,
+    )
+
+
+def test_streaming_matches_the_whole_clip_path(pipeline):
+    frames, audio = clip()
+    whole, whole_audio = run(pipeline, frames, audio)
+    streamed, streamed_audio = run(pipeline, frames, audio, streaming=True)
+    assert whole.shape == (48, 72, 64, 3)
+    np.testing.assert_array_equal(streamed, whole)
+    np.testing.assert_array_equal(streamed_audio, whole_audio)
+
+
+def test_audio_shorter_than_one_window_is_an_error(pipeline):
+    frames, audio = clip()
+    # 0.1s of audio yields fewer whisper chunks than one window has frames
+    audio = audio[:1600]
+    unet_calls = []
+    hook = pipeline.unet.register_forward_pre_hook(lambda module, args: unet_calls.append(1))
+    try:
+        for streaming in (False, True):
+            with pytest.raises(ValueError, match="shorter than one 16-frame window"):
+                run(pipeline, frames, audio, streaming=streaming)
+    finally:
+        hook.remove()
+    assert not unet_calls
+
+
+@pytest.mark.parametrize("guidance_scale", [1.0, 2.0])
+def test_batched_denoise_matches_serial(pipeline, guidance_scale):
+    generator = torch.Generator().manual_seed(0)
+
+    def window():
+        # 32x32 faces, 16 frames, whisper chunks of 50 x 16
+        return {
+            "latents": torch.randn((1, 4, 16, 4, 4), generator=generator),
+            "mask_latents": torch.randn((1, 1, 16, 4, 4), generator=generator),
+            "masked_image_latents": torch.randn((1, 4, 16, 4, 4), generator=generator),
+            "image_latents": torch.randn((1, 4, 16, 4, 4), generator=generator),
+            "mel_overlap": torch.randn((16, 50, 16), generator=generator),
+        }
+
+    windows = [window() for _ in range(3)]
+
+    def denoise(batch):
+        forked = pipeline.fork()
+        forked.scheduler.set_timesteps(3)
+        with torch.no_grad():
+            return forked.denoise_windows(
+                batch, forked.scheduler.timesteps, 3, guidance_scale > 1.0, guidance_scale, {}
+            )
+
+    batched = denoise(windows)
+    serial = torch.cat([denoise([window]) for window in windows])
+    assert batched.shape == (3, 4, 16, 4, 4)
+    torch.testing.assert_close(batched, serial, rtol=1e-4, atol=1e-5)
+
+
+def test_denoise_batch_size_does_not_change_the_output(pipeline):
+    frames, audio = clip()
+    serial, _ = run(pipeline, frames, audio, guidance_scale=1.5, denoise_batch_size=1)
+    batched, _ = run(pipeline, frames, audio, guidance_scale=1.5, denoise_batch_size=3)
+    # Batched convolutions may round differently, by at most one level
+    assert np.abs(serial.astype(np.int16) - batched).max() <= 1
+
+
+def test_masked_video_without_a_mask_path_is_an_error(pipeline, tmp_path):
+    frames, audio = clip()
+    with pytest.raises(ValueError, match="video_mask_path"):
+        run(
+            pipeline,
+            frames,
+            audio,
+            video_out_path=str(tmp_path / "out.mp4"),
+            debug_outputs=["masked_video"],
+        )
+    assert not os.path.exists(tmp_path / "out.mp4")
+    # In memory the masked video is returned instead
+    _, _, debug = run(pipeline, frames, audio, debug_outputs=["masked_video"])
+    assert debug["masked_video"].shape == (48, 72, 64, 3)
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+torch = pytest.importorskip("torch")
+model_registry = pytest.importorskip("latentsync.utils.model_registry")
+
+
+class FakeDetector:
+    def __init__(self):
+        self.face_detector = torch.nn.Linear(4, 4)
+
+
+class FakeFaceAlignment:
+    """Holds its networks the way face_alignment.FaceAlignment does."""
+
+    def __init__(self):
+        self.face_detector = FakeDetector()
+        self.face_alignment_net = torch.nn.Linear(8, 8)
+
+
+def test_components_load_once_per_key():
+    registry = model_registry.ModelRegistry()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return FakeFaceAlignment()
+
+    cuda = registry.get("face_alignment", "cuda:0", loader)
+    assert registry.get("face_alignment", "cuda:0", loader) is cuda
+    assert registry.get("face_alignment", "cuda:1", loader) is not cuda
+    assert len(loads) == 2
+    stats = {(s["name"], s["hits"]) for s in registry.stats()}
+    assert stats == {("face_alignment", 1), ("face_alignment", 0)}
+
+
+def test_wrapper_objects_report_the_weights_they_hold():
+    fa = FakeFaceAlignment()
+    expected = sum(p.numel() * p.element_size() for p in fa.face_detector.face_detector.parameters())
+    expected += sum(p.numel() * p.element_size() for p in fa.face_alignment_net.parameters())
+    assert model_registry.module_nbytes(fa) == expected
+    assert model_registry.module_nbytes(object()) == 0
+
+
+def test_evict_drops_dependents_and_reload_uses_the_original_loader():
+    registry = model_registry.ModelRegistry()
+    unet = registry.get("unet", "k", lambda: torch.nn.Linear(2, 2))
+    registry.get("pipeline", "p", lambda: [unet], requires=[("unet", "k")])
+    registry.get("face_alignment", "cuda", FakeFaceAlignment)
+
+    assert sorted(registry.evict("unet")) == ["pipeline", "unet"]
+    assert not registry.contains("pipeline", "p")
+    assert registry.contains("face_alignment", "cuda")
+
+    fa = registry.get("face_alignment", "cuda", FakeFaceAlignment)
+    reloaded = registry.reload("face_alignment", "cuda")
+    assert isinstance(reloaded, FakeFaceAlignment) and reloaded is not fa
+    with pytest.raises(KeyError):
+        registry.reload("unet", "k")
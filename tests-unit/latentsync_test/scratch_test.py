@@ -0,0 +1,61 @@
+import gc
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-LatentSyncWrapper"))
+scratch = pytest.importorskip("latentsync.utils.scratch")
+
+
+@pytest.fixture(autouse=True)
+def isolated_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("LATENTSYNC_SCRATCH_DIR", str(tmp_path))
+    monkeypatch.delenv("LATENTSYNC_SCRATCH_TMPFS", raising=False)
+    return tmp_path
+
+
+def test_jobs_get_distinct_directories(isolated_root):
+    with scratch.JobScratch() as first, scratch.JobScratch() as second:
+        assert first.path != second.path
+        assert os.path.dirname(first.path) == str(isolated_root)
+        assert os.path.isdir(first.path) and os.path.isdir(second.path)
+
+
+def test_cleanup_on_exit_and_exception():
+    with scratch.JobScratch() as job:
+        with open(job.file("audio.wav"), "wb") as f:
+            f.write(b"0")
+        assert os.path.isdir(job.subdir("frames"))
+    assert not os.path.exists(job.path)
+    assert job.closed
+
+    with pytest.raises(RuntimeError):
+        with scratch.JobScratch() as job:
+            raise RuntimeError("job failed")
+    assert not os.path.exists(job.path)
+
+
+def test_cleanup_on_garbage_collection():
+    job = scratch.JobScratch()
+    path = job.path
+    del job
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_cleanup_twice_is_harmless():
+    job = scratch.JobScratch()
+    job.cleanup()
+    job.cleanup()
+    assert job.closed
+
+
+def test_tmpfs_root(monkeypatch, tmp_path):
+    monkeypatch.delenv("LATENTSYNC_SCRATCH_DIR")
+    monkeypatch.setattr(scratch, "TMPFS_ROOT", str(tmp_path))
+    assert scratch.default_scratch_root(tmpfs=True) == str(tmp_path)
+    monkeypatch.setenv("LATENTSYNC_SCRATCH_TMPFS", "1")
+    assert scratch.default_scratch_root() == str(tmp_path)
+    monkeypatch.setattr(scratch, "TMPFS_ROOT", str(tmp_path / "missing"))
+    assert scratch.default_scratch_root() != str(tmp_path / "missing")
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+VHS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "custom_nodes", "ComfyUI-VideoHelperSuite")
+
+
+@pytest.fixture(scope="session")
+def vhs():
+    """The videohelpersuite package, imported with the PromptServer instance it expects at import time."""
+    pytest.importorskip("cv2")
+    import torch
+    # ComfyUI's utils package has to be imported before comfy, which shadows it with comfy/utils.py
+    import utils.json_util  # noqa: F401
+    import comfy.cli_args
+
+    if not torch.cuda.is_available():
+        comfy.cli_args.args.cpu = True
+    server = pytest.importorskip("server")
+    if getattr(server.PromptServer, "instance", None) is None:
+        import execution
+
+        server.PromptServer(asyncio.new_event_loop())
+        execution.PromptQueue(server.PromptServer.instance)
+    sys.path.append(VHS_DIR)
+    from videohelpersuite import load_video_nodes, utils
+
+    if utils.ffmpeg_path is None:
+        pytest.skip("ffmpeg is not available")
+    return load_video_nodes, utils
+
+
+@pytest.fixture
+def ffmpeg(vhs):
+    return vhs[1].ffmpeg_path
@@ -0,0 +1,43 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture(scope="module")
+def clip(vhs, tmp_path_factory):
+    # A keyframe every 7 frames, so the 60 frames split into several segments
+    path = str(tmp_path_factory.mktemp("videos") / "keyframes.mp4")
+    subprocess.run([vhs[1].ffmpeg_path, "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=96x64:rate=24:duration=2.5",
+                    "-c:v", "libx264", "-g", "7", "-pix_fmt", "yuv420p", path], check=True)
+    keyframes = vhs[1].probe_frame_index(path)['keyframes']
+    assert len(keyframes) > 4
+    return path
+
+
+def load(generator, clip, **kwargs):
+    kwargs = {"video": clip, "force_rate": 0, "frame_load_cap": 0, "custom_width": 0, "custom_height": 0,
+              "downscale_ratio": None, "compact_frames": True, **kwargs}
+    gen = generator(**kwargs)
+    info = next(gen)
+    return info, np.stack(list(gen)) if generator.__name__ == "resized_cv_frame_gen" else next(gen)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"skip_first_frames": 4, "select_every_nth": 3},
+        {"skip_first_frames": 9, "select_every_nth": 2, "frame_load_cap": 17},
+        {"skip_first_frames": 3, "select_every_nth": 1, "force_rate": 30},
+        {"skip_first_frames": 5, "select_every_nth": 2, "custom_width": 48, "custom_height": 48},
+        {"skip_first_frames": 2, "select_every_nth": 4, "compact_frames": False},
+    ],
+)
+def test_parallel_decode_matches_the_cv_loader(vhs, clip, options):
+    load_video_nodes = vhs[0]
+    serial_info, serial = load(load_video_nodes.resized_cv_frame_gen, clip, **options)
+    parallel_info, parallel = load(load_video_nodes.parallel_cv_frame_gen, clip, decode_workers=4, **options)
+    assert len(parallel) == parallel_info[6] == len(serial)
+    assert parallel_info[7:] == serial_info[7:]
+    assert parallel.dtype == serial.dtype
+    np.testing.assert_array_equal(parallel, serial)
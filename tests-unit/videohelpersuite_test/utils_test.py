@@ -0,0 +1,34 @@
+import subprocess
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "layout, channels",
+    [("mono", 1), ("stereo", 2), ("5.1", 6), ("5.1(side)", 6), ("7.1.4", 12), ("quad(side)", 4),
+     ("6 channels", 6), ("3 channels (FL+FR+LFE)", 3), ("unknown", None)],
+)
+def test_channel_layouts(vhs, layout, channels):
+    assert vhs[1].parse_channel_layout(layout) == channels
+
+
+def test_ffmpeg_fallback_reads_surround_audio(vhs, ffmpeg, tmp_path, monkeypatch):
+    utils = vhs[1]
+    path = str(tmp_path / "surround.wav")
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "sine=f=440:d=0.5:sample_rate=16000",
+                    "-af", "aformat=channel_layouts=5.1", path], check=True)
+    monkeypatch.setattr(utils, "ffprobe_path", None)
+    utils._probe_media_cached.cache_clear()
+    info = utils.probe_media(path)
+    assert info['audio']['channels'] == 6 and info['audio']['sample_rate'] == 16000
+    audio = utils.get_audio(path)
+    assert audio['waveform'].shape == (1, 6, 8000)
+
+
+def test_unknown_channel_count_is_an_error(vhs, ffmpeg, tmp_path, monkeypatch):
+    utils = vhs[1]
+    path = str(tmp_path / "stereo.wav")
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "sine=d=0.1", "-ac", "2", path], check=True)
+    monkeypatch.setattr(utils, "probe_media", lambda file: {'audio': {'sample_rate': 44100, 'channels': None}})
+    with pytest.raises(Exception, match="number of audio channels"):
+        utils.get_audio(path)